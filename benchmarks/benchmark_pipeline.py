@@ -0,0 +1,309 @@
+# File: benchmarks/benchmark_pipeline.py
+"""Throughput benchmark of the pipeline steps on a synthetic corpus.
+
+`run` draws pages of random words with tests/data/arial.ttf (optionally rotated and
+noisy), then runs PreprocessStep, OCRStep, HyphenationStep, SanitizationStep and the
+whole run_pipeline on them, each in a fresh process. Pages/s, Tesseract calls per page,
+peak RSS and per-page latency percentiles go to a JSON file. `compare` reports the
+changes between two such files and fails on regressions.
+
+    python benchmarks/benchmark_pipeline.py run --pages 20 --rotations 0,90 --output base.json
+    python benchmarks/benchmark_pipeline.py run --pages 20 --rotations 0,90 --output new.json -- --workers 4
+    python benchmarks/benchmark_pipeline.py compare base.json new.json
+
+Arguments after -- are passed to the pipeline as on its command line. The OCR and
+dictionary caches are off unless --cache is given. Per-page latencies and Tesseract
+calls are measured in the process running the stage, so they are only reported for
+work that is not handed to --workers processes.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import resource
+import statistics
+import tempfile
+import subprocess
+import functools
+import multiprocessing
+from collections import defaultdict
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+REPO_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+FONT_PATH = os.path.join(REPO_DIR, 'tests', 'data', 'arial.ttf')
+PAGE_SIZE = (1240, 1754)  # A4 at 150 dpi
+MARGIN = 80
+HYPHENATION_RATE = 0.2  # share of lines whose last word is hyphenated onto the next line
+STAGES = ['PreprocessStep', 'OCRStep', 'HyphenationStep', 'SanitizationStep', 'pipeline']
+PERCENTILES = (50, 90, 99)
+
+SAMPLE_WORDS = {
+    'eng': ("the quick brown fox jumps over lazy dog document archive letter report invoice "
+            "customer payment account number address meeting minutes schedule project result "
+            "summary analysis quality department manager office building street children morning "
+            "between hundred student yesterday important information available community").split(),
+    'deu': ("der die das und ist nicht mit auf für eine Rechnung Kunde Zahlung Konto Nummer "
+            "Anschrift Besprechung Protokoll Termin Projekt Ergebnis Zusammenfassung Abteilung "
+            "Leiter Büro Gebäude Straße Kinder Morgen zwischen hundert Schüler gestern wichtig "
+            "Auskunft verfügbar Gemeinde Größe Übersicht").split(),
+}
+
+def generate_corpus(directory, pages, language, rotations, noise, seed, font_size):
+    """Write pages of random words as page_0001.png, ... into directory."""
+    import numpy as np
+    from PIL import Image, ImageDraw, ImageFont
+    rng = random.Random(seed)
+    noise_rng = np.random.default_rng(seed)
+    font = ImageFont.truetype(FONT_PATH, font_size)
+    words = SAMPLE_WORDS.get(language, SAMPLE_WORDS['eng'])
+    os.makedirs(directory, exist_ok=True)
+    for page in range(pages):
+        image = Image.new('RGB', PAGE_SIZE, 'white')
+        draw = ImageDraw.Draw(image)
+        carry = None
+        y = MARGIN
+        while y < PAGE_SIZE[1] - MARGIN - font_size:
+            line = ([carry] if carry else []) + [rng.choice(words) for _ in range(rng.randint(5, 8))]
+            carry = None
+            last = line[-1]
+            if len(last) > 5 and rng.random() < HYPHENATION_RATE:
+                split = rng.randint(2, len(last) - 3)
+                line[-1], carry = last[:split] + '-', last[split:]
+            draw.text((MARGIN, y), ' '.join(line), fill='black', font=font)
+            y += int(font_size * 1.6)
+        angle = rotations[page % len(rotations)]
+        if angle:
+            image = image.rotate(angle, expand=True, fillcolor='white')
+        if noise > 0:
+            pixels = np.array(image)
+            mask = noise_rng.random(pixels.shape[:2])
+            pixels[mask < noise / 2] = 0
+            pixels[mask > 1 - noise / 2] = 255
+            image = Image.fromarray(pixels)
+        image.save(os.path.join(directory, f"page_{page + 1:04d}.png"))
+
+def percentiles(values):
+    if not values:
+        return None
+    ordered = sorted(values)
+    result = {f"p{p}": 1000 * ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] for p in PERCENTILES}
+    result["mean"] = 1000 * statistics.mean(ordered)
+    return result
+
+def install_probes(latencies, calls):
+    """Wrap the per-page entry points of the steps and the Tesseract engines, in this process."""
+    from step_01_preprocess.operations import PreprocessChain
+    from step_02_ocr.ocr_step import OCRStep
+    from step_02_ocr import engines
+    from step_03_hyphenation.hyphenation_step import HyphenationStep
+    from step_04_sanitize.sanitization_step import SanitizationStep
+
+    # functools.wraps keeps the method names, which bound methods sent to worker processes are pickled by
+    def timed(cls, name, stage):
+        original = getattr(cls, name)
+        @functools.wraps(original)
+        def wrapper(*args, **kwargs):
+            start_time = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                latencies[stage].append(time.perf_counter() - start_time)
+        setattr(cls, name, wrapper)
+
+    def counted(cls):
+        original = cls.image_to_data
+        @functools.wraps(original)
+        def wrapper(*args, **kwargs):
+            calls['tesseract'] += 1
+            return original(*args, **kwargs)
+        cls.image_to_data = wrapper
+
+    timed(PreprocessChain, 'run_task', 'PreprocessStep')
+    timed(OCRStep, 'ocr_page', 'OCRStep')
+    timed(HyphenationStep, 'page_suggestions', 'HyphenationStep')
+    timed(SanitizationStep, 'page_suggestions', 'SanitizationStep')
+    counted(engines.PytesseractEngine)
+    counted(engines.TesserocrEngine)
+
+def pipeline_args(corpus_dir, options):
+    """Complete pipeline args, as pipeline.py would build them from its command line."""
+    import pipeline
+    argv = list(options.pipeline_args)
+    if not options.cache:
+        argv.append('--no-cache')
+    args = pipeline.build_parser().parse_args(argv)
+    args.path_to_tesseract = options.tessdata or pipeline.PATH_TO_TESSERACT
+    args.input_dir = corpus_dir
+    args.language_enchanted = pipeline.LANGUAGE_MAP.get(args.language, 'en_US')
+    return args
+
+def run_stage(stage, corpus_dir, options, connection):
+    """Run one stage in this (fresh) process and send its measurements back."""
+    import logging
+    import pipeline
+    logging.basicConfig(filename=os.path.join(corpus_dir, 'benchmark.log'), level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    args = pipeline_args(corpus_dir, options)
+    latencies, calls = defaultdict(list), defaultdict(int)
+    install_probes(latencies, calls)
+    start_time = time.perf_counter()
+    if stage == 'pipeline':
+        pipeline.INPUT_DIRECTORY = corpus_dir
+        pipeline.run_pipeline(args)
+    else:
+        dict(pipeline.STEPS)[stage](args).run(corpus_dir)
+    elapsed = time.perf_counter() - start_time
+    # ru_maxrss is in KiB on Linux; worker processes count as children
+    peak_rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    connection.send({"seconds": elapsed, "tesseract_calls": calls['tesseract'], "peak_rss_mb": peak_rss / 1024,
+                     "latencies": {name: values for name, values in latencies.items()}})
+
+def measure(stage, corpus_dir, options):
+    context = multiprocessing.get_context('spawn')
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=run_stage, args=(stage, corpus_dir, options, sender), name=f"benchmark-{stage}")
+    process.start()
+    sender.close()
+    try:
+        result = receiver.recv()
+    except EOFError:
+        result = None
+    process.join()
+    if result is None or process.exitcode != 0:
+        raise RuntimeError(f"Benchmark of {stage} failed (exit code {process.exitcode}), see {corpus_dir}/benchmark.log")
+    return result
+
+def summarize(stage, runs, pages):
+    seconds = statistics.median(run["seconds"] for run in runs)
+    latencies = [value for run in runs for name, values in run["latencies"].items() if stage in ('pipeline', name) for value in values]
+    calls = statistics.median(run["tesseract_calls"] for run in runs)
+    return {
+        "pages": pages,
+        "seconds": seconds,
+        "pages_per_second": pages / seconds if seconds > 0 else None,
+        "tesseract_calls_per_page": calls / pages if calls and stage in ('OCRStep', 'pipeline') else None,
+        "peak_rss_mb": max(run["peak_rss_mb"] for run in runs),
+        "latency_ms": percentiles(latencies) if stage != 'pipeline' else None,
+        "stage_latency_ms": {name: percentiles([value for run in runs for value in run["latencies"].get(name, [])])
+                             for name in STAGES[:-1]} if stage == 'pipeline' else None,
+    }
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(options):
+    corpus_dir = options.corpus or os.path.join(options.work_dir, f"corpus-{options.pages}-{options.language}-{options.seed}")
+    rotations = [int(angle) for angle in options.rotations.split(',')]
+    if options.corpus is None:
+        shutil.rmtree(corpus_dir, ignore_errors=True)
+        generate_corpus(corpus_dir, options.pages, options.language, rotations, options.noise, options.seed, options.font_size)
+    pages = len([f for f in os.listdir(corpus_dir) if f.endswith('.png')])
+    if '--language' not in options.pipeline_args:
+        options.pipeline_args = ['--language', options.language] + list(options.pipeline_args)
+
+    report = {
+        "created": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "machine": f"{platform.system()} {platform.machine()}, {os.cpu_count()} cores",
+        "corpus": {"pages": pages, "language": options.language, "rotations": rotations, "noise": options.noise,
+                   "seed": options.seed, "font_size": options.font_size, "directory": corpus_dir},
+        "pipeline_args": options.pipeline_args,
+        "repeat": options.repeat,
+        "stages": {},
+    }
+    for stage in options.stages.split(','):
+        runs = [measure(stage, corpus_dir, options) for _ in range(options.repeat)]
+        report["stages"][stage] = summarize(stage, runs, pages)
+        result = report["stages"][stage]
+        print(f"{stage:17} {result['pages_per_second']:8.2f} pages/s  peak RSS {result['peak_rss_mb']:7.1f} MB"
+              + (f"  {result['tesseract_calls_per_page']:.1f} Tesseract calls/page" if result['tesseract_calls_per_page'] else ''))
+
+    with open(options.output, 'w') as f:
+        json.dump(report, f, indent=4)
+    print(f"Results written to {options.output}")
+
+# Metrics compared between runs and whether a higher value is better
+COMPARED_METRICS = [
+    ("pages_per_second", True),
+    ("tesseract_calls_per_page", False),
+    ("peak_rss_mb", False),
+    ("latency_ms.p50", False),
+    ("latency_ms.p90", False),
+]
+
+def metric(stage_result, name):
+    value = stage_result
+    for key in name.split('.'):
+        value = value.get(key) if isinstance(value, dict) else None
+    return value
+
+def compare(options):
+    with open(options.base) as f:
+        base = json.load(f)
+    with open(options.new) as f:
+        new = json.load(f)
+    if base["corpus"]["pages"] != new["corpus"]["pages"] or base.get("pipeline_args") != new.get("pipeline_args"):
+        print("Warning: the runs used different corpora or pipeline args")
+    regressions = []
+    print(f"{'stage':17} {'metric':25} {'base':>10} {'new':>10} {'change':>8}")
+    for stage, base_result in base["stages"].items():
+        new_result = new["stages"].get(stage)
+        if new_result is None:
+            continue
+        for name, higher_is_better in COMPARED_METRICS:
+            before, after = metric(base_result, name), metric(new_result, name)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            regressed = -change > options.tolerance if higher_is_better else change > options.tolerance
+            print(f"{stage:17} {name:25} {before:10.2f} {after:10.2f} {100 * change:+7.1f}%" + ("  REGRESSION" if regressed else ''))
+            if regressed:
+                regressions.append((stage, name))
+    if regressions:
+        print(f"{len(regressions)} metrics regressed by more than {100 * options.tolerance:.0f}%")
+        return 1
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline steps on a synthetic corpus.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help="Generate a corpus and measure the stages")
+    run_parser.add_argument('--pages', type=int, default=10, help="Number of pages to generate")
+    run_parser.add_argument('--language', default='eng', help="Tesseract language; also picks the sample words (eng, deu)")
+    run_parser.add_argument('--rotations', default='0', help="Comma-separated angles the pages are rotated by, in turn")
+    run_parser.add_argument('--noise', type=float, default=0.0, help="Share of pixels replaced by salt and pepper noise")
+    run_parser.add_argument('--font-size', type=int, default=28)
+    run_parser.add_argument('--seed', type=int, default=0)
+    run_parser.add_argument('--corpus', help="Use the images in this directory instead of generating a corpus")
+    run_parser.add_argument('--work-dir', default=os.path.join(tempfile.gettempdir(), 'docuflow-benchmark'), help="Where generated corpora are kept")
+    run_parser.add_argument('--stages', default=','.join(STAGES), help="Comma-separated stages to run, in order")
+    run_parser.add_argument('--repeat', type=int, default=1, help="Runs per stage; the median time is reported")
+    run_parser.add_argument('--cache', action='store_true', help="Keep the OCR and dictionary caches enabled")
+    run_parser.add_argument('--tessdata', help="Tesseract tessdata directory (default: the one pipeline.py uses)")
+    run_parser.add_argument('--output', default='benchmark.json', help="JSON file for the results")
+    run_parser.add_argument('pipeline_args', nargs=argparse.REMAINDER, help="Pipeline options after --")
+
+    compare_parser = commands.add_parser('compare', help="Compare two result files")
+    compare_parser.add_argument('base')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('--tolerance', type=float, default=0.1, help="Relative change that counts as a regression")
+
+    options = parser.parse_args()
+    if options.command == 'compare':
+        sys.exit(compare(options))
+    if options.pipeline_args[:1] == ['--']:
+        options.pipeline_args = options.pipeline_args[1:]
+    run(options)
+
+if __name__ == '__main__':
+    main()
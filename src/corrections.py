@@ -0,0 +1,71 @@
+# File: corrections.py
+import os
+import re
+
+# An entry of a suggestions file starts with its number and names its page
+SUGGESTION_START = re.compile(r'^Proposed Change (\d+):$', re.MULTILINE)
+SUGGESTION_SOURCE = re.compile(r'^Source File: (.*)$', re.MULTILINE)
+
+def first_proposal(proposed):
+    """Replacement for steps whose proposals are lists of candidates, best first."""
+    return proposed[0]
+
+def resumed_suggestions(path, source_files):
+    """The entries of a suggestions file written by an interrupted run that belong to the
+    pages in source_files, which a resumed run does not look up again, and the highest
+    number among them, so the new entries continue after it."""
+    if not os.path.exists(path):
+        return [], 0
+    with open(path, 'r') as f:
+        text = f.read()
+    starts = [match.start() for match in SUGGESTION_START.finditer(text)]
+    kept = []
+    last = 0
+    for start, end in zip(starts, starts[1:] + [len(text)]):
+        entry = text[start:end]
+        source = SUGGESTION_SOURCE.search(entry)
+        if source is not None and source.group(1) in source_files:
+            kept.append(entry)
+            last = max(last, int(SUGGESTION_START.match(entry).group(1)))
+    return kept, last
+
+def read_whitelist_candidates(path):
+    """The words of a whitelist candidates file, empty if there is none."""
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r') as f:
+        return [line.strip() for line in f if line.strip()]
+
+class CorrectionIndex:
+    """Suggestions (page_index, line_index, original, proposed) indexed for applying them
+    in one pass over the document.
+
+    A word is replaced on the line the suggestion was made for. With apply_globally, a
+    word without a suggestion at its position falls back to the first suggestion made
+    for the same word anywhere in the document. As before, the first suggestion for a
+    position or word wins, and an empty proposal keeps the word.
+    """
+    def __init__(self, suggestions, replacement=None, apply_globally=False):
+        self.apply_globally = apply_globally
+        self.by_position = {}
+        self.by_word = {}
+        for page_index, line_index, original, proposed in suggestions:
+            if proposed:
+                corrected = replacement(proposed) if replacement is not None else proposed
+            else:
+                corrected = original
+            self.by_position.setdefault((page_index, line_index, original), corrected)
+            self.by_word.setdefault(original, corrected)
+
+    def correct(self, page_index, line_index, word):
+        corrected = self.by_position.get((page_index, line_index, word))
+        if corrected is None and self.apply_globally:
+            corrected = self.by_word.get(word)
+        return word if corrected is None else corrected
+
+    def apply(self, page_index, page):
+        """Correct the text_lines of the page in place."""
+        text_lines = page.get("text_lines", [])
+        for line_index, line in enumerate(text_lines):
+            text_lines[line_index] = " ".join(self.correct(page_index, line_index, word) for word in line.split())
+        page["text_lines"] = text_lines
@@ -0,0 +1,168 @@
+# File: dictionary_cache.py
+import os
+import json
+import hashlib
+import logging
+import sqlite3
+from collections import Counter, OrderedDict
+from manifest import fingerprint
+from metrics import get_metrics
+
+CACHE_FILE_NAME = 'dictionary_cache.sqlite3'
+DEFAULT_MEMORY_ENTRIES = 100000  # check and suggest results kept in memory
+WRITE_BATCH_SIZE = 500  # new results written to disk in one transaction
+# Where Enchant's providers read the dictionaries of a language, and the user's personal
+# word list (<tag>.dic) and exclusions (<tag>.exc)
+ENCHANT_DICTIONARY_DIRS = ['/usr/share/hunspell', '/usr/share/myspell', '/usr/share/myspell/dicts']
+ENCHANT_DICTIONARY_SUFFIXES = ('.dic', '.aff', '.exc')
+
+def whitelist_version(whitelist):
+    """Identify the whitelist entries a dictionary is combined with."""
+    return hashlib.sha256('\n'.join(sorted(whitelist)).encode('utf-8')).hexdigest()[:16]
+
+def enchant_dictionary_dirs():
+    config_dir = os.environ.get('ENCHANT_CONFIG_DIR') or os.path.join(os.path.expanduser('~'), '.config', 'enchant')
+    dic_path = [path for path in os.environ.get('DICPATH', '').split(os.pathsep) if path]
+    return [config_dir, os.path.join(config_dir, 'hunspell')] + dic_path + ENCHANT_DICTIONARY_DIRS
+
+def dictionary_version(dictionary, files=()):
+    """Identify what an Enchant dictionary answers from: its provider and the files of its
+    language (system dictionary, personal word list), so updating them invalidates the cache.
+    files are further inputs of the results, e.g. the wordlist of a SymSpell index."""
+    provider = getattr(dictionary, 'provider', None)
+    tag = getattr(dictionary, 'tag', '')
+    parts = [str(getattr(provider, 'name', '')), str(getattr(provider, 'file', ''))]
+    paths = [os.path.join(directory, tag + suffix) for directory in enchant_dictionary_dirs() for suffix in ENCHANT_DICTIONARY_SUFFIXES]
+    for path in paths + [os.path.abspath(path) for path in files]:
+        stamp = fingerprint(path)
+        if stamp is not None:
+            parts.append(f"{path}|{stamp[0]}|{stamp[1]}")
+    return hashlib.sha256('\n'.join(parts).encode('utf-8')).hexdigest()[:16]
+
+class CachedDictionary:
+    """Memoizes check() and suggest() of an Enchant dictionary.
+
+    Results are kept in a bounded LRU in memory and, with a cache_dir, in an sqlite file
+    that survives between runs and is shared by the steps. Entries are keyed by
+    (language, dictionary version, whitelist version, word) and the suggestion backend;
+    the whitelist version is only given for backends whose results depend on the whitelist.
+    When the dictionary version of a language and backend changes, the entries of the
+    earlier version are dropped from the file.
+    """
+    def __init__(self, dictionary, language, whitelist_version='', cache_dir=None, memory_entries=DEFAULT_MEMORY_ENTRIES, backend='enchant',
+                 dictionary_version=''):
+        self.dictionary = dictionary
+        self.language = language
+        self.prefix = f"{language}|{backend}|{dictionary_version}|{whitelist_version}|"
+        self.memory_entries = memory_entries
+        self.memory = OrderedDict()
+        self.pending = {}
+        self.stats = Counter()
+        self.connection = None
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            self.path = os.path.join(cache_dir, CACHE_FILE_NAME)
+            # Used by one step at a time, but not necessarily from the thread that opened it
+            self.connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS dictionary_results (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS dictionary_versions (scope TEXT PRIMARY KEY, version TEXT NOT NULL)')
+            self.connection.commit()
+            self.drop_stale_entries(f"{language}|{backend}|", dictionary_version)
+
+    def drop_stale_entries(self, scope, version):
+        """Delete the results of the language and backend in scope if they came from another dictionary version."""
+        row = self.connection.execute('SELECT version FROM dictionary_versions WHERE scope = ?', (scope,)).fetchone()
+        if row is not None and row[0] == version:
+            return
+        with self.connection:
+            if row is not None:
+                for kind in ('check', 'suggest'):
+                    prefix = f"{kind}|{scope}"
+                    deleted = self.connection.execute('DELETE FROM dictionary_results WHERE substr(key, 1, ?) = ?', (len(prefix), prefix)).rowcount
+                    logging.info(f"Dictionary {scope.rstrip('|')} changed, dropped {deleted} cached {kind} results")
+            self.connection.execute('INSERT OR REPLACE INTO dictionary_versions (scope, version) VALUES (?, ?)', (scope, version))
+
+    def check(self, word):
+        return self.lookup('check', word, self.dictionary.check)
+
+    def suggest(self, word):
+        return self.lookup('suggest', word, self.dictionary.suggest)
+
+    def lookup(self, kind, word, function):
+        key = f"{kind}|{self.prefix}{word}"
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            self.stats[f"{kind}_memory_hits"] += 1
+            return self.memory[key]
+        value = self.load(key)
+        if value is not None:
+            self.stats[f"{kind}_disk_hits"] += 1
+        else:
+            self.stats[f"{kind}_misses"] += 1
+            value = function(word)
+            self.store(key, value)
+        self.remember(key, value)
+        return value
+
+    def is_cached(self, kind, word):
+        key = f"{kind}|{self.prefix}{word}"
+        return key in self.memory or self.load(key) is not None
+
+    def add(self, kind, word, value):
+        """Store a result computed elsewhere, e.g. in a worker process."""
+        key = f"{kind}|{self.prefix}{word}"
+        self.store(key, value)
+        self.remember(key, value)
+
+    def remember(self, key, value):
+        self.memory[key] = value
+        if len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+    def load(self, key):
+        if self.connection is None:
+            return None
+        if key in self.pending:
+            return json.loads(self.pending[key])
+        row = self.connection.execute('SELECT value FROM dictionary_results WHERE key = ?', (key,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def store(self, key, value):
+        if self.connection is None:
+            return
+        self.pending[key] = json.dumps(value, ensure_ascii=False)
+        if len(self.pending) >= WRITE_BATCH_SIZE:
+            self.write_pending()
+
+    def write_pending(self):
+        """Write new results in one short transaction, so steps sharing the file rarely wait."""
+        if self.connection is None or not self.pending:
+            return
+        self.connection.executemany('INSERT OR REPLACE INTO dictionary_results (key, value) VALUES (?, ?)', self.pending.items())
+        self.connection.commit()
+        self.pending.clear()
+
+    def flush(self):
+        """Write pending results, and log and record the hit rates since the last flush."""
+        self.write_pending()
+        metrics = get_metrics()
+        for kind in ('check', 'suggest'):
+            memory_hits, disk_hits, misses = (self.stats[f"{kind}_{name}"] for name in ('memory_hits', 'disk_hits', 'misses'))
+            for outcome, count in (('memory_hit', memory_hits), ('disk_hit', disk_hits), ('miss', misses)):
+                if count:
+                    metrics.count('dictionary_lookups_total', count, language=self.language, kind=kind, outcome=outcome)
+            total = memory_hits + disk_hits + misses
+            if total:
+                logging.info(f"Dictionary cache {self.language} {kind}: {total} lookups, "
+                             f"{100 * (memory_hits + disk_hits) / total:.1f}% hits ({memory_hits} memory, {disk_hits} disk, {misses} misses)")
+        self.stats.clear()
+
+def cache_dir_from_args(args):
+    """The --cache-dir (default <input dir>/cache), or None with --no-cache."""
+    if getattr(args, 'no_cache', False):
+        return None
+    if getattr(args, 'cache_dir', None):
+        return args.cache_dir
+    input_dir = getattr(args, 'input_dir', None)
+    return os.path.join(input_dir, 'cache') if input_dir else None
@@ -0,0 +1,82 @@
+# File: imaging.py
+import cv2
+import numpy as np
+from PIL import Image
+
+# Constants for the projection profile estimates of skew and orientation
+ESTIMATION_MAX_DIMENSION = 800  # pixels, larger images are downscaled before scoring
+MAX_SKEW_ANGLE = 10  # degrees searched on either side of a quadrant
+COARSE_SKEW_STEP = 2  # degrees, first pass over the whole skew range
+SKEW_ANGLE_STEP = 0.5  # degrees, second pass around the best coarse angle
+MIN_INK_PIXELS = 100  # below this the page is treated as empty and no estimate is made
+
+def to_grayscale_array(image):
+    """Return a PIL image or an OpenCV (BGR or gray) array as a 2D uint8 array."""
+    if isinstance(image, Image.Image):
+        return np.asarray(image.convert('L'))
+    if image.ndim == 3:
+        return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return image
+
+def to_pil_image(image):
+    """Return an OpenCV (BGR or gray) array as a PIL image; gray arrays share their buffer."""
+    if isinstance(image, Image.Image):
+        return image
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    return Image.fromarray(image)
+
+def ink_mask(gray):
+    """Binarize so that ink is 255 and background 0, downscaled for cheap scoring."""
+    scale = ESTIMATION_MAX_DIMENSION / max(gray.shape)
+    if scale < 1:
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    return binary
+
+def rotate_array(image, angle, border_value=255):
+    """Rotate a numpy image counterclockwise by angle degrees (PIL convention), expanding the canvas."""
+    height, width = image.shape[:2]
+    center = (width / 2, height / 2)
+    matrix = cv2.getRotationMatrix2D(center, angle, 1.0)
+    cos, sin = abs(matrix[0, 0]), abs(matrix[0, 1])
+    new_width = int(height * sin + width * cos)
+    new_height = int(height * cos + width * sin)
+    matrix[0, 2] += new_width / 2 - center[0]
+    matrix[1, 2] += new_height / 2 - center[1]
+    if image.ndim == 3:
+        border_value = (border_value,) * image.shape[2]
+    return cv2.warpAffine(image, matrix, (new_width, new_height), flags=cv2.INTER_LINEAR,
+                          borderMode=cv2.BORDER_CONSTANT, borderValue=border_value)
+
+def profile_score(binary, angle):
+    """Contrast of the horizontal projection profile after rotating by angle.
+
+    Text lines aligned with the x axis give alternating full and empty rows, so the
+    row sums vary most (relative to their mean) at the correct angle. Only the rows
+    between the first and last ink are scored, so margins do not count.
+    """
+    rotated = rotate_array(binary, angle, border_value=0)
+    profile = rotated.sum(axis=1, dtype=np.float64)
+    inked = np.nonzero(profile)[0]
+    if len(inked) == 0:
+        return 0.0
+    profile = profile[inked[0]:inked[-1] + 1]
+    return float(profile.std() / profile.mean())
+
+def best_skew(binary, base_angle):
+    """Coarse-to-fine search for the skew offset around base_angle; returns (offset, score)."""
+    coarse = np.arange(-MAX_SKEW_ANGLE, MAX_SKEW_ANGLE + COARSE_SKEW_STEP, COARSE_SKEW_STEP)
+    _, center = max((profile_score(binary, base_angle + offset), float(offset)) for offset in coarse)
+    fine = np.arange(center - COARSE_SKEW_STEP, center + COARSE_SKEW_STEP + SKEW_ANGLE_STEP, SKEW_ANGLE_STEP)
+    fine = fine[np.abs(fine) <= MAX_SKEW_ANGLE]
+    score, offset = max((profile_score(binary, base_angle + offset), float(offset)) for offset in fine)
+    return offset, score
+
+def estimate_skew(image):
+    """Estimate the small rotation (degrees, PIL convention) that makes text lines horizontal."""
+    binary = ink_mask(to_grayscale_array(image))
+    if cv2.countNonZero(binary) < MIN_INK_PIXELS:
+        return 0.0
+    offset, _ = best_skew(binary, 0)
+    return offset
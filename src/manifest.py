@@ -0,0 +1,68 @@
+# File: manifest.py
+import os
+import json
+import logging
+
+MANIFEST_DIR = '.manifests'
+
+def fingerprint(path):
+    """Cheap change detection for a file: size and modification time, or None if it does not exist."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+def arg_values(args, names):
+    return {name: getattr(args, name, None) for name in names}
+
+class StepManifest:
+    """Records what a step (or the pages of a step) consumed and produced in its last run.
+
+    Like make, a step is up to date when its inputs, the args it depends on and its
+    outputs are unchanged since the manifest was recorded. Paths are stored relative
+    to the data directory.
+    """
+    def __init__(self, input_data, name):
+        self.input_data = input_data
+        self.path = os.path.join(input_data, MANIFEST_DIR, f"{name}.json")
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.data = {}
+
+    def fingerprints(self, paths):
+        return {os.path.relpath(path, self.input_data): fingerprint(path) for path in paths}
+
+    def snapshot(self, inputs, args, outputs):
+        return {"inputs": self.fingerprints(inputs), "args": args, "outputs": self.fingerprints(outputs)}
+
+    def is_current(self, stored, inputs, args, outputs):
+        current = self.snapshot(inputs, args, outputs)
+        if any(value is None for value in current["outputs"].values()):
+            return False
+        return stored == current
+
+    def is_up_to_date(self, inputs, args, outputs):
+        if not outputs:
+            return False
+        stored = {key: self.data.get(key) for key in ("inputs", "args", "outputs")}
+        return self.is_current(stored, inputs, args, outputs)
+
+    def record(self, inputs, args, outputs):
+        self.data.update(self.snapshot(inputs, args, outputs))
+        self.save()
+
+    def page_is_up_to_date(self, name, inputs, args, outputs):
+        """Page-level variant of is_up_to_date for steps that can skip single pages."""
+        return self.is_current(self.data.get("pages", {}).get(name), inputs, args, outputs)
+
+    def record_page(self, name, inputs, args, outputs):
+        self.data.setdefault("pages", {})[name] = self.snapshot(inputs, args, outputs)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, ensure_ascii=False, indent=4)
+        logging.debug(f"Saved manifest {self.path}")
@@ -0,0 +1,210 @@
+# File: metrics.py
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from collections import Counter, defaultdict
+
+METRICS_DIR_NAME = 'metrics'
+METRIC_PREFIX = 'docuflow_'
+
+# Upper bounds of the histogram buckets in the Prometheus output
+HISTOGRAM_BUCKETS = {
+    'ocr_page_seconds': (0.5, 1, 2, 5, 10, 30, 60),
+    'ocr_page_orientation_probes': (1, 2, 4, 8, 16, 32),
+    'ocr_page_confidence': (30, 50, 70, 80, 90, 95),
+}
+DEFAULT_BUCKETS = (0.01, 0.1, 1, 10, 100)
+
+HELP = {
+    'pipeline_seconds': 'Duration of the pipeline run',
+    'step_seconds': 'Duration of a pipeline step',
+    'pages_total': 'Pages a step produced',
+    'ocr_pages_total': 'OCR pages by where the result came from (ocr, cache, reused)',
+    'ocr_angle_pages_total': 'OCRed pages by the orientation angle that was chosen',
+    'ocr_passes_total': 'Tesseract OCR passes, one per orientation candidate tried',
+    'ocr_page_seconds': 'OCR time of a page',
+    'ocr_page_orientation_probes': 'OCR passes of a page (1 without orientation checks)',
+    'ocr_page_confidence': 'Confidence of the OCR result of a page',
+    'dictionary_lookups_total': 'Dictionary check and suggest lookups by outcome',
+    'suggestions_total': 'Correction suggestions made by a step',
+    'preprocess_page_seconds': 'Preprocessing time of a page',
+    'preprocess_operation_seconds_total': 'Time spent in each preprocessing operation',
+}
+
+# Calls counted in the current process, e.g. to attribute OCR passes to the page being OCRed
+_call_counts = Counter()
+_call_lock = threading.Lock()
+
+def count_call(name):
+    with _call_lock:
+        _call_counts[name] += 1
+
+def call_count(name):
+    with _call_lock:
+        return _call_counts[name]
+
+def label_key(labels):
+    return tuple(sorted(labels.items()))
+
+def format_labels(key):
+    if not key:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in key) + '}'
+
+def percentile(ordered, p):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+class Metrics:
+    """Counters, observations and per-page records of a pipeline run, written as
+    metrics.json and in the Prometheus text format. With tracing, spans (a name, start,
+    duration and attributes, e.g. one per page and step) are kept too and written as a
+    trace that chrome://tracing or Perfetto can open.
+
+    Collected in the main process; work done in worker processes is reported back
+    with the page results and recorded from there.
+    """
+    def __init__(self, tracing=False):
+        self.tracing = tracing
+        self.started = time.time()
+        self.lock = threading.Lock()
+        self.counters = Counter()
+        self.observations = defaultdict(list)
+        self.steps = {}
+        self.pages = []
+        self.spans = []
+
+    def count(self, name, value=1, **labels):
+        with self.lock:
+            self.counters[(name, label_key(labels))] += value
+
+    def observe(self, name, value, **labels):
+        with self.lock:
+            self.observations[(name, label_key(labels))].append(value)
+
+    def record_step(self, name, seconds, **details):
+        with self.lock:
+            self.steps[name] = {"seconds": seconds, **details}
+
+    def record_page(self, **fields):
+        with self.lock:
+            self.pages.append(fields)
+
+    def add_span(self, name, start, seconds, pid=None, thread=None, **attributes):
+        """Record a span measured elsewhere, e.g. in a worker process; start is a time.time()."""
+        if not self.tracing:
+            return
+        with self.lock:
+            self.spans.append({"name": name, "start": start, "seconds": seconds, "pid": pid or os.getpid(),
+                               "thread": thread or threading.current_thread().name, "attributes": attributes})
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """Time the block as a span (only kept with tracing)."""
+        start, start_time = time.time(), time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_span(name, start, time.perf_counter() - start_time, **attributes)
+
+    @contextmanager
+    def step(self, name, **details):
+        """Time a pipeline step; also traced as a span."""
+        start_time = time.perf_counter()
+        with self.span(name, **details):
+            yield
+        self.record_step(name, time.perf_counter() - start_time, **details)
+
+    def summary(self):
+        """Everything collected, as the content of metrics.json."""
+        with self.lock:
+            observations = {}
+            for (name, key), values in sorted(self.observations.items()):
+                ordered = sorted(values)
+                observations.setdefault(name, []).append({
+                    "labels": dict(key), "count": len(ordered), "sum": sum(ordered),
+                    "p50": percentile(ordered, 50), "p90": percentile(ordered, 90), "p99": percentile(ordered, 99),
+                    "max": ordered[-1],
+                })
+            return {
+                "started": time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started)),
+                "seconds": time.time() - self.started,
+                "steps": dict(self.steps),
+                "counters": [{"name": name, "labels": dict(key), "value": value} for (name, key), value in sorted(self.counters.items())],
+                "observations": observations,
+                "pages": list(self.pages),
+            }
+
+    def prometheus_text(self):
+        """The counters and observations in the Prometheus text exposition format."""
+        lines = []
+        with self.lock:
+            counters = sorted(self.counters.items())
+            observations = sorted(self.observations.items())
+            steps = sorted(self.steps.items())
+        for name, help_name, kind, samples in [
+            ('pipeline_seconds', 'pipeline_seconds', 'gauge', [((), time.time() - self.started)]),
+            ('step_seconds', 'step_seconds', 'gauge', [((('step', step),), details["seconds"]) for step, details in steps]),
+        ] + self.grouped(counters):
+            lines.append(f"# HELP {METRIC_PREFIX}{name} {HELP.get(help_name, name)}")
+            lines.append(f"# TYPE {METRIC_PREFIX}{name} {kind}")
+            lines.extend(f"{METRIC_PREFIX}{name}{format_labels(key)} {value:g}" for key, value in samples)
+        previous = None
+        for (name, key), values in observations:
+            if name != previous:
+                lines.append(f"# HELP {METRIC_PREFIX}{name} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {METRIC_PREFIX}{name} histogram")
+                previous = name
+            for bound in HISTOGRAM_BUCKETS.get(name, DEFAULT_BUCKETS):
+                count = sum(1 for value in values if value <= bound)
+                lines.append(f"{METRIC_PREFIX}{name}_bucket{format_labels(key + (('le', f'{bound:g}'),))} {count}")
+            lines.append(f"{METRIC_PREFIX}{name}_bucket{format_labels(key + (('le', '+Inf'),))} {len(values)}")
+            lines.append(f"{METRIC_PREFIX}{name}_sum{format_labels(key)} {sum(values):g}")
+            lines.append(f"{METRIC_PREFIX}{name}_count{format_labels(key)} {len(values)}")
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def grouped(counters):
+        groups = {}
+        for (name, key), value in counters:
+            groups.setdefault(name, []).append((key, value))
+        return [(name, name, 'counter', samples) for name, samples in groups.items()]
+
+    def trace_events(self):
+        """The spans in the Chrome trace event format."""
+        with self.lock:
+            spans = list(self.spans)
+        return {"traceEvents": [{
+            "name": span["name"], "ph": "X", "pid": span["pid"], "tid": span["thread"],
+            "ts": int((span["start"] - self.started) * 1e6), "dur": int(span["seconds"] * 1e6),
+            "args": span["attributes"],
+        } for span in spans]}
+
+    def write(self, directory):
+        """Write metrics.json, metrics.prom and, with tracing, trace.json to directory."""
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, 'metrics.json'), 'w', encoding='utf-8') as f:
+            json.dump(self.summary(), f, ensure_ascii=False, indent=4)
+        with open(os.path.join(directory, 'metrics.prom'), 'w', encoding='utf-8') as f:
+            f.write(self.prometheus_text())
+        if self.tracing:
+            with open(os.path.join(directory, 'trace.json'), 'w', encoding='utf-8') as f:
+                json.dump(self.trace_events(), f)
+        return directory
+
+# The metrics of the current run
+_metrics = Metrics()
+
+def get_metrics():
+    return _metrics
+
+def reset_metrics(tracing=False):
+    """Start collecting for a new run."""
+    global _metrics
+    _metrics = Metrics(tracing)
+    return _metrics
+
+def metrics_dir_from_args(args, input_directory):
+    """The --metrics-dir (default <input dir>/metrics)."""
+    return getattr(args, 'metrics_dir', None) or os.path.join(input_directory, METRICS_DIR_NAME)
@@ -0,0 +1,185 @@
+# File: page_io.py
+import os
+import json
+import queue
+import logging
+import textwrap
+import threading
+
+BACKGROUND_QUEUE_SIZE = 4  # pending writes before submit() blocks
+OUTPUT_FORMATS = ['json', 'jsonl']
+DEFAULT_OUTPUT_FORMAT = 'json'
+
+class JsonArrayWriter:
+    """Writes pages one at a time as a JSON array, so the file is valid once closed
+    without keeping the whole document in memory. If the pages stop with an exception
+    the array is left open, so a truncated file is not mistaken for a complete one."""
+    def __init__(self, path, ensure_ascii=True):
+        self.file = open(path, 'w', encoding='utf-8')
+        self.ensure_ascii = ensure_ascii
+        self.count = 0
+        self.file.write('[')
+
+    def write(self, page):
+        separator = ',\n' if self.count else '\n'
+        item = json.dumps(page, ensure_ascii=self.ensure_ascii, indent=4)
+        self.file.write(separator + textwrap.indent(item, '    '))
+        self.file.flush()
+        self.count += 1
+
+    def close(self):
+        self.file.write('\n]' if self.count else ']')
+        self.file.close()
+
+    def abort(self):
+        self.file.close()
+        logging.warning(f"Writing {self.file.name} failed after {self.count} pages, the file is incomplete")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+class JsonLinesWriter:
+    """Writes pages as JSON Lines, one page per line, flushed after every page. With
+    append, a file left by an interrupted run is continued."""
+    def __init__(self, path, ensure_ascii=True, append=False):
+        self.file = open(path, 'a' if append else 'w', encoding='utf-8')
+        self.ensure_ascii = ensure_ascii
+        self.count = 0
+
+    def write(self, page):
+        self.file.write(json.dumps(page, ensure_ascii=self.ensure_ascii) + '\n')
+        self.file.flush()
+        self.count += 1
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+def page_file(directory, name, output_format=DEFAULT_OUTPUT_FORMAT):
+    """Path of a page result file: <directory>/<name>.json or .jsonl."""
+    return os.path.join(directory, f"{name}.{output_format}")
+
+def page_writer(path, ensure_ascii=True, append=False):
+    """A JsonLinesWriter for .jsonl paths, else a JsonArrayWriter (which cannot append)."""
+    if path.endswith('.jsonl'):
+        return JsonLinesWriter(path, ensure_ascii, append)
+    return JsonArrayWriter(path, ensure_ascii)
+
+def read_pages(path):
+    """Yields the pages of a .json or .jsonl result file. JSON Lines are read one page
+    at a time; a last line cut off by an interrupted run is skipped."""
+    if not path.endswith('.jsonl'):
+        with open(path, 'r', encoding='utf-8') as f:
+            yield from json.load(f)
+        return
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.endswith('\n'):
+                logging.warning(f"Skipping incomplete last line of {path}")
+                return
+            if line.strip():
+                yield json.loads(line)
+
+def drop_incomplete_line(path):
+    """Truncate a JSON Lines file after its last complete line, so it can be appended to."""
+    with open(path, 'rb+') as f:
+        end = f.seek(0, os.SEEK_END)
+        position = end
+        while position > 0:
+            start = max(0, position - 4096)
+            f.seek(start)
+            newline = f.read(position - start).rfind(b'\n')
+            if newline >= 0:
+                position = start + newline + 1
+                break
+            position = start
+        if position < end:
+            logging.warning(f"Dropping incomplete last line of {path}")
+            f.truncate(position)
+
+def completed_pages(path):
+    """source_file of every page already in a JSON Lines file (for --resume); the file
+    is made ready for appending. Empty if the file does not exist."""
+    if not os.path.exists(path):
+        return set()
+    drop_incomplete_line(path)
+    return {page["source_file"] for page in read_pages(path)}
+
+def resumable_pages(path, resume, source=None):
+    """The pages of path that --resume does not need to produce again: those already in
+    a .jsonl file. Empty when not resuming; a .json file is always rewritten. If the
+    source file path was made from changed since path was written, the stored pages may
+    be stale and are not kept either."""
+    if not resume:
+        return set()
+    if not path.endswith('.jsonl'):
+        logging.warning(f"--resume needs --output-format jsonl, rewriting {path}")
+        return set()
+    if source is not None and os.path.exists(path) and os.path.getmtime(source) > os.path.getmtime(path):
+        logging.info(f"Not resuming {path}, {source} changed since it was written")
+        return set()
+    done = completed_pages(path)
+    if done:
+        logging.info(f"Resuming {path} after {len(done)} pages")
+    return done
+
+class BackgroundWriter:
+    """Runs write calls on a separate thread so the caller does not wait for encoding
+    and disk I/O. The queue is bounded, a caller that is faster than the disk blocks."""
+    def __init__(self, maxsize=BACKGROUND_QUEUE_SIZE, name='BackgroundWriter'):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.error = None
+        self.thread = threading.Thread(target=self.work, name=name, daemon=True)
+        self.thread.start()
+
+    def submit(self, function, *args):
+        if self.error is not None:
+            raise RuntimeError("Background write failed") from self.error
+        self.queue.put((function, args))
+
+    def try_submit(self, function, *args):
+        """Like submit, but returns False instead of waiting when the queue is full."""
+        if self.error is not None:
+            raise RuntimeError("Background write failed") from self.error
+        try:
+            self.queue.put_nowait((function, args))
+        except queue.Full:
+            return False
+        return True
+
+    def work(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            function, args = item
+            try:
+                function(*args)
+            except Exception as e:
+                logging.exception("Background write failed")
+                if self.error is None:
+                    self.error = e
+
+    def close(self):
+        """Wait until everything submitted is written; raises if a write failed."""
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise RuntimeError("Background write failed") from self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,87 @@
+# File: parallel.py
+import os
+import logging
+import threading
+import multiprocessing
+import cv2
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from profiling import start_worker_profiling, worker_profile
+
+# Tesseract parallelizes internally with OpenMP. With one process per core the
+# workers would otherwise compete for the same cores, so each worker gets one thread.
+WORKER_OMP_THREAD_LIMIT = 1
+# The same holds for OpenCV's own thread pool
+WORKER_CV2_THREADS = 1
+# The four basic orientations are the largest batch of candidates OCRed at once
+MAX_ORIENTATION_WORKERS = 4
+
+def limit_native_threads():
+    """Keep Tesseract and OpenCV to one thread each in this process, for when the
+    process itself runs several OCR calls at once (pool workers, orientation threads)."""
+    os.environ['OMP_THREAD_LIMIT'] = str(WORKER_OMP_THREAD_LIMIT)
+    cv2.setNumThreads(WORKER_CV2_THREADS)
+
+def init_worker(initializer=None, initargs=(), profile=None):
+    """Initializer run once in every worker process of a pool, followed by the pool's own.
+    With profile (directory, step), the worker is profiled until it exits."""
+    limit_native_threads()
+    if profile is not None:
+        start_worker_profiling(*profile)
+    if initializer is not None:
+        initializer(*initargs)
+
+def resolve_workers(workers):
+    """Translate the --workers argument into a process count (0 means one per core)."""
+    if workers is None:
+        return 1
+    if workers <= 0:
+        return os.cpu_count() or 1
+    return workers
+
+def resolve_orientation_workers(orientation_workers, workers):
+    """Translate the --orientation-workers argument into a thread count per page. By
+    default (None or 0) the cores are shared between the worker processes, so workers x
+    orientation workers does not oversubscribe them."""
+    if orientation_workers is None or orientation_workers <= 0:
+        return max(1, min(MAX_ORIENTATION_WORKERS, (os.cpu_count() or 1) // workers))
+    return orientation_workers
+
+def pool_context():
+    """Forking a process while other threads run (streaming stages, background writers)
+    can leave a lock held forever in the child, so workers are then started by a fork server."""
+    if threading.active_count() > 1 and 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+    return None
+
+def pool_forks():
+    """Whether the workers of create_process_pool() start as forks of this process, and
+    so share the memory it has now copy-on-write."""
+    context = pool_context()
+    if context is not None:
+        return context.get_start_method() == 'fork'
+    method = multiprocessing.get_start_method(allow_none=True) or multiprocessing.get_all_start_methods()[0]
+    return method == 'fork'
+
+def create_process_pool(workers, initializer=None, initargs=()):
+    context = pool_context()
+    logging.info(f"Starting process pool with {workers} workers" + (" (forkserver)" if context is not None else ""))
+    return ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_worker, initargs=(initializer, initargs, worker_profile()))
+
+def ordered_imap(pool, function, items, window, passthrough=None):
+    """Like pool.map, but lazy: at most window items are in flight and results come back in order.
+
+    Items for which passthrough(item) is true are yielded unchanged, in their place.
+    """
+    pending = deque()
+    for item in items:
+        if passthrough is not None and passthrough(item):
+            future = Future()
+            future.set_result(item)
+        else:
+            future = pool.submit(function, item)
+        pending.append(future)
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
@@ -1,10 +1,24 @@
 # File: pipeline.py
 import os
+import signal
+import argparse
 import logging
+import threading
 from step_01_preprocess.preprocess_step import PreprocessStep
 from step_02_ocr.ocr_step import OCRStep
 from step_03_hyphenation.hyphenation_step import HyphenationStep
 from step_04_sanitize.sanitization_step import SanitizationStep
+from step_02_ocr.engines import DEFAULT_BACKEND, ENGINE_BACKENDS
+from step_02_ocr.ocr_debug import DEBUG_ANGLES, DEFAULT_DEBUG_ANGLES
+from step_02_ocr.utils_optimization import DEFAULT_FINE_SEARCH, DEFAULT_PROBE_BUDGET, FINE_SEARCH_STRATEGIES
+from step_04_sanitize.symspell import DEFAULT_SUGGESTION_BACKEND, SUGGESTION_BACKENDS
+from manifest import StepManifest, arg_values
+from metrics import metrics_dir_from_args, reset_metrics
+from profiling import disable_profiling, enable_profiling, profile_dir_from_args, profile_step
+from page_io import DEFAULT_OUTPUT_FORMAT, OUTPUT_FORMATS
+from step_01_preprocess.documents import DEFAULT_DPI
+from streaming import run_streaming_pipeline
+from watch import DEFAULT_POLL_INTERVAL, run_watch
 
 # Mapping Tesseract language codes to Enchant language codes
 LANGUAGE_MAP = {
@@ -48,6 +62,9 @@ STEPS = [
     ('SanitizationStep', SanitizationStep)
 ]
 
+# Manifest of PreprocessStep and OCRStep when they run together with --in-memory
+IN_MEMORY_MANIFEST = 'InMemoryOCRStep'
+
 def list_data_directory():
     data_dir = "/workspace/data"
     print(f"Listing contents of {data_dir}:")
@@ -57,9 +74,40 @@ def list_data_directory():
         for name in dirs:
             print(os.path.join(root, name))          
 
+def run_in_memory(args, incremental, metrics):
+    """Run PreprocessStep and OCRStep as one step, handing the preprocessed arrays to
+    OCR without writing and re-reading preprocessed/ images."""
+    preprocess, ocr = PreprocessStep(args), OCRStep(args)
+    if incremental:
+        manifest = StepManifest(INPUT_DIRECTORY, IN_MEMORY_MANIFEST)
+        step_args = arg_values(args, preprocess.MANIFEST_ARGS + ocr.MANIFEST_ARGS)
+        inputs = preprocess.manifest_inputs(INPUT_DIRECTORY)
+        if manifest.is_up_to_date(inputs, step_args, ocr.manifest_outputs(INPUT_DIRECTORY)):
+            logging.info("Skipping PreprocessStep and OCRStep, inputs and outputs are unchanged")
+            metrics.record_step(IN_MEMORY_MANIFEST, 0, skipped=True)
+            return
+    logging.info("Running PreprocessStep and OCRStep in memory")
+    with metrics.step(IN_MEMORY_MANIFEST), profile_step(IN_MEMORY_MANIFEST):
+        ocr.run(INPUT_DIRECTORY, preprocess.iter_processed(INPUT_DIRECTORY))
+    if incremental:
+        manifest.record(inputs, step_args, ocr.manifest_outputs(INPUT_DIRECTORY))
+
 def run_pipeline(args):
-    logging.info("Starting pipeline execution")
-        
+    """Run the steps and write the metrics of the run (also when a step fails).
+    With --profile, every step is profiled into <input dir>/profile."""
+    metrics = reset_metrics(tracing=getattr(args, 'trace', False))
+    profile_dir = profile_dir_from_args(args, INPUT_DIRECTORY)
+    if profile_dir is not None:
+        enable_profiling(profile_dir)
+    try:
+        run_steps(args, metrics)
+    finally:
+        disable_profiling()
+        metrics_dir = metrics.write(metrics_dir_from_args(args, INPUT_DIRECTORY))
+        logging.info(f"Wrote pipeline metrics to {metrics_dir}")
+
+def step_range(args):
+    """(start_index, end_index) of the steps selected with --from_step and --to_step."""
     start_index = 0
     end_index = len(STEPS)
 
@@ -73,26 +121,79 @@ def run_pipeline(args):
     start_index = max(start_index, 0)
     end_index = min(end_index, len(STEPS))
 
-    # Ensure the indices are within the valid range
-    start_index = max(start_index, 0)
-    end_index = min(end_index, len(STEPS))
+    return start_index, end_index
+
+def run_steps(args, metrics):
+    logging.info("Starting pipeline execution")
+    start_index, end_index = step_range(args)
+
+    if getattr(args, 'streaming', False):
+        if start_index > 0 or end_index < len(STEPS):
+            logging.warning("Streaming mode always runs all steps, --from_step/--to_step are ignored")
+        run_streaming_pipeline(args, INPUT_DIRECTORY)
+        logging.info("Pipeline execution completed successfully")
+        return
+
+    incremental = getattr(args, 'incremental', False)
+    steps = STEPS[start_index:end_index]
+
+    if getattr(args, 'in_memory', False):
+        if start_index == 0 and end_index >= 2:
+            run_in_memory(args, incremental, metrics)
+            steps = steps[2:]
+        else:
+            logging.warning("--in-memory needs both PreprocessStep and OCRStep in the step range, running from files")
 
     # Execute the steps in the specified range
-    for name, step_class in STEPS[start_index:end_index]:
-        logging.info(f"Running {name}")
+    for name, step_class in steps:
         step_instance = step_class(args)
-        step_instance.run(INPUT_DIRECTORY)
+        if incremental:
+            manifest = StepManifest(INPUT_DIRECTORY, name)
+            step_args = arg_values(args, step_instance.MANIFEST_ARGS)
+            inputs = step_instance.manifest_inputs(INPUT_DIRECTORY)
+            if manifest.is_up_to_date(inputs, step_args, step_instance.manifest_outputs(INPUT_DIRECTORY)):
+                logging.info(f"Skipping {name}, inputs and outputs are unchanged")
+                metrics.record_step(name, 0, skipped=True)
+                continue
+        logging.info(f"Running {name}")
+        with metrics.step(name), profile_step(name):
+            step_instance.run(INPUT_DIRECTORY)
+        if incremental:
+            manifest.record(inputs, step_args, step_instance.manifest_outputs(INPUT_DIRECTORY))
   
 
     logging.info("Pipeline execution completed successfully")
 
-if __name__ == "__main__":
-    import argparse
+def watch_pipeline(args):
+    """Run as a daemon that processes each new document of the input directory with
+    warm steps, until SIGTERM or Ctrl-C."""
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+    start_index, end_index = step_range(args)
+    try:
+        run_watch(args, INPUT_DIRECTORY, STEPS[start_index:end_index], stop_event, args.poll_interval)
+    except KeyboardInterrupt:
+        logging.info("Interrupted, stopped watching")
+
+def build_parser():
+    """The command line of the pipeline; also used to build complete args programmatically."""
     parser = argparse.ArgumentParser(description='Run OCR pipeline')
     parser.add_argument('--from_step', type=str, help='Step to start from')
     parser.add_argument('--to_step', type=str, help='Step to end at')
+    parser.add_argument('--incremental', action='store_true', help='Skip steps and pages whose inputs, args and outputs are unchanged since the last run')
+    parser.add_argument('--streaming', action='store_true', help='Stream pages through all steps concurrently instead of finishing each step before the next')
+    parser.add_argument('--in-memory', action='store_true', help='Pass preprocessed images to OCR in memory instead of writing and reading preprocessed/')
+    parser.add_argument('--keep-preprocessed', action='store_true', help='With --in-memory, still write preprocessed/ images (on a background thread) for debugging')
+    parser.add_argument('--output-format', type=str, choices=OUTPUT_FORMATS, default=DEFAULT_OUTPUT_FORMAT, help='Page results as one JSON array per step, or as JSON Lines (one page per line, written as each page is done)')
+    parser.add_argument('--resume', action='store_true', help='With --output-format jsonl, keep the pages an interrupted run already wrote and only process the rest')
+    parser.add_argument('--watch', action='store_true', help='Keep running and process every new document in the input directory as it arrives (inotify, or polling), with its results and metrics in documents/<file>/')
+    parser.add_argument('--poll-interval', type=float, default=DEFAULT_POLL_INTERVAL, help='With --watch, seconds between two scans of the input directory')
     parser.add_argument('--interactive-mode', action='store_true', help='Wait for input at certain places')
     parser.add_argument('--whitelist-filter', type=str, help='Comma-separated list of keywords to filter whitelist files')
+    parser.add_argument('--apply-corrections-globally', action='store_true', help='Apply a correction to every occurrence of the word, not only where it was suggested')
+    parser.add_argument('--suggestion-backend', type=str, choices=SUGGESTION_BACKENDS, default=DEFAULT_SUGGESTION_BACKEND, help='Spelling suggestions from Enchant, or from a SymSpell index of the hunspell wordlist and the whitelists that knows typical OCR confusions')
+    parser.add_argument('--wordlist', type=str, help='Wordlist for the symspell backend (plain or hunspell .dic, default: the hunspell dictionary of the language)')
+    parser.add_argument('--dpi', type=int, default=DEFAULT_DPI, help='Resolution at which PDF pages are rendered (PDFs and multi-page TIFFs in the input directory are read one page at a time)')
     parser.add_argument('--grayscale', action='store_true', help='Convert image to grayscale')
     parser.add_argument('--remove-noise', action='store_true', help='Apply noise removal')
     parser.add_argument('--threshold', type=int, default=0, help='Threshold for binarization')
@@ -100,12 +201,36 @@ if __name__ == "__main__":
     parser.add_argument('--erode', action='store_true', help='Apply erosion')
     parser.add_argument('--opening', action='store_true', help='Apply opening (erosion followed by dilation)')
     parser.add_argument('--canny', action='store_true', help='Apply Canny edge detection')
+    parser.add_argument('--deskew', action='store_true', help='Straighten skewed scans using the projection profile estimate')
     parser.add_argument('--language', type=str, default='eng', help='Language for Tesseract OCR')
     parser.add_argument('--check-orientation', type=str, choices=['NONE', 'BASIC', 'FINE'], default='NONE', help='Check and correct orientation')
+    parser.add_argument('--fine-search', type=str, choices=FINE_SEARCH_STRATEGIES, default=DEFAULT_FINE_SEARCH, help='FINE orientation search: the linear walk away from the best basic orientation (default), or a golden-section search that is skipped when the basic orientation reads with high confidence and finds peaks further out with fewer probes')
+    parser.add_argument('--probe-budget', type=int, default=DEFAULT_PROBE_BUDGET, help='Maximum OCR probes per page in the orientation search, including the four basic orientations (0 = no limit)')
+    parser.add_argument('--text-blocks', action='store_true', help='OCR only the text blocks found by a morphological layout analysis, joined in reading order; the orientation is searched on the largest block')
+    parser.add_argument('--estimate-orientation', action='store_true', help='Estimate orientation without OCR and only confirm it with one or two OCR passes')
+    parser.add_argument('--proxy-scale', type=float, default=1.0, help='Score orientation candidates on a copy downscaled by this factor (e.g. 0.5), OCR only the winner at full resolution')
+    parser.add_argument('--ocr-engine', type=str, choices=ENGINE_BACKENDS, default=DEFAULT_BACKEND, help='Tesseract backend: tesserocr keeps the model loaded in-process, pytesseract runs the binary per call (auto prefers tesserocr if installed)')
     parser.add_argument('--psm', type=int, choices=list(range(14)), default=6, help='Tesseract Page Segmentation Mode (PSM)')
     parser.add_argument('--save-preprocessed', action='store_true', help='Save preprocessed images')
+    parser.add_argument('--workers', type=int, default=1, help='Number of worker processes for parallel steps (0 = one per CPU core)')
+    parser.add_argument('--orientation-workers', type=int, help='Number of orientation candidates OCRed concurrently per page (default: the CPU cores divided by --workers, at most 4)')
+    parser.add_argument('--no-cache', action='store_true', help='Do not read or write the OCR result and dictionary caches')
+    parser.add_argument('--cache-dir', type=str, help='Directory of the OCR result and dictionary caches (default: <input dir>/cache)')
+    parser.add_argument('--cache-size-mb', type=int, default=512, help='Size cap of the OCR result cache, least recently used entries are evicted')
+    parser.add_argument('--skip-blank-pages', action='store_true', help='Do not OCR pages without ink (few connected components), they get an empty result marked "skipped": "blank"')
+    parser.add_argument('--skip-duplicate-pages', action='store_true', help='Do not OCR near-duplicates of an earlier page of the run (perceptual hash, confirmed by alignment), they reuse its result marked "skipped": "duplicate"')
+    parser.add_argument('--ocr-debug', action='store_true', help='Write the probe images and Tesseract word data of OCR to ocr_debug/ on a background thread (implied by --log-level DEBUG)')
+    parser.add_argument('--debug-every', type=int, default=1, help='Only write OCR debug artifacts of every Nth page')
+    parser.add_argument('--debug-below-confidence', type=float, help='Only write OCR debug artifacts of pages whose confidence is below this')
+    parser.add_argument('--debug-angles', type=str, choices=DEBUG_ANGLES, default=DEFAULT_DEBUG_ANGLES, help='Write the OCR debug artifacts of every probed angle or only of the chosen one')
+    parser.add_argument('--metrics-dir', type=str, help='Directory of metrics.json and metrics.prom (Prometheus text format) of the run (default: <input dir>/metrics)')
+    parser.add_argument('--trace', action='store_true', help='Also record a span per step and page and write them to trace.json (Chrome trace format, opens in Perfetto)')
+    parser.add_argument('--profile', action='store_true', help='Write a cProfile dump, collapsed stacks (for flame graphs) and tracemalloc allocation snapshots of every step and worker process to <input dir>/profile')
     parser.add_argument('--log-level', type=str, choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'], default='INFO', help='Set the logging level')
-    
+    return parser
+
+if __name__ == "__main__":
+    parser = build_parser()
     args = parser.parse_args()
 
     print("Pipeline script started")
@@ -126,4 +251,7 @@ if __name__ == "__main__":
 
     logging.debug(f"Running Pipeline args={args}")    
 
-    run_pipeline(args)
+    if args.watch:
+        watch_pipeline(args)
+    else:
+        run_pipeline(args)
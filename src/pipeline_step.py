@@ -1,6 +1,17 @@
 from abc import ABC, abstractmethod
 
 class PipelineStep(ABC):
+    # Names of the args attributes that change the output of the step (used by --incremental)
+    MANIFEST_ARGS = ()
+
     @abstractmethod
     def run(self, input_data):
         pass
+
+    def manifest_inputs(self, input_data):
+        """Files the step reads; a change to any of them makes the step run again."""
+        return []
+
+    def manifest_outputs(self, input_data):
+        """Files the step writes; the step runs again if one is missing or was modified."""
+        return []
@@ -0,0 +1,187 @@
+# File: profiling.py
+import os
+import sys
+import pstats
+import logging
+import cProfile
+import threading
+import tracemalloc
+import multiprocessing.util
+from collections import Counter
+from contextlib import contextmanager
+
+PROFILE_DIR_NAME = 'profile'
+PROFILE_SUFFIXES = ('.pstats', '.txt', '.collapsed', '.allocations.txt', '.tracemalloc')
+SAMPLE_INTERVAL = 0.005  # seconds between two stack samples
+TRACEMALLOC_FRAMES = 5  # frames kept per allocation, more makes tracing slower
+TOP_FUNCTIONS = 40  # functions in the text summary of a profile
+TOP_ALLOCATORS = 25  # source lines in the allocation summary
+WORKER_FINALIZE_PRIORITY = 10  # write the profile of a worker before the pool's own exit handlers run
+
+# The profile directory while --profile is active, and the step profiled on each thread
+_profile_dir = None
+_current = threading.local()
+_tracemalloc_users = 0
+_tracemalloc_lock = threading.Lock()
+# The profiler of a worker process, written when the process exits
+_worker_profiler = None
+
+class StackSampler(threading.Thread):
+    """Samples the Python stacks of the process at a fixed interval and counts them as
+    collapsed stacks ("thread;outer;...;inner count"), the input of flamegraph.pl,
+    speedscope and similar tools. Unlike cProfile it also sees other threads."""
+    def __init__(self, interval=SAMPLE_INTERVAL, thread_ids=None):
+        super().__init__(name='StackSampler', daemon=True)
+        self.interval = interval
+        self.thread_ids = thread_ids
+        self.stacks = Counter()
+        self.stop_event = threading.Event()
+
+    def run(self):
+        own = threading.get_ident()
+        while not self.stop_event.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own or (self.thread_ids is not None and ident not in self.thread_ids):
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
+
+    def write(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+def start_tracemalloc():
+    """tracemalloc is process-wide; steps running concurrently (streaming) share it."""
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        _tracemalloc_users += 1
+
+def stop_tracemalloc():
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        _tracemalloc_users -= 1
+        if _tracemalloc_users == 0:
+            tracemalloc.stop()
+
+def allocation_snapshot():
+    return tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    ])
+
+class Profiler:
+    """Profile of a step (or a worker process), written to directory as
+      <name>.pstats and <name>.txt  cProfile of the thread running it (pstats / top functions), unless
+                                     another cProfile is active (Python 3.12+ allows one per process)
+      <name>.collapsed               stack samples, for flame graphs
+      <name>.tracemalloc             tracemalloc snapshot at the end (tracemalloc.Snapshot.load)
+      <name>.allocations.txt         top allocating source lines: growth during the step and live at the end
+    """
+    def __init__(self, directory, name, thread_ids=None):
+        self.directory = directory
+        self.name = name
+        self.profile = cProfile.Profile()
+        self.sampler = StackSampler(thread_ids=thread_ids)
+        self.before = None
+
+    def path(self, suffix):
+        return os.path.join(self.directory, f"{self.name}{suffix}")
+
+    def start(self):
+        start_tracemalloc()
+        self.before = allocation_snapshot()
+        self.sampler.start()
+        try:
+            self.profile.enable()
+        except ValueError as e:
+            # Steps running concurrently (streaming) then only get their stack samples
+            logging.warning(f"No cProfile for {self.name}, its profile has the stack samples only: {e}")
+            self.profile = None
+
+    def stop(self):
+        if self.profile is not None:
+            self.profile.disable()
+        self.sampler.stop()
+        after = allocation_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        stop_tracemalloc()
+        os.makedirs(self.directory, exist_ok=True)
+        if self.profile is not None:
+            self.profile.dump_stats(self.path('.pstats'))
+            with open(self.path('.txt'), 'w', encoding='utf-8') as f:
+                pstats.Stats(self.profile, stream=f).sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+        self.sampler.write(self.path('.collapsed'))
+        after.dump(self.path('.tracemalloc'))
+        with open(self.path('.allocations.txt'), 'w', encoding='utf-8') as f:
+            f.write(f"Traced memory: {current / 2**20:.1f} MiB at the end, peak {peak / 2**20:.1f} MiB (all threads of the process)\n\n")
+            f.write(f"Top {TOP_ALLOCATORS} source lines by growth during {self.name}:\n")
+            for stat in after.compare_to(self.before, 'lineno')[:TOP_ALLOCATORS]:
+                f.write(f"{stat}\n")
+            f.write(f"\nTop {TOP_ALLOCATORS} source lines by memory held at the end:\n")
+            for stat in after.statistics('lineno')[:TOP_ALLOCATORS]:
+                f.write(f"{stat}\n")
+        logging.info(f"Wrote profile of {self.name} to {self.directory}")
+
+def enable_profiling(directory):
+    """Profile the following steps (and their worker processes) into directory, replacing
+    the profiles of an earlier run."""
+    global _profile_dir
+    os.makedirs(directory, exist_ok=True)
+    for filename in os.listdir(directory):
+        if filename.endswith(PROFILE_SUFFIXES):
+            os.remove(os.path.join(directory, filename))
+    _profile_dir = directory
+
+def disable_profiling():
+    global _profile_dir
+    _profile_dir = None
+
+@contextmanager
+def profile_step(name, own_thread_only=False):
+    """Profile the block as step name if --profile is active. With own_thread_only, the
+    stack samples only cover the calling thread, for steps that run concurrently."""
+    if _profile_dir is None:
+        yield
+        return
+    profiler = Profiler(_profile_dir, name, {threading.get_ident()} if own_thread_only else None)
+    _current.step = name
+    profiler.start()
+    try:
+        yield
+    finally:
+        profiler.stop()
+        _current.step = None
+
+def worker_profile():
+    """(directory, step) for the worker processes started on this thread, or None."""
+    if _profile_dir is None:
+        return None
+    return _profile_dir, getattr(_current, 'step', None) or 'pipeline'
+
+def start_worker_profiling(directory, step):
+    """Profile a worker process until it exits; its files are named <step>.worker-<pid>."""
+    global _worker_profiler
+    _worker_profiler = Profiler(directory, f"{step}.worker-{os.getpid()}")
+    _worker_profiler.start()
+    multiprocessing.util.Finalize(None, _worker_profiler.stop, exitpriority=WORKER_FINALIZE_PRIORITY)
+
+def profile_dir_from_args(args, input_directory):
+    """The profile directory with --profile (<input dir>/profile), or None."""
+    if not getattr(args, 'profile', False):
+        return None
+    return os.path.join(input_directory, PROFILE_DIR_NAME)
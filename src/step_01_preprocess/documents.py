@@ -0,0 +1,118 @@
+# File: step_01_preprocess/documents.py
+import os
+import re
+import shutil
+import subprocess
+import threading
+import cv2
+import numpy as np
+from PIL import Image
+from manifest import fingerprint
+
+try:
+    import pymupdf  # renders PDF pages in-process
+except ImportError:
+    pymupdf = None
+
+IMAGE_EXTENSIONS = ('.jpeg', '.jpg', '.png')
+DOCUMENT_EXTENSIONS = ('.pdf', '.tif', '.tiff')
+DEFAULT_DPI = 300
+
+# (path, fingerprint) -> page count, so listing the pages does not reopen unchanged documents
+_page_counts = {}
+# The PDF the pages of this thread are rendered from, kept open for its next page
+_open_pdf = threading.local()
+
+# Each page of a document becomes an image named <document>.p<page>.png in preprocessed/
+PAGE_NAME = re.compile(r'^(?P<document>.+\.(?:pdf|tiff?))\.p(?P<page>\d+)\.png$', re.IGNORECASE)
+
+def page_name(document, page):
+    return f"{document}.p{page:04d}.png"
+
+def page_fields(image_file):
+    """The document and page number (from 1) of a document page, for the page results."""
+    match = PAGE_NAME.match(image_file)
+    if match is None:
+        return {}
+    return {"document": match.group('document'), "document_page": int(match.group('page'))}
+
+def is_pdf(path):
+    return path.lower().endswith('.pdf')
+
+def page_count(path):
+    """Number of pages of a PDF or frames of a TIFF, without decoding any of them."""
+    if not is_pdf(path):
+        with Image.open(path) as image:
+            return getattr(image, 'n_frames', 1)
+    if pymupdf is not None:
+        with pymupdf.open(path) as document:
+            return document.page_count
+    if shutil.which('pdfinfo') is None:
+        raise ValueError(f"Reading {path} needs PyMuPDF or poppler-utils (pdfinfo, pdftoppm)")
+    info = subprocess.run(['pdfinfo', path], capture_output=True, text=True, check=True).stdout
+    match = re.search(r'^Pages:\s+(\d+)', info, re.MULTILINE)
+    if match is None:
+        raise ValueError(f"Could not read the page count of {path}")
+    return int(match.group(1))
+
+def cached_page_count(path):
+    """page_count(path), remembered until the file changes."""
+    key = (os.path.abspath(path), tuple(fingerprint(path) or ()))
+    if key not in _page_counts:
+        _page_counts[key] = page_count(path)
+    return _page_counts[key]
+
+def open_pdf(path):
+    """The PyMuPDF document of path, opened once for all of its pages read in a row by this thread."""
+    key = (os.path.abspath(path), tuple(fingerprint(path) or ()))
+    if getattr(_open_pdf, 'key', None) != key:
+        close_documents()
+        _open_pdf.document = pymupdf.open(path)
+        _open_pdf.key = key
+    return _open_pdf.document
+
+def close_documents():
+    """Close the PDF kept open by read_page() in this thread."""
+    document = getattr(_open_pdf, 'document', None)
+    if document is not None:
+        document.close()
+    _open_pdf.document = None
+    _open_pdf.key = None
+
+def input_pages(directory):
+    """(image_file, source) of every page in directory, sorted by file name. source is
+    the path of an image, or (path, page) for a page of a PDF or multi-frame TIFF, which
+    is only decoded when read_page() is called."""
+    pages = []
+    for filename in sorted(os.listdir(directory)):
+        path = os.path.join(directory, filename)
+        if filename.lower().endswith(DOCUMENT_EXTENSIONS):
+            pages.extend((page_name(filename, page), (path, page)) for page in range(1, cached_page_count(path) + 1))
+        elif filename.endswith(IMAGE_EXTENSIONS):
+            pages.append((filename, path))
+    return pages
+
+def source_path(source):
+    """The file a page source is read from."""
+    return source if isinstance(source, str) else source[0]
+
+def read_page(source, dpi=DEFAULT_DPI):
+    """Decode one page as a BGR array, like cv2.imread. PDF pages are rendered at dpi,
+    TIFF frames are read at their own resolution."""
+    if isinstance(source, str):
+        return cv2.imread(source)
+    path, page = source
+    if not is_pdf(path):
+        with Image.open(path) as image:
+            image.seek(page - 1)
+            return cv2.cvtColor(np.asarray(image.convert('RGB')), cv2.COLOR_RGB2BGR)
+    if pymupdf is not None:
+        pixmap = open_pdf(path)[page - 1].get_pixmap(dpi=dpi, colorspace=pymupdf.csRGB, alpha=False)
+        rgb = np.frombuffer(pixmap.samples, np.uint8).reshape(pixmap.height, pixmap.width, 3)
+        return cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
+    if shutil.which('pdftoppm') is None:
+        raise ValueError(f"Reading {path} needs PyMuPDF or poppler-utils (pdfinfo, pdftoppm)")
+    # pdftoppm writes the page as PPM to stdout; a separate process keeps the renderer's memory out of ours
+    ppm = subprocess.run(['pdftoppm', '-f', str(page), '-l', str(page), '-r', str(dpi), path],
+                         capture_output=True, check=True).stdout
+    return cv2.imdecode(np.frombuffer(ppm, np.uint8), cv2.IMREAD_COLOR)
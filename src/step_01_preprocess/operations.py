@@ -0,0 +1,132 @@
+# File: step_01_preprocess/operations.py
+import time
+import logging
+from collections import Counter
+import cv2
+import numpy as np
+from step_01_preprocess.documents import DEFAULT_DPI, read_page
+from imaging import estimate_skew, rotate_array
+
+# Structuring element of dilate, erode and opening, shared by all images
+MORPH_KERNEL = np.ones((5, 5), np.uint8)
+MEDIAN_BLUR_SIZE = 5
+CANNY_THRESHOLDS = (100, 200)
+
+def to_gray(image, dst):
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=dst)
+
+def remove_noise(image, dst):
+    return cv2.medianBlur(image, MEDIAN_BLUR_SIZE, dst=dst)
+
+def threshold(image, dst):
+    return cv2.threshold(image, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU, dst=dst)[1]
+
+def deskew(image, dst):
+    angle = estimate_skew(image)
+    return rotate_array(image, angle) if angle else image
+
+def dilate(image, dst):
+    return cv2.dilate(image, MORPH_KERNEL, dst=dst, iterations=1)
+
+def erode(image, dst):
+    return cv2.erode(image, MORPH_KERNEL, dst=dst, iterations=1)
+
+def opening(image, dst):
+    return cv2.morphologyEx(image, cv2.MORPH_OPEN, MORPH_KERNEL, dst=dst)
+
+def canny(image, dst):
+    return cv2.Canny(image, *CANNY_THRESHOLDS, edges=dst)
+
+def same_shape(image):
+    return image.shape
+
+def gray_shape(image):
+    return image.shape[:2]
+
+def build_operations(args):
+    """Translate the preprocessing flags into the list of (name, function, output_shape)
+    applied to every image. output_shape is None when the result size is not known up front."""
+    operations = []
+    if args.grayscale or args.threshold > 0:
+        operations.append(('grayscale', to_gray, gray_shape))
+    if args.remove_noise:
+        operations.append(('remove_noise', remove_noise, same_shape))
+    if args.threshold > 0:
+        operations.append(('threshold', threshold, same_shape))
+    if args.deskew:
+        operations.append(('deskew', deskew, None))
+    if args.dilate:
+        operations.append(('dilate', dilate, same_shape))
+    if args.erode:
+        operations.append(('erode', erode, same_shape))
+    if args.opening:
+        operations.append(('opening', opening, same_shape))
+    if args.canny:
+        operations.append(('canny', canny, same_shape))
+    return operations
+
+class PreprocessChain:
+    """The preprocessing operations, built once and applied to image after image.
+
+    Intermediate results are written into buffers that are kept while the image size
+    stays the same. The last operation always allocates, so the returned image can be
+    handed on while the next one is processed.
+    """
+    def __init__(self, args):
+        self.operations = build_operations(args)
+        self.buffers = [None] * len(self.operations)
+        self.timings = Counter()
+        self.dpi = getattr(args, 'dpi', DEFAULT_DPI)
+
+    def buffer(self, position, shape):
+        buffer = self.buffers[position]
+        if buffer is None or buffer.shape != shape:
+            buffer = self.buffers[position] = np.empty(shape, np.uint8)
+        return buffer
+
+    def __call__(self, image, timings=None):
+        timings = self.timings if timings is None else timings
+        last = len(self.operations) - 1
+        for position, (name, function, output_shape) in enumerate(self.operations):
+            start_time = time.perf_counter()
+            reuse = position < last and output_shape is not None and image.dtype == np.uint8
+            image = function(image, self.buffer(position, output_shape(image)) if reuse else None)
+            timings[name] += time.perf_counter() - start_time
+        if any(image is buffer for buffer in self.buffers):
+            # deskew returns its input unchanged for straight pages
+            image = image.copy()
+        return image
+
+    def run_task(self, task):
+        """Preprocess one (source, output_path) task, where source is an image path or a
+        (path, page) document page. The image is written to output_path, or returned when
+        output_path is None. Returns (image or None, timings)."""
+        source, output_path = task
+        timings = Counter()
+        start_time = time.perf_counter()
+        image = read_page(source, self.dpi)
+        timings['read'] += time.perf_counter() - start_time
+        image = self(image, timings)
+        if output_path is None:
+            return image, timings
+        start_time = time.perf_counter()
+        cv2.imwrite(output_path, image)
+        timings['write'] += time.perf_counter() - start_time
+        return None, timings
+
+# The chain of a worker process, built once by the pool initializer
+_worker_chain = None
+
+def init_preprocess_worker(args):
+    global _worker_chain
+    _worker_chain = PreprocessChain(args)
+
+def run_preprocess_task(task):
+    return _worker_chain.run_task(task)
+
+def log_timings(timings):
+    total = sum(timings.values())
+    if not total:
+        return
+    breakdown = ', '.join(f"{name} {seconds:.2f}s ({100 * seconds / total:.0f}%)" for name, seconds in timings.most_common())
+    logging.info(f"Preprocessing time by operation: {breakdown}")
@@ -1,37 +1,96 @@
 import cv2
-import numpy as np
 import os
+import logging
+from collections import Counter
+from contextlib import ExitStack
 from pipeline_step import PipelineStep
+from manifest import StepManifest, arg_values
+from metrics import get_metrics
+from page_io import BackgroundWriter
+from parallel import create_process_pool, ordered_imap, resolve_workers
+from step_01_preprocess.documents import close_documents, input_pages, source_path
+from step_01_preprocess.operations import PreprocessChain, init_preprocess_worker, log_timings, run_preprocess_task
 
 class PreprocessStep(PipelineStep):
+    MANIFEST_ARGS = ('grayscale', 'remove_noise', 'threshold', 'dilate', 'erode', 'opening', 'canny', 'deskew', 'dpi')
+
     def __init__(self, args):
         self.args = args
+        self.incremental = getattr(args, 'incremental', False)
+        self.keep_preprocessed = getattr(args, 'keep_preprocessed', False)
+        self.workers = resolve_workers(getattr(args, 'workers', 1))
+        self.chain = PreprocessChain(args)
+
+    def input_pages(self, input_data):
+        """(image_file, source) of the input pages, see documents.input_pages."""
+        return input_pages(input_data)
+
+    def image_files(self, input_data):
+        return [image_file for image_file, _ in self.input_pages(input_data)]
+
+    def manifest_inputs(self, input_data):
+        return sorted({source_path(source) for _, source in self.input_pages(input_data)})
+
+    def manifest_outputs(self, input_data):
+        return [os.path.join(input_data, 'preprocessed', f) for f in self.image_files(input_data)]
 
     def preprocess_image(self, image):
-        if self.args.grayscale or self.args.threshold > 0:
-            image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        if self.args.remove_noise:
-            image = cv2.medianBlur(image, 5)
-        if self.args.threshold > 0:
-            _, image = cv2.threshold(image, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-        if self.args.dilate:
-            kernel = np.ones((5, 5), np.uint8)
-            image = cv2.dilate(image, kernel, iterations=1)
-        if self.args.erode:
-            kernel = np.ones((5, 5), np.uint8)
-            image = cv2.erode(image, kernel, iterations=1)
-        if self.args.opening:
-            kernel = np.ones((5, 5), np.uint8)
-            image = cv2.morphologyEx(image, cv2.MORPH_OPEN, kernel)
-        if self.args.canny:
-            image = cv2.Canny(image, 100, 200)
-        return image
+        return self.chain(image)
 
     def run(self, input_data):
-        image_files = [f for f in os.listdir(input_data) if f.endswith(('.jpeg', '.jpg', '.png'))]
+        pages = self.input_pages(input_data)
         os.makedirs(os.path.join(input_data, 'preprocessed'), exist_ok=True)
-        for image_file in image_files:
-            img_path = os.path.join(input_data, image_file)
-            img = cv2.imread(img_path)
-            processed_img = self.preprocess_image(img)
-            cv2.imwrite(os.path.join(input_data, 'preprocessed', image_file), processed_img)
+        manifest = StepManifest(input_data, 'PreprocessStep.pages') if self.incremental else None
+        settings = arg_values(self.args, self.MANIFEST_ARGS)
+        pending = []
+        for image_file, source in pages:
+            output_path = os.path.join(input_data, 'preprocessed', image_file)
+            if manifest is not None and manifest.page_is_up_to_date(image_file, [source_path(source)], settings, [output_path]):
+                continue
+            pending.append((image_file, source, output_path))
+        tasks = [(source, output_path) for _, source, output_path in pending]
+        for _, (image_file, source, output_path) in zip(self.preprocess_pages(tasks), pending):
+            if manifest is not None:
+                manifest.record_page(image_file, [source_path(source)], settings, [output_path])
+        if manifest is not None:
+            manifest.save()
+            logging.info(f"Preprocessed {len(pending)} images, {len(pages) - len(pending)} unchanged")
+
+    def preprocess_pages(self, tasks):
+        """Run (source, output_path) tasks in order and yield their results (see
+        PreprocessChain.run_task), across a worker pool with --workers > 1."""
+        timings = Counter()
+        metrics = get_metrics()
+        with ExitStack() as stack:
+            if self.workers > 1:
+                pool = stack.enter_context(create_process_pool(self.workers, init_preprocess_worker, (self.args,)))
+                results = ordered_imap(pool, run_preprocess_task, tasks, 2 * self.workers)
+            else:
+                results = map(self.chain.run_task, tasks)
+                stack.callback(close_documents)
+            for image, task_timings in results:
+                timings.update(task_timings)
+                metrics.observe('preprocess_page_seconds', sum(task_timings.values()))
+                yield image
+        log_timings(timings)
+        for name, seconds in timings.items():
+            metrics.count('preprocess_operation_seconds_total', seconds, operation=name)
+
+    def iter_processed(self, input_data):
+        """Preprocess the input images and yield (image_file, array) for OCR in memory.
+        The images are only written to preprocessed/ with --keep-preprocessed, on a
+        background thread."""
+        pages = self.input_pages(input_data)
+        writer = None
+        if self.keep_preprocessed:
+            os.makedirs(os.path.join(input_data, 'preprocessed'), exist_ok=True)
+            writer = BackgroundWriter(name='PreprocessWriter')
+        try:
+            tasks = ((source, None) for _, source in pages)
+            for processed_img, (image_file, _) in zip(self.preprocess_pages(tasks), pages):
+                if writer is not None:
+                    writer.submit(cv2.imwrite, os.path.join(input_data, 'preprocessed', image_file), processed_img)
+                yield image_file, processed_img
+        finally:
+            if writer is not None:
+                writer.close()
@@ -0,0 +1,119 @@
+# File: step_02_ocr/engines.py
+import logging
+import shlex
+import threading
+import cv2
+import numpy as np
+import pytesseract
+
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+ENGINE_BACKENDS = ['auto', 'tesserocr', 'pytesseract']
+DEFAULT_BACKEND = 'auto'
+
+# Engines are cached per thread: a Tesseract API handle must not be shared between threads
+_engines = threading.local()
+# Backends whose fallback to pytesseract was already reported
+_fallbacks_reported = set()
+
+def tessdata_dir_from_config(tessdata_dir_config):
+    """Extract the directory from a '--tessdata-dir "<path>"' config string."""
+    parts = shlex.split(tessdata_dir_config)
+    if '--tessdata-dir' in parts and parts.index('--tessdata-dir') + 1 < len(parts):
+        return parts[parts.index('--tessdata-dir') + 1]
+    return None
+
+class PytesseractEngine:
+    """Runs the tesseract binary per call; always available, used as the fallback backend."""
+    name = 'pytesseract'
+
+    def __init__(self, language, tessdata_dir_config, psm):
+        self.config = f'--psm {psm} -l {language} {tessdata_dir_config}'
+
+    def image_to_data(self, image):
+        if isinstance(image, np.ndarray) and image.ndim == 3:
+            # OpenCV arrays are BGR, pytesseract reads arrays as RGB
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        return pytesseract.image_to_data(image, config=self.config, output_type=pytesseract.Output.DICT)
+
+class TesserocrEngine:
+    """Keeps one Tesseract API with the language model loaded and passes image buffers in memory."""
+    name = 'tesserocr'
+
+    def __init__(self, language, tessdata_dir_config, psm):
+        tessdata_dir = tessdata_dir_from_config(tessdata_dir_config)
+        kwargs = {'path': tessdata_dir} if tessdata_dir else {}
+        self.api = tesserocr.PyTessBaseAPI(lang=language, psm=psm, **kwargs)
+        logging.info(f"Loaded tesserocr engine for language={language}, psm={psm}")
+
+    def set_image(self, image):
+        """Hand the pixels to Tesseract as a raw buffer. PIL images in L or RGB mode are
+        read through their array interface instead of SetImage, which encodes them."""
+        if not isinstance(image, np.ndarray):
+            if image.mode not in ('L', 'RGB'):
+                self.api.SetImage(image)
+                return
+            image = np.asarray(image)
+        elif image.ndim == 3:
+            # OpenCV arrays are BGR, Tesseract expects RGB
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        # Only copied if the array is a strided view
+        image = np.ascontiguousarray(image)
+        height, width = image.shape[:2]
+        bytes_per_pixel = 1 if image.ndim == 2 else image.shape[2]
+        try:
+            self.api.SetImageBytes(image.data, width, height, bytes_per_pixel, image.strides[0])
+        except TypeError:
+            # Releases of tesserocr that only accept bytes get a copy
+            self.api.SetImageBytes(image.tobytes(), width, height, bytes_per_pixel, image.strides[0])
+
+    def image_to_data(self, image):
+        """Recognize the image and return word rows shaped like pytesseract's image_to_data dict."""
+        self.set_image(image)
+        self.api.Recognize()
+        data = {key: [] for key in ('level', 'block_num', 'par_num', 'line_num', 'word_num', 'text', 'conf')}
+        block_num = par_num = line_num = word_num = 0
+        level = tesserocr.RIL.WORD
+        iterator = self.api.GetIterator()
+        if iterator is None:
+            return data
+        for result in tesserocr.iterate_level(iterator, level):
+            if result.IsAtBeginningOf(tesserocr.RIL.BLOCK):
+                block_num, par_num = block_num + 1, 0
+            if result.IsAtBeginningOf(tesserocr.RIL.PARA):
+                par_num, line_num = par_num + 1, 0
+            if result.IsAtBeginningOf(tesserocr.RIL.TEXTLINE):
+                line_num, word_num = line_num + 1, 0
+            word_num += 1
+            data['level'].append(5)
+            data['block_num'].append(block_num)
+            data['par_num'].append(par_num)
+            data['line_num'].append(line_num)
+            data['word_num'].append(word_num)
+            data['text'].append(result.GetUTF8Text(level) or '')
+            data['conf'].append(result.Confidence(level))
+        return data
+
+def resolve_backend(backend):
+    if backend in ('auto', 'tesserocr') and tesserocr is None:
+        if backend not in _fallbacks_reported:
+            _fallbacks_reported.add(backend)
+            logging.warning(f"tesserocr is not installed, --ocr-engine {backend} falls back to pytesseract, which runs the tesseract binary for every pass")
+        return 'pytesseract'
+    if backend == 'auto':
+        return 'tesserocr'
+    return backend
+
+def get_engine(language, tessdata_dir_config, psm, backend=DEFAULT_BACKEND):
+    """Return the engine for this thread, creating it (and loading the model) on first use."""
+    backend = resolve_backend(backend)
+    if not hasattr(_engines, 'cache'):
+        _engines.cache = {}
+    key = (backend, language, tessdata_dir_config, psm)
+    if key not in _engines.cache:
+        engine_class = TesserocrEngine if backend == 'tesserocr' else PytesseractEngine
+        _engines.cache[key] = engine_class(language, tessdata_dir_config, psm)
+    return _engines.cache[key]
@@ -0,0 +1,114 @@
+# File: step_02_ocr/ocr_cache.py
+import os
+import json
+import time
+import hashlib
+import logging
+import sqlite3
+import numpy as np
+import pytesseract
+
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+CACHE_FILE_NAME = 'ocr_cache.sqlite3'
+DEFAULT_CACHE_SIZE_MB = 512
+HASH_CHUNK_SIZE = 1024 * 1024  # bytes read at a time when hashing images
+
+def file_digest(path):
+    """SHA-256 of the file contents."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def array_digest(array):
+    """SHA-256 of an image array, including its shape and dtype."""
+    digest = hashlib.sha256(f"{array.shape}|{array.dtype}".encode('utf-8'))
+    digest.update(memoryview(np.ascontiguousarray(array)).cast('B'))
+    return digest.hexdigest()
+
+def tessdata_version(language, tessdata_dir, backend):
+    """Identify the Tesseract build and traineddata files that produce the OCR results.
+
+    backend is the resolved engine backend: tesserocr links its own libtesseract, which
+    may be another version than the tesseract binary pytesseract runs.
+    """
+    try:
+        version = str(tesserocr.tesseract_version()) if backend == 'tesserocr' else str(pytesseract.get_tesseract_version())
+    except (EnvironmentError, pytesseract.TesseractNotFoundError):
+        version = 'unknown'
+    models = []
+    for lang in language.split('+'):
+        path = os.path.join(tessdata_dir, f"{lang}.traineddata")
+        try:
+            stat = os.stat(path)
+            models.append(f"{lang}:{stat.st_size}:{stat.st_mtime_ns}")
+        except FileNotFoundError:
+            models.append(f"{lang}:missing")
+    return f"{version}|{','.join(models)}"
+
+class OCRCache:
+    """On-disk cache of per-page OCR results keyed by image hash and OCR configuration.
+
+    Entries are evicted least recently used first once the stored results exceed max_bytes.
+    Every stored result is committed right away, so the pages OCRed before a crash or an
+    interrupted run are not lost.
+    """
+    def __init__(self, cache_dir, config, max_bytes=DEFAULT_CACHE_SIZE_MB * 1024 * 1024):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, CACHE_FILE_NAME)
+        self.config_digest = hashlib.sha256(json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.connection = sqlite3.connect(self.path, timeout=30)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS ocr_results (key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS ocr_results_last_access ON ocr_results (last_access)')
+        self.connection.commit()
+        self.total_size = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM ocr_results').fetchone()[0]
+
+    def key(self, image_digest):
+        return hashlib.sha256(f"{image_digest}|{self.config_digest}".encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Return the cached entry (text_lines, final_angle, confidence) or None."""
+        row = self.connection.execute('SELECT value FROM ocr_results WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.connection.execute('UPDATE ocr_results SET last_access = ? WHERE key = ?', (time.time(), key))
+        return json.loads(row[0])
+
+    def put(self, key, entry):
+        value = json.dumps(entry, ensure_ascii=False)
+        size = len(value.encode('utf-8'))
+        previous = self.connection.execute('SELECT size FROM ocr_results WHERE key = ?', (key,)).fetchone()
+        self.connection.execute('INSERT OR REPLACE INTO ocr_results (key, value, size, last_access) VALUES (?, ?, ?, ?)',
+                                (key, value, size, time.time()))
+        self.total_size += size - (previous[0] if previous else 0)
+        if self.total_size > self.max_bytes:
+            self.evict()
+        self.connection.commit()
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits into max_bytes."""
+        evicted = 0
+        rows = self.connection.execute('SELECT key, size FROM ocr_results ORDER BY last_access').fetchall()
+        for key, size in rows:
+            if self.total_size <= self.max_bytes:
+                break
+            self.connection.execute('DELETE FROM ocr_results WHERE key = ?', (key,))
+            self.total_size -= size
+            evicted += 1
+        logging.info(f"OCR cache evicted {evicted} entries, {self.total_size} bytes remain")
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+        logging.info(f"OCR cache: {self.hits} hits, {self.misses} misses ({self.path})")
@@ -0,0 +1,111 @@
+# File: step_02_ocr/ocr_debug.py
+import os
+import json
+import logging
+import threading
+import multiprocessing.util
+from page_io import BackgroundWriter
+from step_02_ocr.utils_optimization import rotate_image
+
+DEBUG_ANGLES = ['all', 'winner']
+DEFAULT_DEBUG_ANGLES = 'all'
+DEBUG_DATA_FILE = 'probes.jsonl'
+DEBUG_QUEUE_SIZE = 16  # pages waiting to be written; further pages are dropped instead of slowing OCR down
+DEBUG_WRITER_FINALIZE_PRIORITY = 5  # flush a worker's artifacts when it exits, after its profile
+
+# The debug writer of this process, created on first use
+_writer = None
+_dropped = 0
+
+class PageDebug:
+    """Debug artifacts of the probes of one page: Tesseract's word data by angle. They
+    are collected while the page is OCRed and only written once its result is known, so
+    the sampling can depend on the result.
+
+    The rotated probe images are not kept, only the image each scope rotates; the
+    images of the sampled angles are rendered again when they are written.
+    """
+    def __init__(self, image_file, scope='', probes=None, lock=None, sources=None):
+        self.image_file = image_file
+        self.scope = scope
+        self.probes = {} if probes is None else probes
+        self.lock = lock or threading.Lock()
+        self.sources = {} if sources is None else sources
+
+    def scoped(self, scope):
+        """A view that keeps its probes apart, e.g. for the downscaled proxy of the page."""
+        return PageDebug(self.image_file, scope, self.probes, self.lock, self.sources)
+
+    def set_source(self, image):
+        """The unrotated image the probes of this scope are made from."""
+        self.sources[self.scope] = image
+
+    def add(self, angle, **artifacts):
+        with self.lock:
+            self.probes.setdefault((self.scope, angle), {}).update(artifacts)
+
+def should_keep(confidence, below_confidence):
+    return below_confidence is None or confidence < below_confidence
+
+def write_page_debug(directory, page, page_number, final_angle, confidence, winner_only):
+    """Render the probe images again and save them as JPEG, and append one compact JSON line per probe to
+    probes.jsonl. The lines of a page go out in a single append, so worker processes can
+    share the file."""
+    lines = []
+    for (scope, angle), artifacts in sorted(page.probes.items(), key=lambda item: (item[0][0], str(item[0][1]))):
+        winner = scope == '' and angle == final_angle
+        if winner_only and not winner:
+            continue
+        name = f"{page.image_file}.{scope + '.' if scope else ''}angle_{angle}"
+        if scope in page.sources:
+            rotate_image(page.sources[scope], angle).convert('RGB').save(os.path.join(directory, f"{name}.jpg"))
+        if 'data' in artifacts:
+            lines.append(json.dumps({
+                "source_file": page.image_file, "page_number": page_number, "scope": scope or "full", "angle": angle,
+                "winner": winner, "confidence": artifacts.get('confidence'), "page_confidence": confidence,
+                "data": artifacts['data'],
+            }, ensure_ascii=False, separators=(',', ':')) + '\n')
+    if lines:
+        fd = os.open(os.path.join(directory, DEBUG_DATA_FILE), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            os.write(fd, ''.join(lines).encode('utf-8'))
+        finally:
+            os.close(fd)
+
+def submit_page_debug(directory, page, page_number, final_angle, confidence, below_confidence=None, winner_only=False):
+    """Queue the artifacts of a page for writing, if the page is sampled. Never waits
+    for the disk: when the writer falls behind, the page is dropped."""
+    global _writer, _dropped
+    if not should_keep(confidence, below_confidence):
+        return
+    if _writer is None:
+        _writer = BackgroundWriter(DEBUG_QUEUE_SIZE, name='OCRDebugWriter')
+        multiprocessing.util.Finalize(None, close_debug_writer, exitpriority=DEBUG_WRITER_FINALIZE_PRIORITY)
+    try:
+        queued = _writer.try_submit(write_page_debug, directory, page, page_number, final_angle, confidence, winner_only)
+    except RuntimeError:
+        return  # logged by the writer; debug output must not fail the run
+    if not queued:
+        _dropped += 1
+        logging.debug(f"OCR debug writer is behind, dropped the artifacts of {page.image_file}")
+
+def forget_debug_writer():
+    """A forked child does not inherit the writer thread, only its queue."""
+    global _writer, _dropped
+    _writer, _dropped = None, 0
+
+os.register_at_fork(after_in_child=forget_debug_writer)
+
+def close_debug_writer():
+    """Wait for the queued artifacts of this process to be written."""
+    global _writer, _dropped
+    if _writer is None:
+        return
+    writer, _writer = _writer, None
+    try:
+        writer.close()
+    except RuntimeError:
+        logging.warning("Some OCR debug artifacts could not be written")
+    if _dropped:
+        logging.warning(f"Dropped the debug artifacts of {_dropped} pages, the debug writer could not keep up")
+        _dropped = 0
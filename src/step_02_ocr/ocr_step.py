@@ -1,65 +1,330 @@
 import os
+import time
+import shutil
+import threading
+import cv2
+import numpy as np
+from contextlib import ExitStack
 from PIL import Image
 from pipeline_step import PipelineStep
-from step_02_ocr.utils_optimization import check_orientations
+from parallel import create_process_pool, limit_native_threads, ordered_imap, resolve_orientation_workers, resolve_workers
+from manifest import StepManifest, arg_values
+from metrics import call_count, get_metrics
+from page_io import DEFAULT_OUTPUT_FORMAT, page_file, page_writer, read_pages, resumable_pages
+from step_01_preprocess.documents import page_fields
+from step_02_ocr.utils_optimization import DEFAULT_FINE_SEARCH, DEFAULT_PROBE_BUDGET, check_orientations
 from step_02_ocr.utils_tesseract import tesseract_ocr
-import json
+from step_02_ocr.engines import DEFAULT_BACKEND, resolve_backend
+from step_02_ocr.utils_screening import DuplicateIndex, PageSignature, is_blank, screening_image
+from step_02_ocr.ocr_debug import DEFAULT_DEBUG_ANGLES, PageDebug, close_debug_writer, submit_page_debug
+from step_02_ocr.ocr_cache import DEFAULT_CACHE_SIZE_MB, OCRCache, array_digest, file_digest, tessdata_version
 import logging
 
+# Fields of a page result that are stored in the OCR cache
+CACHED_FIELDS = ("final_angle", "confidence", "text_lines")
+# Timing of a page OCRed by ocr_page, possibly in a worker process; removed before the result is stored
+PAGE_METRICS_KEY = "_metrics"
+
 class OCRStep(PipelineStep):
+    MANIFEST_ARGS = ('language', 'path_to_tesseract', 'check_orientation', 'estimate_orientation', 'proxy_scale', 'fine_search', 'probe_budget', 'text_blocks', 'psm', 'ocr_engine', 'skip_blank_pages', 'skip_duplicate_pages')
+
     def __init__(self, args):
+        self.args = args
         self.language = args.language
         self.tessdata_dir = args.path_to_tesseract
         self.check_orientation = args.check_orientation
         self.psm = args.psm
         self.save_preprocessed = args.save_preprocessed
-        self.log_level = args.log_level.upper()
+        self.log_level = getattr(args, 'log_level', 'INFO').upper()
+        self.ocr_debug = getattr(args, 'ocr_debug', False) or self.log_level == 'DEBUG'
+        self.debug_every = max(1, getattr(args, 'debug_every', 1))
+        self.debug_below_confidence = getattr(args, 'debug_below_confidence', None)
+        self.debug_angles = getattr(args, 'debug_angles', DEFAULT_DEBUG_ANGLES)
+        self.workers = resolve_workers(getattr(args, 'workers', 1))
+        self.orientation_workers = resolve_orientation_workers(getattr(args, 'orientation_workers', None), self.workers)
+        self.estimate_orientation = getattr(args, 'estimate_orientation', False)
+        self.proxy_scale = getattr(args, 'proxy_scale', 1.0)
+        self.fine_search = getattr(args, 'fine_search', DEFAULT_FINE_SEARCH)
+        self.probe_budget = getattr(args, 'probe_budget', DEFAULT_PROBE_BUDGET)
+        self.text_blocks = getattr(args, 'text_blocks', False)
+        self.ocr_engine = getattr(args, 'ocr_engine', DEFAULT_BACKEND)
+        self.skip_blank_pages = getattr(args, 'skip_blank_pages', False)
+        self.skip_duplicate_pages = getattr(args, 'skip_duplicate_pages', False)
+        self.no_cache = getattr(args, 'no_cache', False)
+        self.cache_dir = getattr(args, 'cache_dir', None)
+        self.cache_size_mb = getattr(args, 'cache_size_mb', DEFAULT_CACHE_SIZE_MB)
+        self.incremental = getattr(args, 'incremental', False)
+        self.output_format = getattr(args, 'output_format', DEFAULT_OUTPUT_FORMAT)
+        self.resume = getattr(args, 'resume', False)
 
-    def run(self, main_directory):
+    def image_files(self, main_directory):
+        preprocessed_dir = os.path.join(main_directory, 'preprocessed')
+        return sorted(f for f in os.listdir(preprocessed_dir) if f.endswith(('.jpeg', '.jpg', '.png')))
+
+    def manifest_inputs(self, main_directory):
+        return [os.path.join(main_directory, 'preprocessed', f) for f in self.image_files(main_directory)]
+
+    def manifest_outputs(self, main_directory):
+        return [self.output_file(main_directory)]
+
+    def output_file(self, main_directory):
+        return page_file(os.path.join(main_directory, 'ocr_result'), 'ocr_result', self.output_format)
+
+    def prepare_directories(self, main_directory):
+        """Create the output directories; returns (preprocessed_dir, ocr_result_dir, ocr_debug_dir)."""
         preprocessed_dir = os.path.join(main_directory, 'preprocessed')
         ocr_result_dir = os.path.join(main_directory, 'ocr_result')
         ocr_debug_dir = None
-        
-        if self.log_level == 'DEBUG':
+
+        if self.ocr_debug:
             ocr_debug_dir = os.path.join(main_directory, 'ocr_debug')
             os.makedirs(ocr_debug_dir, exist_ok=True)
-        
+
         os.makedirs(ocr_result_dir, exist_ok=True)
-        tessdata_dir_config = f'--tessdata-dir "{self.tessdata_dir}"'
-        image_files = [f for f in os.listdir(preprocessed_dir) if f.endswith(('.jpeg', '.jpg', '.png'))]
-        output_file = os.path.join(ocr_result_dir, 'ocr_result.json')
+        return preprocessed_dir, ocr_result_dir, ocr_debug_dir
 
-        # Delete the output file if it exists
-        try:
-            os.remove(output_file)
-            logging.info(f"Deleted existing file: {output_file}")
-        except FileNotFoundError:
-            logging.info(f"No existing file to delete: {output_file}")
-
-        ocr_results = []
-
-        for index, image_file in enumerate(image_files, start=1):
-            img_path = os.path.join(preprocessed_dir, image_file)
-            logging.info(f"Starting analysis of file: {image_file}")
-            img = Image.open(img_path)
-            text, final_angle, confidence = check_orientations(img, self.language, tessdata_dir_config, self.psm, self.check_orientation, ocr_debug_dir )
-            text_lines = text.split('\n')
-
-            json_output = {
-                "page_number": index,
-                "source_file": image_file,
-                "final_angle": final_angle,
-                "confidence": confidence,
-                "text_lines": text_lines
-            }
-            ocr_results.append(json_output)
-            logging.debug(f"Processed {image_file} with final angle: {final_angle}")
-
-            # Save processed image if required
-            if self.save_preprocessed:
-                img.save(os.path.join(ocr_result_dir, f"processed_{image_file}"))
-
-        # Write all results to the output file as a single JSON array
-        with open(output_file, 'w', encoding='utf-8') as file_out:
-            json.dump(ocr_results, file_out, ensure_ascii=False, indent=4)
+    def run(self, main_directory, images=None):
+        output_file = self.output_file(main_directory)
+        done = resumable_pages(output_file, self.resume)
+        results = self.recognize(main_directory, images, skip=done)
+
+        if not done:
+            # Delete the output file if it exists
+            try:
+                os.remove(output_file)
+                logging.info(f"Deleted existing file: {output_file}")
+            except FileNotFoundError:
+                logging.info(f"No existing file to delete: {output_file}")
+
+        # Every page is written as soon as it is recognized, with jsonl it survives a crash
+        with page_writer(output_file, ensure_ascii=False, append=bool(done)) as writer:
+            for result in results:
+                writer.write(result)
         logging.info(f"Saved all OCR results to {output_file}")
+
+    def recognize(self, main_directory, images=None, skip=()):
+        """Returns a generator of the page results in page order, OCRing lazily.
+
+        images yields (image_file, source) pairs, where source is the path of a
+        preprocessed image or the preprocessed array itself when PreprocessStep hands
+        its output over in memory. By default the images in preprocessed/ are read;
+        only then can unchanged pages be reused with --incremental. Images in skip
+        (already stored by an interrupted run) are left out but keep their page number.
+        """
+        preprocessed_dir, ocr_result_dir, ocr_debug_dir = self.prepare_directories(main_directory)
+        manifest = None
+        previous_results = {}
+        if images is None:
+            images = ((image_file, os.path.join(preprocessed_dir, image_file)) for image_file in self.image_files(main_directory))
+            if self.incremental:
+                # Read before the caller replaces the output file
+                manifest = StepManifest(main_directory, 'OCRStep.pages')
+                previous_results = self.load_previous_results(self.output_file(main_directory))
+        return self.recognized_pages(main_directory, images, ocr_result_dir, ocr_debug_dir, manifest, previous_results, skip)
+
+    def recognized_pages(self, main_directory, images, ocr_result_dir, ocr_debug_dir, manifest, previous_results, skip=()):
+        settings = arg_values(self.args, self.MANIFEST_ARGS)
+        cache = self.open_cache(main_directory)
+        cache_keys = {}
+        sources = {}
+        pending = set()
+        origins = {}
+        # Near-duplicate pages by page number, and the results they are copied from
+        duplicates = {}
+        duplicate_index = DuplicateIndex() if self.skip_duplicate_pages else None
+        screened_results = {}
+
+        def tasks():
+            for index, (image_file, source) in enumerate(images, start=1):
+                if image_file in skip:
+                    continue
+                if manifest is not None:
+                    sources[image_file] = source
+                    previous = previous_results.get(image_file)
+                    if previous is not None and manifest.page_is_up_to_date(image_file, [source], settings, []):
+                        logging.debug(f"Reusing unchanged OCR result for {image_file}")
+                        origins[index] = "reused"
+                        yield {**previous, "page_number": index}
+                        continue
+                if self.skip_blank_pages or duplicate_index is not None:
+                    result = self.screen_page(index, image_file, source, duplicate_index, duplicates)
+                    if result is not None:
+                        origins[index] = result["skipped"]
+                        yield result
+                        continue
+                if cache is not None:
+                    key, result = self.lookup_cache(cache, index, image_file, source, ocr_result_dir)
+                    if result is not None:
+                        origins[index] = "cache"
+                        yield result
+                        continue
+                    cache_keys[index] = key
+                pending.add(index)
+                yield index, image_file, source, ocr_result_dir, ocr_debug_dir
+
+        def is_result(task):
+            return isinstance(task, dict)
+
+        start_time = time.perf_counter()
+        page_count = 0
+        processed = 0
+        with ExitStack() as stack:
+            if cache is not None:
+                # Also closed when the consumer stops early or a page fails
+                stack.callback(cache.close)
+            if self.workers > 1:
+                # Results come back in submission order, so page_number ordering stays stable
+                pool = stack.enter_context(create_process_pool(self.workers))
+                results = ordered_imap(pool, self.ocr_page, tasks(), 2 * self.workers, passthrough=is_result)
+            else:
+                if self.orientation_workers > 1:
+                    # The orientation threads of this process would otherwise each start a full OpenMP team
+                    limit_native_threads()
+                results = (task if is_result(task) else self.ocr_page(task) for task in tasks())
+            for result in results:
+                page_count += 1
+                if result["page_number"] in duplicates:
+                    result.update(screened_results[duplicates.pop(result["page_number"])])
+                elif duplicate_index is not None and "skipped" not in result:
+                    screened_results[result["page_number"]] = {field: result[field] for field in CACHED_FIELDS}
+                self.record_page_metrics(result, result.pop(PAGE_METRICS_KEY, None), origins.pop(result["page_number"], "ocr"))
+                if result["page_number"] in pending:
+                    pending.discard(result["page_number"])
+                    processed += 1
+                if result["page_number"] in cache_keys:
+                    self.store_in_cache(cache, cache_keys.pop(result["page_number"]), result)
+                if manifest is not None:
+                    manifest.record_page(result["source_file"], [sources.pop(result["source_file"])], settings, [])
+                yield result
+        elapsed = time.perf_counter() - start_time
+
+        if manifest is not None:
+            manifest.save()
+        # Debug artifacts of pages OCRed in this process; workers write theirs when they exit
+        close_debug_writer()
+        pages_per_second = processed / elapsed if elapsed > 0 else 0
+        logging.info(f"OCR processed {processed} pages in {elapsed:.1f}s ({pages_per_second:.2f} pages/s, workers={self.workers}), {page_count - processed} pages reused")
+
+    def screen_page(self, index, image_file, source, duplicate_index, duplicates):
+        """Classify a page before OCR. Returns the result of a blank page, or a
+        placeholder for a near-duplicate of an earlier page (its fields are copied from the
+        earlier result once that is known), or None if the page has to be OCRed."""
+        gray = screening_image(source)
+        fields = {"page_number": index, "source_file": image_file, **page_fields(image_file)}
+        if self.skip_blank_pages and is_blank(gray):
+            logging.info(f"Skipping OCR of blank page {image_file}")
+            return {**fields, "final_angle": 0, "confidence": 0, "text_lines": [], "skipped": "blank"}
+        if duplicate_index is None:
+            return None
+        signature = PageSignature(gray)
+        match = duplicate_index.find(signature)
+        if match is None:
+            duplicate_index.add(signature, index, image_file)
+            return None
+        page_number, original_file = match
+        logging.info(f"Skipping OCR of {image_file}, it duplicates {original_file}")
+        duplicates[index] = page_number
+        return {**fields, "skipped": "duplicate", "duplicate_of": original_file}
+
+    def record_page_metrics(self, result, page_metrics, origin):
+        """Record a page result; page_metrics is the timing of a page OCRed in this run."""
+        metrics = get_metrics()
+        metrics.count('ocr_pages_total', origin=origin)
+        record = {"step": "OCRStep", "page_number": result["page_number"], "source_file": result["source_file"], "origin": origin,
+                  "final_angle": result["final_angle"], "confidence": result["confidence"]}
+        if page_metrics is not None:
+            metrics.count('ocr_passes_total', page_metrics["orientation_probes"])
+            metrics.count('ocr_angle_pages_total', angle=result["final_angle"])
+            metrics.observe('ocr_page_seconds', page_metrics["seconds"])
+            metrics.observe('ocr_page_orientation_probes', page_metrics["orientation_probes"])
+            metrics.observe('ocr_page_confidence', result["confidence"])
+            metrics.add_span('OCRStep.page', page_metrics["start"], page_metrics["seconds"], page_metrics["pid"], page_metrics["thread"],
+                             source_file=result["source_file"], final_angle=result["final_angle"], orientation_probes=page_metrics["orientation_probes"])
+            record.update(seconds=page_metrics["seconds"], orientation_probes=page_metrics["orientation_probes"])
+        metrics.record_page(**record)
+
+    def load_previous_results(self, output_file):
+        """Results of the last run by source file, read before the output file is replaced."""
+        try:
+            return {result["source_file"]: result for result in read_pages(output_file)}
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def open_cache(self, main_directory):
+        if self.no_cache:
+            return None
+        cache_dir = self.cache_dir or os.path.join(main_directory, 'cache')
+        backend = resolve_backend(self.ocr_engine)
+        config = {
+            "language": self.language,
+            "psm": self.psm,
+            "check_orientation": self.check_orientation,
+            "estimate_orientation": self.estimate_orientation,
+            "proxy_scale": self.proxy_scale,
+            "fine_search": self.fine_search,
+            "probe_budget": self.probe_budget,
+            "text_blocks": self.text_blocks,
+            "ocr_engine": backend,
+            "tessdata_version": tessdata_version(self.language, self.tessdata_dir, backend),
+        }
+        return OCRCache(cache_dir, config, self.cache_size_mb * 1024 * 1024)
+
+    def lookup_cache(self, cache, index, image_file, source, ocr_result_dir):
+        """Returns the cache key of the page and its cached result, or None on a miss.
+
+        Images in memory are hashed as arrays, so they do not share entries with image files.
+        """
+        in_memory = isinstance(source, np.ndarray)
+        key = cache.key(array_digest(source) if in_memory else file_digest(source))
+        entry = cache.get(key)
+        if entry is None:
+            return key, None
+        logging.debug(f"OCR cache hit for {image_file}")
+        if self.save_preprocessed:
+            processed_path = os.path.join(ocr_result_dir, f"processed_{image_file}")
+            if in_memory:
+                cv2.imwrite(processed_path, source)
+            else:
+                shutil.copyfile(source, processed_path)
+        return key, {"page_number": index, "source_file": image_file, **page_fields(image_file), **entry}
+
+    def store_in_cache(self, cache, key, result):
+        cache.put(key, {field: result[field] for field in CACHED_FIELDS})
+
+    def ocr_page(self, page):
+        """OCR a single preprocessed image. Runs in a worker process when --workers > 1."""
+        index, image_file, source, ocr_result_dir, ocr_debug_dir = page
+        start, start_time, passes = time.time(), time.perf_counter(), call_count('ocr_pass')
+        tessdata_dir_config = f'--tessdata-dir "{self.tessdata_dir}"'
+        logging.info(f"Starting analysis of file: {image_file}")
+        # Arrays handed over in memory go to the engine as they are
+        img = source if isinstance(source, np.ndarray) else Image.open(source)
+        # Debug artifacts are collected for every Nth page and written in the background once the result is known
+        debug = PageDebug(image_file) if ocr_debug_dir is not None and (index - 1) % self.debug_every == 0 else None
+        text, final_angle, confidence = check_orientations(img, self.language, tessdata_dir_config, self.psm, self.check_orientation, debug, self.orientation_workers, self.estimate_orientation, self.proxy_scale, self.ocr_engine,
+                                                           self.fine_search, self.probe_budget, self.text_blocks)
+        if debug is not None:
+            submit_page_debug(ocr_debug_dir, debug, index, final_angle, confidence, self.debug_below_confidence, self.debug_angles == 'winner')
+        text_lines = text.split('\n')
+
+        json_output = {
+            "page_number": index,
+            "source_file": image_file,
+            **page_fields(image_file),
+            "final_angle": final_angle,
+            "confidence": confidence,
+            "text_lines": text_lines
+        }
+        logging.debug(f"Processed {image_file} with final angle: {final_angle}")
+
+        # Save processed image if required
+        if self.save_preprocessed:
+            processed_path = os.path.join(ocr_result_dir, f"processed_{image_file}")
+            if isinstance(img, np.ndarray):
+                cv2.imwrite(processed_path, img)
+            else:
+                img.save(processed_path)
+
+        json_output[PAGE_METRICS_KEY] = {"start": start, "seconds": time.perf_counter() - start_time, "orientation_probes": call_count('ocr_pass') - passes,
+                                         "pid": os.getpid(), "thread": threading.current_thread().name}
+        return json_output
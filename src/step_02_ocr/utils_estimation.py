@@ -0,0 +1,62 @@
+# File: step_02_ocr/utils_estimation.py
+
+import logging
+import cv2
+import pytesseract
+from imaging import MIN_INK_PIXELS, best_skew, ink_mask, to_grayscale_array
+
+# Tesseract's message for a page it cannot decide, as opposed to a missing binary or osd model
+OSD_PAGE_ERROR = 'Too few characters'
+
+# Set once OSD failed for another reason than the page; it is not tried again in this process
+_osd_unavailable = False
+
+def estimate_osd_rotation(image, tessdata_dir_config):
+    """Ask Tesseract OSD which way is up; returns a PIL rotation angle or None if OSD is unavailable.
+
+    OSD runs the tesseract binary once per page. If it fails for any other reason than
+    the page itself, the rest of the pages are estimated without it.
+    """
+    global _osd_unavailable
+    if _osd_unavailable:
+        return None
+    try:
+        osd = pytesseract.image_to_osd(image, config=tessdata_dir_config, output_type=pytesseract.Output.DICT)
+    except (pytesseract.TesseractError, pytesseract.TesseractNotFoundError) as e:
+        if OSD_PAGE_ERROR in str(e):
+            logging.debug(f"OSD could not orient this page: {e}")
+        else:
+            logging.warning(f"OSD is not available, orientation is estimated without it: {e}")
+            _osd_unavailable = True
+        return None
+    # OSD reports the clockwise rotation needed, PIL rotates counterclockwise
+    return (360 - int(osd['rotate'])) % 360
+
+def estimate_orientation(image, tessdata_dir_config, fine=True):
+    """Estimate the correction angle without OCR.
+
+    Returns candidate angles ordered by likelihood. The projection profile tells
+    whether text runs horizontally or vertically and how far it is skewed; it
+    cannot tell up from down, so the opposite direction is the second candidate
+    unless Tesseract OSD settles it.
+    """
+    binary = ink_mask(to_grayscale_array(image))
+    if cv2.countNonZero(binary) < MIN_INK_PIXELS:
+        return [0, 180]
+
+    horizontal_offset, horizontal_score = best_skew(binary, 0)
+    vertical_offset, vertical_score = best_skew(binary, 90)
+    if horizontal_score >= vertical_score:
+        quadrant, offset = 0, horizontal_offset
+    else:
+        quadrant, offset = 90, vertical_offset
+
+    osd_angle = estimate_osd_rotation(image, tessdata_dir_config)
+    if osd_angle is not None and osd_angle % 180 == quadrant:
+        quadrant = osd_angle
+
+    if not fine:
+        offset = 0
+    candidates = [quadrant + offset, (quadrant + 180) % 360 + offset]
+    logging.debug(f"Orientation estimate: candidates={candidates}, osd={osd_angle}, horizontal score={horizontal_score}, vertical score={vertical_score}")
+    return candidates
@@ -0,0 +1,125 @@
+# File: step_02_ocr/utils_layout.py
+
+import math
+import cv2
+import numpy as np
+from imaging import ink_mask
+
+# Constants for the text block detection, in multiples of the typical character height
+BLOCK_GAP = 1.5  # gaps narrower than this (between words and lines) are closed, wider ones (columns) separate blocks
+BLOCK_PADDING = 0.5  # white border kept around a block, Tesseract reads better with some margin
+# Components count as characters by their sides, whichever way the text runs
+CHARACTER_MIN_SIZE = 0.4  # of the longer side
+CHARACTER_MAX_THICKNESS = 3  # of the shorter side
+CHARACTER_MAX_LENGTH = 6  # longer components are rules, frames or parts of pictures
+MIN_CHARACTERS_PER_BLOCK = 2  # a page number is a block, a speck of dust is not
+MIN_CHARACTER_INK_RATIO = 0.5  # share of a block's ink in character-like components; below, it is a picture or decoration
+MIN_CHARACTER_COMPONENTS = 20  # with fewer the character height cannot be estimated, the page is OCRed whole
+MAX_TEXT_BLOCKS = 12  # more blocks (forms, tables) cost more OCR passes than they save, the page is OCRed whole
+MAX_BLOCK_COVERAGE = 0.85  # blocks covering more of the page save nothing, the page is OCRed whole
+
+def component_sides(stats):
+    """The longer and the shorter side of each component's box."""
+    widths, heights = stats[:, cv2.CC_STAT_WIDTH], stats[:, cv2.CC_STAT_HEIGHT]
+    return np.maximum(widths, heights), np.minimum(widths, heights)
+
+def character_height(stats):
+    """Median of the longer side of the components that could be characters (the height
+    of upright text), or None if there are too few."""
+    longer, _ = component_sides(stats[1:])
+    areas = stats[1:, cv2.CC_STAT_AREA]
+    sizes = longer[(areas >= 3) & (longer >= 3)]
+    if len(sizes) < MIN_CHARACTER_COMPONENTS:
+        return None
+    return float(np.median(sizes))
+
+def find_text_blocks(gray):
+    """Boxes (x, y, width, height) of the text blocks of a grayscale page, or [] if the
+    page should be OCRed whole.
+
+    Characters are merged into blocks by dilating the ink with a square kernel, so the
+    blocks do not depend on the orientation of the text. A block is kept if enough of
+    its ink is character-sized; pictures, rules and frames are dropped.
+    """
+    binary = ink_mask(gray)
+    scale = gray.shape[0] / binary.shape[0]
+    count, labels, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+    height = character_height(stats)
+    if height is None:
+        return []
+
+    gap = max(3, round(BLOCK_GAP * height))
+    dilated = cv2.dilate(binary, cv2.getStructuringElement(cv2.MORPH_RECT, (gap, gap)))
+    block_count, block_labels = cv2.connectedComponents(dilated, connectivity=8)
+    # Every component lies within one dilated block
+    ink = binary > 0
+    block_of = np.zeros(count, dtype=np.int32)
+    block_of[labels[ink]] = block_labels[ink]
+
+    longer, shorter = component_sides(stats)
+    is_character = ((longer >= CHARACTER_MIN_SIZE * height) & (longer <= CHARACTER_MAX_LENGTH * height)
+                    & (shorter <= CHARACTER_MAX_THICKNESS * height))
+    is_character[0] = False
+    block_ink = np.bincount(block_of[1:], weights=stats[1:, cv2.CC_STAT_AREA], minlength=block_count)
+    character_ink = np.bincount(block_of[is_character], weights=stats[is_character, cv2.CC_STAT_AREA], minlength=block_count)
+    characters = np.bincount(block_of[is_character], minlength=block_count)
+
+    padding = BLOCK_PADDING * height
+    blocks = []
+    for block in range(1, block_count):
+        if characters[block] < MIN_CHARACTERS_PER_BLOCK or character_ink[block] < MIN_CHARACTER_INK_RATIO * block_ink[block]:
+            continue
+        # The box of the characters only, so a frame around the text is left out
+        members = stats[(block_of == block) & is_character]
+        left = max(0, math.floor((members[:, cv2.CC_STAT_LEFT].min() - padding) * scale))
+        top = max(0, math.floor((members[:, cv2.CC_STAT_TOP].min() - padding) * scale))
+        right = min(gray.shape[1], math.ceil(((members[:, cv2.CC_STAT_LEFT] + members[:, cv2.CC_STAT_WIDTH]).max() + padding) * scale))
+        bottom = min(gray.shape[0], math.ceil(((members[:, cv2.CC_STAT_TOP] + members[:, cv2.CC_STAT_HEIGHT]).max() + padding) * scale))
+        blocks.append((left, top, right - left, bottom - top))
+
+    if not blocks or len(blocks) > MAX_TEXT_BLOCKS:
+        return []
+    if sum(block_width * block_height for _, _, block_width, block_height in blocks) > MAX_BLOCK_COVERAGE * gray.shape[0] * gray.shape[1]:
+        return []
+    return blocks
+
+def rotate_boxes(boxes, angle):
+    """The bounding boxes of boxes after rotating the page counterclockwise by angle
+    degrees (PIL convention), around the origin."""
+    cos, sin = math.cos(math.radians(angle)), math.sin(math.radians(angle))
+    rotated = []
+    for x, y, width, height in boxes:
+        corners = [(x + dx, y + dy) for dx in (0, width) for dy in (0, height)]
+        xs = [cx * cos + cy * sin for cx, cy in corners]
+        ys = [cy * cos - cx * sin for cx, cy in corners]
+        rotated.append((min(xs), min(ys), max(xs) - min(xs), max(ys) - min(ys)))
+    return rotated
+
+def widest_gap(boxes, indices, axis):
+    """(gap, before, after): the widest empty band between the boxes along axis (0: x,
+    1: y) and the boxes on either side of it."""
+    order = sorted(indices, key=lambda i: boxes[i][axis])
+    end = boxes[order[0]][axis] + boxes[order[0]][axis + 2]
+    gap, position = 0, None
+    for index in range(1, len(order)):
+        start = boxes[order[index]][axis]
+        if start - end > gap:
+            gap, position = start - end, index
+        end = max(end, start + boxes[order[index]][axis + 2])
+    if position is None:
+        return 0, order, []
+    return gap, order[:position], order[position:]
+
+def reading_order(boxes):
+    """Indices of the boxes in reading order, by recursive XY cut: the boxes are split
+    at the widest gap, columns are read left to right and rows top to bottom."""
+    def cut(indices):
+        if len(indices) <= 1:
+            return list(indices)
+        horizontal = widest_gap(boxes, indices, 1)
+        vertical = widest_gap(boxes, indices, 0)
+        gap, before, after = max(horizontal, vertical, key=lambda split: split[0])
+        if gap <= 0:
+            return sorted(indices, key=lambda i: (boxes[i][1], boxes[i][0]))
+        return cut(before) + cut(after)
+    return cut(list(range(len(boxes))))
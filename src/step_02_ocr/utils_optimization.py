@@ -1,28 +1,220 @@
 # File: step_02_ocr/utils_optimization.py
 
-import os
 import numpy as np
 from PIL import Image
 from step_02_ocr.utils_tesseract import tesseract_ocr
+from step_02_ocr.engines import DEFAULT_BACKEND
+from imaging import to_grayscale_array, to_pil_image
+from step_02_ocr.utils_estimation import estimate_orientation
+from step_02_ocr.utils_layout import find_text_blocks, reading_order, rotate_boxes
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
 # Constants for fine orientation checks
 DEFAULT_SMALL_ROTATION_STEP = 2  # degrees
 DEFAULT_MAX_ROTATION_STEPS = 10  # steps
 HIGH_CONFIDENCE_THRESHOLD = 95  # Set an appropriate threshold for high confidence
+ESTIMATE_CONFIRMATION_CONFIDENCE = 80  # OCR confidence that accepts an estimated angle without searching
+PROXY_MIN_CONFIDENCE = 70  # proxy scores below this are rescored at full resolution
 
-def rotate_image(image, angle, ocr_debug_dir):
+# Strategies of the FINE search around the best basic orientation
+FINE_SEARCH_STRATEGIES = ['linear', 'golden']
+# The linear walk stays the default: on upright pages below HIGH_CONFIDENCE_THRESHOLD it needs
+# fewer probes than golden, which pays off for pages skewed by several degrees
+DEFAULT_FINE_SEARCH = 'linear'
+DEFAULT_PROBE_BUDGET = 0  # OCR probes per page, including the four basic orientations (0: no limit)
+FINE_ANGLE_RESOLUTION = 1  # degrees, the golden-section search stops at brackets this narrow
+GOLDEN_RATIO = (5 ** 0.5 - 1) / 2
+
+# Thread pools for concurrent probes, keyed by size
+_probe_executors = {}
+
+def rotate_image(image, angle):
     """Rotate the image by a specific angle without cropping."""
-    rotated_image = image.rotate(angle, expand=True)
-    if ocr_debug_dir is not None:
-        rotated_image.save(os.path.join(ocr_debug_dir, f"angle_{angle}.jpg"))
-    return rotated_image
+    return image.rotate(angle, expand=True)
+
+class OrientationProber:
+    """Runs and memoizes OCR probes of one image at given angles.
+
+    With an executor, probes can be prefetched so several candidate angles are
+    OCRed concurrently while the search itself stays sequential.
+    """
+    def __init__(self, image, language, tessdata_dir_config, psm, ocr_debug, executor=None, backend=DEFAULT_BACKEND, budget=None):
+        self.image = image
+        self.language = language
+        self.tessdata_dir_config = tessdata_dir_config
+        self.psm = psm
+        self.ocr_debug = ocr_debug
+        self.executor = executor
+        self.backend = backend
+        self.budget = budget or None
+        self.futures = {}
+        self.results = {}
+        if ocr_debug is not None:
+            ocr_debug.set_source(image)
+
+    def ocr_at(self, angle):
+        rotated_image = rotate_image(self.image, angle)
+        return tesseract_ocr(rotated_image, self.language, self.tessdata_dir_config, self.psm, self.ocr_debug, angle, self.backend)
+
+    def spent(self):
+        """Probes that cost an OCR pass: done, or prefetched and already started. Prefetched
+        probes still waiting in the queue are cancelled if they are not needed."""
+        return len(self.results) + sum(1 for future in self.futures.values() if future.running() or future.done())
+
+    def can_probe(self, angle):
+        """Whether the angle was probed already or the probe budget allows another probe."""
+        if angle in self.results or angle in self.futures or self.budget is None:
+            return True
+        return self.spent() < self.budget
+
+    def prefetch(self, *angles):
+        if self.executor is None:
+            return
+        for angle in angles:
+            if angle not in self.results and angle not in self.futures and self.can_probe(angle):
+                self.futures[angle] = self.executor.submit(self.ocr_at, angle)
+
+    def cancel_pending(self):
+        """Drop speculative probes that were not needed for the result."""
+        for future in self.futures.values():
+            future.cancel()
+        self.futures.clear()
+
+    def probe(self, angle):
+        """Return (text, confidence) for the angle, waiting for a prefetched probe if there is one."""
+        if angle not in self.results:
+            future = self.futures.pop(angle, None)
+            self.results[angle] = future.result() if future is not None else self.ocr_at(angle)
+        return self.results[angle]
+
+def check_orientations(input_image, language, tessdata_dir_config, psm, check_orientation, ocr_debug, max_workers=1, estimate=False, proxy_scale=1.0, backend=DEFAULT_BACKEND,
+                       fine_search=DEFAULT_FINE_SEARCH, probe_budget=DEFAULT_PROBE_BUDGET, text_blocks=False):
+    if text_blocks:
+        blocks = find_text_blocks(to_grayscale_array(input_image))
+        if blocks:
+            return check_block_orientations(input_image, blocks, language, tessdata_dir_config, psm, check_orientation, ocr_debug, max_workers, estimate, proxy_scale, backend,
+                                            fine_search, probe_budget)
+        logging.debug("No usable text blocks found, OCRing the whole page")
 
-def check_orientations(input_image, language, tessdata_dir_config, psm, check_orientation, ocr_debug_dir):
     if check_orientation == 'NONE':
-        text, confidence = tesseract_ocr(input_image, language, tessdata_dir_config, psm, ocr_debug_dir, 0)
+        text, confidence = tesseract_ocr(input_image, language, tessdata_dir_config, psm, ocr_debug, 0, backend)
         return text, 0, confidence
 
+    # Rotations work on PIL images. Decode lazily loaded images once, before several threads rotate them
+    input_image = to_pil_image(input_image)
+    input_image.load()
+
+    executor = get_probe_executor(max_workers)
+    prober = OrientationProber(input_image, language, tessdata_dir_config, psm, ocr_debug, executor, backend, probe_budget)
+    return search_with_prober(prober, proxy_scale, psm, language, check_orientation, estimate, fine_search)
+
+def search_with_prober(prober, proxy_scale, psm, language, check_orientation, estimate, fine_search):
+    try:
+        if proxy_scale < 1:
+            result = search_on_proxy(prober, proxy_scale, psm, language, check_orientation, estimate, fine_search)
+            if result is not None:
+                return result
+        return find_orientation(prober, psm, language, check_orientation, estimate, fine_search)
+    finally:
+        prober.cancel_pending()
+
+def check_block_orientations(input_image, blocks, language, tessdata_dir_config, psm, check_orientation, ocr_debug, max_workers, estimate, proxy_scale, backend,
+                             fine_search, probe_budget):
+    """Search the orientation on the largest text block only, then OCR every block at
+    that angle (concurrently with max_workers) and join their text in reading order.
+
+    The debug artifacts of the largest block are those of the page, the other blocks
+    are scoped by their index.
+    """
+    input_image = to_pil_image(input_image)
+    input_image.load()
+    executor = get_probe_executor(max_workers)
+    largest = max(range(len(blocks)), key=lambda index: blocks[index][2] * blocks[index][3])
+    probers = []
+    for index, (x, y, width, height) in enumerate(blocks):
+        block_debug = ocr_debug.scoped(f"block_{index}") if ocr_debug is not None and index != largest else ocr_debug
+        probers.append(OrientationProber(input_image.crop((x, y, x + width, y + height)), language, tessdata_dir_config, psm, block_debug, executor, backend, probe_budget))
+
+    final_angle = 0
+    if check_orientation != 'NONE':
+        _, final_angle, _ = search_with_prober(probers[largest], proxy_scale, psm, language, check_orientation, estimate, fine_search)
+    try:
+        for prober in probers:
+            prober.prefetch(final_angle)
+        results = [prober.probe(final_angle) for prober in probers]
+    finally:
+        for prober in probers:
+            prober.cancel_pending()
+
+    order = reading_order(rotate_boxes(blocks, final_angle))
+    text = '\n'.join(results[index][0] for index in order if results[index][0])
+    confidence = combined_confidence(results)
+    logging.info(f"OCRed {len(blocks)} text blocks at orientation={final_angle}: confidence={confidence}")
+    return text, final_angle, confidence
+
+def combined_confidence(results):
+    """Confidence of the blocks' (text, confidence) results, weighted by text length.
+    Blocks with too few words to be rated (confidence 0) do not count."""
+    rated = [(len(text), confidence) for text, confidence in results if confidence > 0]
+    total = sum(length for length, _ in rated)
+    if total == 0:
+        return 0
+    return sum(length * confidence for length, confidence in rated) / total
+
+def get_probe_executor(max_workers):
+    """Thread pool shared by all pages of this process, so per-thread OCR engines stay loaded."""
+    if max_workers <= 1:
+        return None
+    if max_workers not in _probe_executors:
+        _probe_executors[max_workers] = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='orientation-probe')
+    return _probe_executors[max_workers]
+
+def scaled_proxy(image, scale):
+    """Downscaled copy of the image used to score candidate angles cheaply."""
+    width, height = image.size
+    return image.resize((max(1, round(width * scale)), max(1, round(height * scale))), Image.LANCZOS)
+
+def search_on_proxy(prober, proxy_scale, psm, language, check_orientation, estimate, fine_search=DEFAULT_FINE_SEARCH):
+    """Score the candidate angles on a downscaled proxy and OCR only the winner at full resolution.
+
+    Returns None when the proxy is not legible enough to trust its ranking, so the
+    caller can fall back to scoring at full resolution.
+    """
+    proxy_debug = prober.ocr_debug.scoped('proxy') if prober.ocr_debug is not None else None
+    proxy_prober = OrientationProber(scaled_proxy(prober.image, proxy_scale), prober.language, prober.tessdata_dir_config,
+                                     prober.psm, proxy_debug, prober.executor, prober.backend, prober.budget)
+    try:
+        _, angle, score = find_orientation(proxy_prober, psm, language, check_orientation, estimate, fine_search)
+    finally:
+        proxy_prober.cancel_pending()
+    if score < PROXY_MIN_CONFIDENCE:
+        logging.debug(f"Proxy score {score} at scale {proxy_scale} below {PROXY_MIN_CONFIDENCE}, searching at full resolution")
+        return None
+    text, confidence = prober.probe(angle)
+    logging.info(f"Orientation from proxy at scale {proxy_scale}: proxy score={score}, confidence={confidence}, orientation={angle}")
+    return text, angle, confidence
+
+def find_orientation(prober, psm, language, check_orientation, estimate, fine_search=DEFAULT_FINE_SEARCH):
+    if estimate:
+        result = confirm_estimated_orientation(prober, check_orientation)
+        if result is not None:
+            return result
+        logging.debug("Orientation estimate not confirmed, falling back to the full search")
+    return search_orientation(prober, psm, language, check_orientation, fine_search)
+
+def confirm_estimated_orientation(prober, check_orientation):
+    """OCR the estimated candidates and accept the first one that reads with high confidence."""
+    candidates = estimate_orientation(prober.image, prober.tessdata_dir_config, fine=check_orientation == 'FINE')
+    for angle in candidates:
+        text, confidence = prober.probe(angle)
+        logging.debug(f"Estimated angle={angle} confidence={confidence}, text length={len(text)}")
+        if confidence >= ESTIMATE_CONFIRMATION_CONFIDENCE:
+            logging.info(f"Orientation confirmed from estimate: confidence={confidence}, orientation={angle}")
+            return text, angle, confidence
+    return None
+
+def search_orientation(prober, psm, language, check_orientation, fine_search=DEFAULT_FINE_SEARCH):
     orientations = [0, 90, 180, 270]
     best_text = ''
     highest_score = -1
@@ -32,10 +224,10 @@ def check_orientations(input_image, language, tessdata_dir_config, psm, check_or
     logging.debug(f"Basic orientation check with psm={psm}, language={language}")
 
     # Basic orientation check
+    prober.prefetch(*orientations)
     results = []
     for angle in orientations:
-        rotated_image = rotate_image(input_image, angle, ocr_debug_dir)
-        text, confidence = tesseract_ocr(rotated_image, language, tessdata_dir_config, psm, ocr_debug_dir, angle)
+        text, confidence = prober.probe(angle)
         logging.debug(f"..... angle={angle} degrees, confidence={confidence}, text length={len(text)}")
         results.append((text, confidence, angle))
         if len(text) > max_text_length:
@@ -57,18 +249,59 @@ def check_orientations(input_image, language, tessdata_dir_config, psm, check_or
     logging.debug(f"Basic orientation correction result: Score={highest_score}, orientation={final_angle}")
 
     if check_orientation == 'FINE':
-        logging.debug(f"Fine orientation check around angle={final_angle}, direction 1")
-        step = DEFAULT_SMALL_ROTATION_STEP
+        search = golden_fine_search if fine_search == 'golden' else linear_fine_search
+        best_text, final_angle, highest_score = search(prober, best_text, final_angle, highest_score, max_text_length)
+
+    logging.info(f"Orientation correction result: Score={highest_score}, orientation={final_angle}")
+    return best_text, final_angle, highest_score
+
+def linear_fine_search(prober, best_text, final_angle, highest_score, max_text_length):
+    """Walk away from the best basic orientation in steps of growing size while the score
+    improves, first clockwise, then counterclockwise."""
+    logging.debug(f"Fine orientation check around angle={final_angle}, direction 1")
+    step = DEFAULT_SMALL_ROTATION_STEP
 
-        # Fine adjustments in one direction
+    # Fine adjustments in one direction
+    improved = True
+    while step <= DEFAULT_MAX_ROTATION_STEPS and improved:
+        adjusted_angle = final_angle + step
+        if not prober.can_probe(adjusted_angle):
+            logging.debug(f"Probe budget of {prober.budget} reached, fine check stopped at {final_angle}")
+            return best_text, final_angle, highest_score
+        if step == DEFAULT_SMALL_ROTATION_STEP:
+            # If the first probe does not improve, direction 2 starts with final_angle - DEFAULT_SMALL_ROTATION_STEP,
+            # so both members of the +/- pair are evaluated concurrently. After an improvement that angle is already probed.
+            prober.prefetch(adjusted_angle, final_angle - DEFAULT_SMALL_ROTATION_STEP)
+        adjusted_text, adjusted_confidence = prober.probe(adjusted_angle)
+        normalized_length = len(adjusted_text) / max_text_length if max_text_length > 0 else 0
+        adjusted_score = adjusted_confidence * normalized_length
+        logging.debug(f"Fine check at {adjusted_angle} degrees: Score={adjusted_score}, text length={len(adjusted_text)}")
+
+        if adjusted_score > highest_score:
+            highest_score = adjusted_score
+            best_text = adjusted_text
+            final_angle = adjusted_angle
+            improved = True
+        else:
+            improved = False
+
+        step += 1
+
+    logging.debug(f"Fine orientation check around angle={final_angle}, direction 2")
+
+    # If no improvement was found, try the other direction
+    if not improved:
+        step = DEFAULT_SMALL_ROTATION_STEP
         improved = True
         while step <= DEFAULT_MAX_ROTATION_STEPS and improved:
-            adjusted_angle = final_angle + step
-            adjusted_image = rotate_image(input_image, adjusted_angle, ocr_debug_dir)
-            adjusted_text, adjusted_confidence = tesseract_ocr(adjusted_image, language, tessdata_dir_config, psm, ocr_debug_dir, adjusted_angle)
+            adjusted_angle = final_angle - step
+            if not prober.can_probe(adjusted_angle):
+                logging.debug(f"Probe budget of {prober.budget} reached, fine check stopped at {final_angle}")
+                break
+            adjusted_text, adjusted_confidence = prober.probe(adjusted_angle)
             normalized_length = len(adjusted_text) / max_text_length if max_text_length > 0 else 0
             adjusted_score = adjusted_confidence * normalized_length
-            logging.debug(f"Fine check at {adjusted_angle} degrees: Score={adjusted_score}, text length={len(adjusted_text)}")
+            logging.debug(f"Fine check at {adjusted_angle} degrees: Score={adjusted_score}")
 
             if adjusted_score > highest_score:
                 highest_score = adjusted_score
@@ -80,29 +313,96 @@ def check_orientations(input_image, language, tessdata_dir_config, psm, check_or
 
             step += 1
 
-        logging.debug(f"Fine orientation check around angle={final_angle}, direction 2")
+    return best_text, final_angle, highest_score
 
-        # If no improvement was found, try the other direction
-        if not improved:
-            step = DEFAULT_SMALL_ROTATION_STEP
-            improved = True
-            while step <= DEFAULT_MAX_ROTATION_STEPS and improved:
-                adjusted_angle = final_angle - step
-                adjusted_image = rotate_image(input_image, adjusted_angle, ocr_debug_dir)
-                adjusted_text, adjusted_confidence = tesseract_ocr(adjusted_image, language, tessdata_dir_config, psm, ocr_debug_dir, adjusted_angle)
-                normalized_length = len(adjusted_text) / max_text_length if max_text_length > 0 else 0
-                adjusted_score = adjusted_confidence * normalized_length
-                logging.debug(f"Fine check at {adjusted_angle} degrees: Score={adjusted_score}")
-
-                if adjusted_score > highest_score:
-                    highest_score = adjusted_score
-                    best_text = adjusted_text
-                    final_angle = adjusted_angle
-                    improved = True
-                else:
-                    improved = False
-
-                step += 1
+def golden_fine_search(prober, best_text, final_angle, highest_score, max_text_length):
+    """Find the best angle within DEFAULT_MAX_ROTATION_STEPS degrees of the best basic
+    orientation, assuming the score has a single peak there.
 
-    logging.info(f"Orientation correction result: Score={highest_score}, orientation={final_angle}")
-    return best_text, final_angle, highest_score
+    Nothing is probed if the basic orientation already reads with HIGH_CONFIDENCE_THRESHOLD.
+    Otherwise the +/- DEFAULT_SMALL_ROTATION_STEP pair (prefetched together) shows the
+    side of the peak, the step grows by the golden ratio until the score drops, and the
+    bracket is narrowed golden-section style, one probe per round mirrored around the best
+    angle so far, until the neighbours of the best angle at FINE_ANGLE_RESOLUTION are known.
+    """
+    _, confidence = prober.probe(final_angle)
+    if confidence >= HIGH_CONFIDENCE_THRESHOLD:
+        logging.debug(f"Confidence {confidence} at {final_angle} reaches {HIGH_CONFIDENCE_THRESHOLD}, skipping the fine check")
+        return best_text, final_angle, highest_score
+
+    center = final_angle
+    texts = {center: best_text}
+    scores = {center: highest_score}
+
+    def score(angle):
+        """The score at angle, or None once the probe budget is spent."""
+        if angle not in scores:
+            if not prober.can_probe(angle):
+                logging.debug(f"Probe budget of {prober.budget} reached, fine check stopped")
+                return None
+            text, confidence = prober.probe(angle)
+            texts[angle] = text
+            scores[angle] = confidence * (len(text) / max_text_length if max_text_length > 0 else 0)
+            logging.debug(f"Fine check at {angle} degrees: Score={scores[angle]}, text length={len(text)}")
+        return scores[angle]
+
+    def best_angle():
+        # On ties the basic orientation wins
+        return max(scores, key=lambda angle: (scores[angle], angle == center))
+
+    step = DEFAULT_SMALL_ROTATION_STEP
+    prober.prefetch(center + step, center - step)
+    up, down = score(center + step), score(center - step)
+    if up is None or down is None:
+        final_angle = best_angle()
+        return texts[final_angle], final_angle, scores[final_angle]
+
+    # Bracket the peak between low and high, with the best score so far at inner
+    if up <= highest_score and down <= highest_score:
+        low, inner, high = center - step, center, center + step
+    else:
+        direction = 1 if up >= down else -1
+        limit = center + direction * DEFAULT_MAX_ROTATION_STEPS
+        outer, inner, farther = center, center + direction * step, None
+        while inner != limit:
+            farther = inner + direction * max(FINE_ANGLE_RESOLUTION, round((1 + GOLDEN_RATIO) * abs(inner - outer)))
+            farther = min(farther, limit) if direction > 0 else max(farther, limit)
+            if score(farther) is None:
+                final_angle = best_angle()
+                return texts[final_angle], final_angle, scores[final_angle]
+            if scores[farther] <= scores[inner]:
+                break
+            outer, inner, farther = inner, farther, None
+        # Without a drop the score still rose at the end of the range, which bounds the bracket
+        low, high = sorted((outer, farther if farther is not None else inner))
+
+    # Narrow the bracket, one probe per round; the best angle stays inside it
+    while True:
+        if low < inner < high:
+            if high - low <= 2 * FINE_ANGLE_RESOLUTION:
+                break
+            probe = low + high - inner
+            if probe == inner:
+                probe = inner - FINE_ANGLE_RESOLUTION if inner - low >= high - inner else inner + FINE_ANGLE_RESOLUTION
+        else:
+            if high - low <= FINE_ANGLE_RESOLUTION:
+                break
+            offset = max(FINE_ANGLE_RESOLUTION, round((1 - GOLDEN_RATIO) * (high - low)))
+            probe = inner - offset if inner == high else inner + offset
+        if score(probe) is None:
+            break
+        if low < inner < high:
+            left, right = sorted((inner, probe))
+            if scores[left] >= scores[right]:
+                high, inner = right, left
+            else:
+                low, inner = left, right
+        elif scores[probe] > scores[inner]:
+            inner = probe
+        elif inner == high:
+            low = probe
+        else:
+            high = probe
+
+    final_angle = best_angle()
+    return texts[final_angle], final_angle, scores[final_angle]
@@ -0,0 +1,132 @@
+# File: step_02_ocr/utils_screening.py
+import cv2
+import numpy as np
+from PIL import Image
+
+SCREENING_WIDTH = 600  # pages are screened on a copy scaled to this width
+INK_CONTRAST = 80  # gray levels between the background and ink; fainter marks (bleed-through) are no ink
+MIN_COMPONENT_AREA = 4  # pixels at SCREENING_WIDTH, smaller specks are scanner noise
+BLANK_MAX_COMPONENTS = 2  # a page with more marks than this is not blank
+BLANK_MAX_INK_RATIO = 0.001
+
+HASH_SIZE = 8  # the dHash compares (HASH_SIZE + 1) x HASH_SIZE neighbouring pixels, 64 bits
+# The hash only finds candidates: rescans of a page differ by up to ~17 bits (shift, skew,
+# noise), different pages with the same layout by as few as 8. The closest few candidates
+# are aligned to the page with ECC and must correlate well to count as duplicates; a
+# duplicate that is missed is merely OCRed again
+DUPLICATE_MAX_DISTANCE = 20  # bits
+DUPLICATE_CANDIDATES = 3
+DUPLICATE_MAX_ASPECT_CHANGE = 0.02
+THUMBNAIL_WIDTH = 300  # fine enough that lines of different words no longer look alike
+THUMBNAIL_BLUR = 1.0  # sigma, makes the alignment robust to sub-pixel shifts and noise
+ALIGNMENT_LEVELS = 3  # the alignment starts at 1/4 of the thumbnail width so larger shifts converge
+ALIGNMENT_ITERATIONS = 50
+ALIGNMENT_FILTER_SIZE = 5  # Gaussian smoothing of ECC's gradients, needed for shifts of several pixels
+DUPLICATE_MIN_CORRELATION = 0.95  # rescans of a page score ~0.98, different pages with the same layout up to ~0.91
+
+def screening_image(source):
+    """The page as a small grayscale array; source is a path, a PIL image or an array."""
+    if isinstance(source, str):
+        gray = cv2.imread(source, cv2.IMREAD_GRAYSCALE)
+    elif isinstance(source, Image.Image):
+        gray = np.asarray(source.convert('L'))
+    elif source.ndim == 3:
+        gray = cv2.cvtColor(source, cv2.COLOR_BGR2GRAY)
+    else:
+        gray = source
+    if gray is None:
+        raise ValueError(f"Could not read image {source}")
+    height, width = gray.shape
+    if width > SCREENING_WIDTH:
+        gray = cv2.resize(gray, (SCREENING_WIDTH, max(1, round(height * SCREENING_WIDTH / width))), interpolation=cv2.INTER_AREA)
+    return gray
+
+def screening_ink_mask(gray):
+    """Pixels that differ clearly from the background (the median), so white-on-black
+    images like Canny edges work as well. Unlike imaging.ink_mask (Otsu), faint marks
+    such as bleed-through are not ink."""
+    background = int(np.median(gray))
+    return (cv2.absdiff(gray, np.full_like(gray, background)) > INK_CONTRAST).astype(np.uint8)
+
+def is_blank(gray):
+    """Whether the page has (almost) no ink. Marks touching the page edge (scanner
+    borders, shadows) and specks are not counted."""
+    mask = screening_ink_mask(gray)
+    count, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    height, width = mask.shape
+    marks = 0
+    ink = 0
+    for left, top, box_width, box_height, area in stats[1:]:
+        if area < MIN_COMPONENT_AREA:
+            continue
+        if left == 0 or top == 0 or left + box_width == width or top + box_height == height:
+            continue
+        marks += 1
+        ink += area
+    return marks <= BLANK_MAX_COMPONENTS and ink <= BLANK_MAX_INK_RATIO * width * height
+
+def dhash(gray):
+    """64-bit difference hash: whether each pixel of a tiny copy is brighter than its right neighbour."""
+    small = cv2.resize(gray, (HASH_SIZE + 1, HASH_SIZE), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int(np.packbits(bits).view('>u8')[0])
+
+def thumbnail(gray):
+    height, width = gray.shape
+    small = cv2.resize(gray, (THUMBNAIL_WIDTH, max(1, round(height * THUMBNAIL_WIDTH / width))), interpolation=cv2.INTER_AREA)
+    return cv2.GaussianBlur(small, (0, 0), THUMBNAIL_BLUR)
+
+def aligned_correlation(template, image):
+    """Correlation of two thumbnails after aligning image to template with an affine
+    warp (ECC, coarse to fine), or -1 if the alignment fails."""
+    if template.shape != image.shape:
+        image = cv2.resize(image, (template.shape[1], template.shape[0]), interpolation=cv2.INTER_AREA)
+    template, image = template.astype(np.float32), image.astype(np.float32)
+    warp = np.eye(2, 3, dtype=np.float32)
+    criteria = (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, ALIGNMENT_ITERATIONS, 1e-4)
+    correlation = -1
+    for level in reversed(range(ALIGNMENT_LEVELS)):
+        scale = 0.5 ** level
+        if level < ALIGNMENT_LEVELS - 1:
+            warp[:, 2] *= 2
+        level_template, level_image = template, image
+        if level:
+            level_template = cv2.resize(template, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            level_image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        try:
+            correlation, warp = cv2.findTransformECC(level_template, level_image, warp, cv2.MOTION_AFFINE, criteria, None, ALIGNMENT_FILTER_SIZE)
+        except cv2.error:
+            return -1
+    return correlation
+
+def hash_distance(a, b):
+    return bin(a ^ b).count('1')
+
+class PageSignature:
+    def __init__(self, gray):
+        height, width = gray.shape
+        self.aspect = width / height
+        self.hash = dhash(gray)
+        self.thumbnail = thumbnail(gray)
+
+    def is_candidate(self, other):
+        return (abs(self.aspect - other.aspect) <= DUPLICATE_MAX_ASPECT_CHANGE * other.aspect
+                and hash_distance(self.hash, other.hash) <= DUPLICATE_MAX_DISTANCE)
+
+class DuplicateIndex:
+    """Signatures of the pages of a run, to find a page that was scanned twice."""
+    def __init__(self):
+        self.entries = []
+
+    def find(self, signature):
+        """The (page_number, image_file) of an earlier page the signature matches, or None.
+        Only the DUPLICATE_CANDIDATES closest hashes are compared in full."""
+        candidates = [entry for entry in self.entries if signature.is_candidate(entry[0])]
+        candidates.sort(key=lambda entry: hash_distance(signature.hash, entry[0].hash))
+        for entry_signature, page_number, image_file in candidates[:DUPLICATE_CANDIDATES]:
+            if aligned_correlation(entry_signature.thumbnail, signature.thumbnail) >= DUPLICATE_MIN_CORRELATION:
+                return page_number, image_file
+        return None
+
+    def add(self, signature, page_number, image_file):
+        self.entries.append((signature, page_number, image_file))
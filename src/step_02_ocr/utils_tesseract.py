@@ -1,17 +1,17 @@
 # File: step_02_ocr/utils_tesseract.py
-import pytesseract
 import logging
-import os
-import json
+from step_02_ocr.engines import DEFAULT_BACKEND, get_engine
+from metrics import count_call
 
 # Constants
 MIN_WORD_LENGTH_FOR_CONFIDENCE = 4
 MIN_WORD_COUNT_FOR_CONFIDENCE = 4
 MIN_CONFIDENCE_FOR_WORD = 60
 
-def tesseract_ocr(image, language, tessdata_dir_config, psm, ocr_debug_dir, angle):
-    config = f'--psm {psm} -l {language} {tessdata_dir_config}'
-    data = pytesseract.image_to_data(image, config=config, output_type=pytesseract.Output.DICT)
+def tesseract_ocr(image, language, tessdata_dir_config, psm, ocr_debug, angle, backend=DEFAULT_BACKEND):
+    engine = get_engine(language, tessdata_dir_config, psm, backend)
+    count_call('ocr_pass')
+    data = engine.image_to_data(image)
 
     lines = {}
     confidences = []
@@ -34,10 +34,7 @@ def tesseract_ocr(image, language, tessdata_dir_config, psm, ocr_debug_dir, angl
     else:
         average_confidence = sum(confidences) / len(confidences)
 
-    if ocr_debug_dir is not None:
-        debug_file_path = os.path.join(ocr_debug_dir, f"ocr_debug_data_angle_{angle}.json")
-        with open(debug_file_path, 'a', encoding='utf-8') as debug_file:
-            json.dump(data, debug_file, ensure_ascii=False, indent=4)
-            debug_file.write('\n')
+    if ocr_debug is not None:
+        ocr_debug.add(angle, data=data, confidence=average_confidence)
 
     return text, average_confidence
@@ -1,16 +1,39 @@
 import os
 import enchant
 import logging
-import json
 import re
 from pipeline_step import PipelineStep
+from corrections import CorrectionIndex, read_whitelist_candidates, resumed_suggestions
+from metrics import get_metrics
+from page_io import DEFAULT_OUTPUT_FORMAT, page_file, page_writer, read_pages, resumable_pages
+from dictionary_cache import CachedDictionary, cache_dir_from_args, dictionary_version
 
 class HyphenationStep(PipelineStep):
     CONTEXT_WORD_COUNT = 10  # Number of words before and after the word in question for context
+    MANIFEST_ARGS = ('language_enchanted', 'apply_corrections_globally')
 
     def __init__(self, args):
         self.args = args
-        self.dictionary = self.load_dictionary(args.language_enchanted)
+        self.apply_globally = getattr(args, 'apply_corrections_globally', False)
+        self.output_format = getattr(args, 'output_format', DEFAULT_OUTPUT_FORMAT)
+        self.resume = getattr(args, 'resume', False)
+        dictionary = self.load_dictionary(args.language_enchanted)
+        self.dictionary = CachedDictionary(dictionary, args.language_enchanted, cache_dir=cache_dir_from_args(args),
+                                           dictionary_version=dictionary_version(dictionary))
+
+    def manifest_inputs(self, input_data):
+        return [self.input_file(input_data)]
+
+    def manifest_outputs(self, input_data):
+        return list(self.output_files(input_data))
+
+    def output_files(self, input_data):
+        """Paths of the suggestions file, the whitelist candidates file and the output JSON."""
+        output_dir = f"{input_data}/hyphenation"
+        return f"{output_dir}/hyphenation_suggestions.txt", f"{output_dir}/hyphenation_whitelist_candidates.txt", page_file(output_dir, 'hyphenation_output', self.output_format)
+
+    def input_file(self, input_data):
+        return page_file(f"{input_data}/ocr_result", 'ocr_result', self.output_format)
 
     def load_dictionary(self, language):
         try:
@@ -21,45 +44,40 @@ class HyphenationStep(PipelineStep):
         return dictionary
 
     def run(self, input_data):
-        input_file = f"{input_data}/ocr_result/ocr_result.json"
+        input_file = self.input_file(input_data)
         output_dir = f"{input_data}/hyphenation"
-        suggestions_file = f"{output_dir}/hyphenation_suggestions.txt"
-        whitelist_candidates_file = f"{output_dir}/hyphenation_whitelist_candidates.txt"
-        output_file = f"{output_dir}/hyphenation_output.json"
+        suggestions_file, whitelist_candidates_file, output_file = self.output_files(input_data)
 
         logging.info(f"Input file: {input_file} suggestion file: {suggestions_file}, output file: {output_file}")
 
         os.makedirs(output_dir, exist_ok=True)
 
-        with open(input_file, "r") as f:
-            ocr_output = json.load(f)
+        # Pages stored by an interrupted run (--resume) are not looked up again, unless their
+        # corrections are also applied to the other pages
+        done = resumable_pages(output_file, self.resume, input_file)
+        looked_up = set() if self.apply_globally else done
 
+        # The pages are streamed from the input file twice: to collect the suggestions
+        # and, once all are known (and reviewed), to apply them
+        metrics = get_metrics()
         suggestions = []
-        for page_index, page in enumerate(ocr_output):
-            text_lines = page.get("text_lines", [])
-            for line_index, line in enumerate(text_lines):
-                logging.debug(f"Preparing suggestions for page {page_index} line {line_index}")
-                line_suggestions = self.generate_suggestions(page_index, line_index, text_lines)
-                suggestions.extend(line_suggestions)
-
+        # The suggestions of the pages that are not looked up again are kept from the interrupted run
+        carried, numbered = resumed_suggestions(suggestions_file, looked_up) if looked_up else ([], 0)
         with open(suggestions_file, "w") as f:
-            for idx, (page_index, line_index, original, proposed) in enumerate(suggestions):
-                if not proposed:
-                    continue  # Skip if there are no suggestions
-                if self.is_legitimate_word(proposed[0]):  # Prevent overwhelming the user with trivial changes
-                    continue  # COMMENT: Omit this message to prevent overwhelming the user
-                context = self.get_context(ocr_output[page_index]["text_lines"], line_index, original)
-                f.write(f"Proposed Change {idx+1}:\n\n")
-                f.write(f"Source File: {ocr_output[page_index]['source_file']}\n")
-                f.write(f"Page Number: {page_index + 1}\n")
-                f.write(f"Line Number: {line_index}\n")
-                f.write(f"Context: {context}\n\n")
-                f.write(f"now:      {original}\n")
-                f.write(f"then:      {proposed}\n\n")
-                f.write(f"{original}  --->   {proposed}\n")
-                f.write(f"--------------------------------------------\n\n")
+            f.writelines(carried)
+            for page_index, page in enumerate(read_pages(input_file)):
+                if page["source_file"] in looked_up:
+                    continue
+                with metrics.span('HyphenationStep.page', source_file=page["source_file"]):
+                    page_suggestions = self.page_suggestions(page_index, page)
+                for suggestion in page_suggestions:
+                    self.write_suggestion(f, numbered + len(suggestions), page, suggestion)
+                    suggestions.append(suggestion)
+        metrics.count('suggestions_total', len(suggestions), step='HyphenationStep')
 
         original_words = set(original for _, _, original, _ in suggestions)
+        if looked_up:
+            original_words.update(read_whitelist_candidates(whitelist_candidates_file))
         with open(whitelist_candidates_file, "w") as wf:
             for word in original_words:
                 wf.write(word + "\n")
@@ -68,18 +86,46 @@ class HyphenationStep(PipelineStep):
             input("Review the suggestions and press Enter to apply changes...")
 
         # Apply suggestions to the output JSON structure
-        for page in ocr_output:
-            text_lines = page.get("text_lines", [])
-            for i, line in enumerate(text_lines):
-                words = line.split()
-                corrected_line = " ".join([self.apply_suggestion(word, suggestions) for word in words])
-                text_lines[i] = corrected_line
-            page["text_lines"] = text_lines
-
-        with open(output_file, "w") as f:
-            json.dump(ocr_output, f, indent=4)
+        corrections = self.correction_index(suggestions)
+        with page_writer(output_file, append=bool(done)) as writer:
+            for page_index, page in enumerate(read_pages(input_file)):
+                if page["source_file"] in done:
+                    continue
+                corrections.apply(page_index, page)
+                writer.write(page)
+        self.dictionary.flush()
         return output_dir
 
+    def page_suggestions(self, page_index, page):
+        """Hyphenation suggestions (page_index, line_index, original, proposed) for one page."""
+        suggestions = []
+        text_lines = page.get("text_lines", [])
+        for line_index, line in enumerate(text_lines):
+            logging.debug(f"Preparing suggestions for page {page_index} line {line_index}")
+            line_suggestions = self.generate_suggestions(page_index, line_index, text_lines)
+            suggestions.extend(line_suggestions)
+        return suggestions
+
+    def write_suggestion(self, f, idx, page, suggestion):
+        page_index, line_index, original, proposed = suggestion
+        if not proposed:
+            return  # Skip if there are no suggestions
+        if self.is_legitimate_word(proposed[0]):  # Prevent overwhelming the user with trivial changes
+            return  # COMMENT: Omit this message to prevent overwhelming the user
+        context = self.get_context(page["text_lines"], line_index, original)
+        f.write(f"Proposed Change {idx+1}:\n\n")
+        f.write(f"Source File: {page['source_file']}\n")
+        f.write(f"Page Number: {page_index + 1}\n")
+        f.write(f"Line Number: {line_index}\n")
+        f.write(f"Context: {context}\n\n")
+        f.write(f"now:      {original}\n")
+        f.write(f"then:      {proposed}\n\n")
+        f.write(f"{original}  --->   {proposed}\n")
+        f.write(f"--------------------------------------------\n\n")
+
+    def correction_index(self, suggestions):
+        return CorrectionIndex(suggestions, apply_globally=self.apply_globally)
+
     def generate_suggestions(self, page_index, line_index, text_lines):
         suggestions = []
         current_line = text_lines[line_index].split()
@@ -118,12 +164,6 @@ class HyphenationStep(PipelineStep):
         end = min(len(words), index + self.CONTEXT_WORD_COUNT + 1)
         return " ".join(words[start:end])
 
-    def apply_suggestion(self, word, suggestions):
-        for page_index, line_index, original, proposed in suggestions:
-            if word == original:
-                return proposed if proposed else word
-        return word
-
     def is_word_valid(self, word):
         if not word.isalpha():
             return False
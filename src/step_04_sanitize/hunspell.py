@@ -0,0 +1,168 @@
+# File: step_04_sanitize/hunspell.py
+import os
+import re
+import codecs
+import logging
+
+# Flags of the .aff file that keep the stem itself out of the wordlist
+STEM_EXCLUDING_FLAGS = ('NEEDAFFIX', 'FORBIDDENWORD', 'ONLYINCOMPOUND')
+
+class AffixRule:
+    """One PFX or SFX line: strip these characters, add those, if the word matches condition."""
+    def __init__(self, strip, add, condition, continuation, suffix):
+        self.strip = '' if strip == '0' else strip
+        self.add = '' if add == '0' else add
+        self.continuation = continuation
+        self.suffix = suffix
+        pattern = condition_pattern(condition)
+        self.condition = re.compile(f"(?:{pattern})$" if suffix else f"^(?:{pattern})")
+
+    def apply(self, word):
+        """The derived word, or None if the rule does not apply to word."""
+        if self.suffix:
+            if not word.endswith(self.strip) or not self.condition.search(word):
+                return None
+            return word[:len(word) - len(self.strip)] + self.add
+        if not word.startswith(self.strip) or not self.condition.search(word):
+            return None
+        return self.add + word[len(self.strip):]
+
+def condition_pattern(condition):
+    """Translate a hunspell condition (characters, '.' and [...] classes) into a regular expression."""
+    if condition == '.':
+        return ''
+    pattern = []
+    in_class = False
+    for char in condition:
+        if char == '[':
+            in_class = True
+            pattern.append(char)
+        elif char == ']':
+            in_class = False
+            pattern.append(char)
+        elif in_class or char == '.':
+            pattern.append(char if char in '^.' else re.escape(char))
+        else:
+            pattern.append(re.escape(char))
+    return ''.join(pattern)
+
+def python_encoding(name):
+    """Python's name for the SET encoding of an .aff file (e.g. ISO8859-1, microsoft-cp1251)."""
+    name = name.lower().replace('microsoft-', '')
+    try:
+        codecs.lookup(name)
+    except LookupError:
+        logging.warning(f"Unknown hunspell encoding {name}, reading it as latin-1")
+        return 'latin-1'
+    return name
+
+def parse_flags(text, flag_type):
+    """The flags of a .dic entry or an affix continuation, by the FLAG type of the .aff file."""
+    if flag_type == 'long':
+        return [text[i:i + 2] for i in range(0, len(text), 2)]
+    if flag_type == 'num':
+        return [flag for flag in text.split(',') if flag]
+    return list(text)
+
+class AffixFile:
+    """The prefix and suffix rules of a hunspell .aff file, enough to expand the stems of
+    its .dic file into the surface forms a text contains. Compounding is not expanded."""
+    def __init__(self, path):
+        self.encoding = 'utf-8'
+        self.flag_type = 'ASCII'
+        self.aliases = []  # AF flag sets, referenced by number from the .dic file
+        self.excluding = set()
+        self.prefixes = {}
+        self.suffixes = {}
+        self.cross_product = set()
+        with open(path, 'rb') as f:
+            data = f.read()
+        match = re.search(rb'^SET\s+(\S+)', data, re.MULTILINE)
+        if match is not None:
+            self.encoding = python_encoding(match.group(1).decode('ascii'))
+        alias_header = True
+        for line in data.decode(self.encoding, errors='replace').splitlines():
+            fields = line.split()
+            if not fields or fields[0].startswith('#'):
+                continue
+            if fields[0] == 'FLAG' and len(fields) > 1:
+                self.flag_type = fields[1]
+            elif fields[0] == 'AF' and len(fields) > 1:
+                if alias_header:
+                    alias_header = False  # AF count
+                else:
+                    self.aliases.append(fields[1])
+            elif fields[0] in STEM_EXCLUDING_FLAGS and len(fields) > 1:
+                self.excluding.add(fields[1])
+            elif fields[0] in ('PFX', 'SFX') and len(fields) >= 4:
+                rules = self.suffixes if fields[0] == 'SFX' else self.prefixes
+                if fields[1] not in rules:
+                    # PFX/SFX flag cross_product count
+                    rules[fields[1]] = []
+                    if fields[2] == 'Y':
+                        self.cross_product.add(fields[1])
+                elif len(fields) >= 5:
+                    add, _, continuation = fields[3].partition('/')
+                    rules[fields[1]].append(AffixRule(fields[2], add, fields[4], self.flags(continuation), fields[0] == 'SFX'))
+
+    def flags(self, text):
+        """The flags of a .dic entry or an affix continuation, resolving AF aliases."""
+        if self.aliases and text.isdigit() and 0 < int(text) <= len(self.aliases):
+            text = self.aliases[int(text) - 1]
+        return parse_flags(text, self.flag_type)
+
+    def expand(self, stem, flags):
+        """The stem (unless a flag excludes it) and the words its affix flags derive from it,
+        including prefixed forms of suffixed words where both rules allow the cross product
+        and one more suffix from a suffix's continuation flags."""
+        forms = [] if self.excluding.intersection(flags) else [stem]
+        suffixed = []
+        for flag in flags:
+            for rule in self.suffixes.get(flag, ()):
+                form = rule.apply(stem)
+                if form is None:
+                    continue
+                if not self.excluding.intersection(rule.continuation):
+                    suffixed.append((form, flag))
+                for continuation in rule.continuation:
+                    for second in self.suffixes.get(continuation, ()):
+                        second_form = second.apply(form)
+                        if second_form is not None:
+                            suffixed.append((second_form, continuation))
+        forms.extend(form for form, _ in suffixed)
+        for flag in flags:
+            for rule in self.prefixes.get(flag, ()):
+                form = rule.apply(stem)
+                if form is not None:
+                    forms.append(form)
+                if flag not in self.cross_product:
+                    continue
+                for suffixed_form, suffix_flag in suffixed:
+                    if suffix_flag in self.cross_product:
+                        form = rule.apply(suffixed_form)
+                        if form is not None:
+                            forms.append(form)
+        return forms
+
+def affix_file(wordlist):
+    """The .aff file next to a hunspell .dic wordlist, or None."""
+    if not wordlist.endswith('.dic'):
+        return None
+    path = wordlist[:-len('.dic')] + '.aff'
+    return path if os.path.exists(path) else None
+
+def read_dic(path, affixes):
+    """The surface forms of the words of a hunspell .dic file, in file order, without duplicates."""
+    with open(path, 'r', encoding=affixes.encoding, errors='replace') as f:
+        lines = f.read().splitlines()
+    words = {}
+    for line_number, line in enumerate(lines):
+        line = line.strip()
+        if not line or line.startswith('#') or (line_number == 0 and line.isdigit()):
+            continue
+        entry = line.split()[0]
+        stem, _, flags = entry.partition('/')
+        for form in affixes.expand(stem, affixes.flags(flags)):
+            words.setdefault(form, None)
+    logging.info(f"Expanded {path} with {len(affixes.prefixes)} prefix and {len(affixes.suffixes)} suffix classes into {len(words)} words")
+    return list(words)
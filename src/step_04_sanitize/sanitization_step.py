@@ -1,17 +1,99 @@
 import os
 import enchant
 import logging
-import json
 import re
+import tempfile
+from contextlib import ExitStack
 from pipeline_step import PipelineStep
+from corrections import CorrectionIndex, first_proposal, read_whitelist_candidates, resumed_suggestions
+from metrics import get_metrics
+from page_io import DEFAULT_OUTPUT_FORMAT, page_file, page_writer, read_pages, resumable_pages
+from dictionary_cache import CachedDictionary, cache_dir_from_args, dictionary_version, whitelist_version
+from parallel import create_process_pool, pool_forks, resolve_workers
+from step_04_sanitize.hunspell import affix_file
+from step_04_sanitize.symspell import DEFAULT_SUGGESTION_BACKEND, SymSpellDictionary, find_wordlist, index_file, load_index, read_index, write_index
+from step_04_sanitize.whitelist import load_whitelist_index
+
+CHUNKS_PER_WORKER = 4  # unknown words are split into this many chunks per worker to balance the load
+
+# The dictionary of a worker process, loaded once by the pool initializer
+_worker_dictionary = None
+# The SymSpell index of the parent while it forks workers, which inherit it copy-on-write
+_shared_index = None
+
+def share_index(index):
+    global _shared_index
+    _shared_index = index
+
+def init_worker_dictionary(language, index_path=None):
+    """Suggestions come from the SymSpell index the parent shared when it forked the
+    worker, or else from the one pickled at index_path (workers started by a fork server)."""
+    global _worker_dictionary
+    _worker_dictionary = enchant.Dict(language)
+    if _shared_index is not None:
+        _worker_dictionary = SymSpellDictionary(_worker_dictionary, _shared_index)
+    elif index_path is not None:
+        _worker_dictionary = SymSpellDictionary(_worker_dictionary, read_index(index_path))
+
+def check_and_suggest(words):
+    """Returns (word, check result, suggestions or None) for each word, in a worker process."""
+    results = []
+    for word in words:
+        correct = _worker_dictionary.check(word)
+        results.append((word, correct, None if correct else _worker_dictionary.suggest(word)))
+    return results
 
 class SanitizationStep(PipelineStep):
     CONTEXT_WORD_COUNT = 10  # Number of words before and after the word in question for context
+    MANIFEST_ARGS = ('language', 'language_enchanted', 'whitelist_filter', 'apply_corrections_globally', 'suggestion_backend', 'wordlist')
 
     def __init__(self, args):
         self.args = args
-        self.dictionary = self.load_dictionary(args.language_enchanted)
+        self.apply_globally = getattr(args, 'apply_corrections_globally', False)
+        self.output_format = getattr(args, 'output_format', DEFAULT_OUTPUT_FORMAT)
+        self.resume = getattr(args, 'resume', False)
+        self.workers = resolve_workers(getattr(args, 'workers', 1))
         self.whitelist = self.load_whitelists(args.language, args.whitelist_filter)
+        self.suggestion_backend = getattr(args, 'suggestion_backend', DEFAULT_SUGGESTION_BACKEND)
+        self.wordlist = getattr(args, 'wordlist', None)
+        self.index = None
+        self.index_path = None
+        # Results of the worker processes by word, used by the serial pass of run()
+        self.prefetched = {}
+        dictionary = self.load_dictionary(args.language_enchanted)
+        # The SymSpell suggestions also change with its wordlist
+        version = dictionary_version(dictionary, self.wordlist_files() if self.suggestion_backend == 'symspell' else ())
+        if self.suggestion_backend == 'symspell':
+            self.index = load_index(args.language_enchanted, self.whitelist.words, self.wordlist, cache_dir_from_args(args))
+            self.index_path = index_file(args.language_enchanted, self.whitelist.words, self.wordlist, cache_dir_from_args(args))
+            dictionary = SymSpellDictionary(dictionary, self.index)
+        # Enchant's results do not depend on the whitelist, so they are shared with HyphenationStep;
+        # the SymSpell index contains the whitelist words
+        whitelist = whitelist_version(self.whitelist.entries) if self.suggestion_backend == 'symspell' else ''
+        self.dictionary = CachedDictionary(dictionary, args.language_enchanted, whitelist, cache_dir_from_args(args), backend=self.suggestion_backend,
+                                           dictionary_version=version)
+
+    def manifest_inputs(self, input_data):
+        inputs = [self.input_file(input_data)] + self.whitelist_files(self.args.language, self.args.whitelist_filter)
+        if self.suggestion_backend == 'symspell':
+            inputs.extend(self.wordlist_files())
+        return inputs
+
+    def wordlist_files(self):
+        """The wordlist of the SymSpell index and its hunspell .aff file, if there is one."""
+        wordlist = self.wordlist or find_wordlist(self.args.language_enchanted)
+        return [path for path in [wordlist, affix_file(wordlist)] if path is not None]
+
+    def manifest_outputs(self, input_data):
+        return list(self.output_files(input_data))
+
+    def output_files(self, input_data):
+        """Paths of the suggestions file, the whitelist candidates file and the output JSON."""
+        output_dir = f"{input_data}/sanitized"
+        return f"{output_dir}/suggestions.txt", f"{output_dir}/whitelist_candidates.txt", page_file(output_dir, 'sanitized_output', self.output_format)
+
+    def input_file(self, input_data):
+        return page_file(f"{input_data}/ocr_result", 'ocr_result', self.output_format)
 
     def load_dictionary(self, language):
         try:
@@ -21,29 +103,29 @@ class SanitizationStep(PipelineStep):
             raise ValueError(f"No dictionary found for language: {language}")
         return dictionary
 
-    def load_whitelists(self, language, filter_keywords):
-        whitelist = set()
+    def whitelist_files(self, language, filter_keywords):
+        """Paths of the whitelist files for the language: project resources first, then the input directory."""
+        paths = []
         project_whitelist_path = f"/workspace/resources"
         input_whitelist_path = f"{self.args.input_dir}"
 
-        def process_whitelist_file(path):
-            with open(path, "r") as f:
-                for line in f:
-                    line = line.split('#', 1)[0].strip()
-                    if line:
-                        whitelist.add(line)
-
         if os.path.exists(project_whitelist_path):
-            for filename in os.listdir(project_whitelist_path):
+            for filename in sorted(os.listdir(project_whitelist_path)):
                 if filename.startswith(f"spelling-whitelist-{language}") and self.filter_file(filename, filter_keywords):
-                    process_whitelist_file(os.path.join(project_whitelist_path, filename))
-                    logging.info(f"Loaded project-specific whitelist from {filename}")
+                    paths.append(os.path.join(project_whitelist_path, filename))
 
         if os.path.exists(input_whitelist_path):
-            for filename in os.listdir(input_whitelist_path):
+            for filename in sorted(os.listdir(input_whitelist_path)):
                 if filename.startswith(f"spelling-whitelist-{language}"):
-                    process_whitelist_file(os.path.join(input_whitelist_path, filename))
-                    logging.info(f"Loaded input directory whitelist from {filename}")
+                    paths.append(os.path.join(input_whitelist_path, filename))
+
+        return paths
+
+    def load_whitelists(self, language, filter_keywords):
+        """The compiled whitelist of the language, cached per input directory and --whitelist-filter combination."""
+        filter_name = ','.join(sorted(keyword.strip() for keyword in filter_keywords.split(','))) if filter_keywords else ''
+        whitelist = load_whitelist_index(self.whitelist_files(language, filter_keywords), f"{language}|{filter_name}|{os.path.abspath(self.args.input_dir)}",
+                                         cache_dir_from_args(self.args))
 
         if not whitelist:
             logging.warning(f"No whitelists found for language: {language}")
@@ -59,43 +141,43 @@ class SanitizationStep(PipelineStep):
         return False
 
     def run(self, input_data):
-        input_file = f"{input_data}/ocr_result/ocr_result.json"
+        input_file = self.input_file(input_data)
         output_dir = f"{input_data}/sanitized"
-        suggestions_file = f"{output_dir}/suggestions.txt"
-        whitelist_candidates_file = f"{output_dir}/whitelist_candidates.txt"
-        output_file = f"{output_dir}/sanitized_output.json"
+        suggestions_file, whitelist_candidates_file, output_file = self.output_files(input_data)
 
         logging.info(f"Input file: {input_file} suggestion file: {suggestions_file}, output file: {output_file}")
 
         os.makedirs(output_dir, exist_ok=True)
 
-        with open(input_file, "r") as f:
-            ocr_output = json.load(f)
+        # Pages stored by an interrupted run (--resume) are not looked up again, unless their
+        # corrections are also applied to the other pages
+        done = resumable_pages(output_file, self.resume, input_file)
+        looked_up = set() if self.apply_globally else done
+        if self.workers > 1:
+            self.prefetched = self.prefetch_lookups(page for page in read_pages(input_file) if page["source_file"] not in looked_up)
 
+        # The pages are streamed from the input file twice: to collect the suggestions
+        # and, once all are known (and reviewed), to apply them
+        metrics = get_metrics()
         suggestions = []
-        for page_index, page in enumerate(ocr_output):
-            text_lines = page.get("text_lines", [])
-            for line_index, line in enumerate(text_lines):
-                logging.debug(f"Preparing suggestions for page {page_index} line {line_index}")
-                line_suggestions = self.generate_suggestions(line, text_lines, line_index)
-                suggestions.extend([(page_index, line_index, word, sugg) for word, sugg in line_suggestions])
-
+        # The suggestions of the pages that are not looked up again are kept from the interrupted run
+        carried, numbered = resumed_suggestions(suggestions_file, looked_up) if looked_up else ([], 0)
         with open(suggestions_file, "w") as f:
-            for idx, (page_index, line_index, original, proposed) in enumerate(suggestions):
-                if not proposed:
-                    continue  # Skip if there are no suggestions
-                context = self.get_context(ocr_output[page_index]["text_lines"], line_index, original)
-                f.write(f"Proposed Change {idx+1}:\n\n")
-                f.write(f"Source File: {ocr_output[page_index]['source_file']}\n")
-                f.write(f"Page Number: {page_index + 1}\n")
-                f.write(f"Line Number: {line_index}\n")
-                f.write(f"Context: {context}\n\n")
-                f.write(f"now:      {original}\n")
-                f.write(f"then:      {proposed}\n\n")
-                f.write(f"{original}  --->   {proposed}\n")
-                f.write(f"--------------------------------------------\n\n")
+            f.writelines(carried)
+            for page_index, page in enumerate(read_pages(input_file)):
+                if page["source_file"] in looked_up:
+                    continue
+                with metrics.span('SanitizationStep.page', source_file=page["source_file"]):
+                    page_suggestions = self.page_suggestions(page_index, page)
+                for suggestion in page_suggestions:
+                    self.write_suggestion(f, numbered + len(suggestions), page, suggestion)
+                    suggestions.append(suggestion)
+        self.prefetched = {}
+        metrics.count('suggestions_total', len(suggestions), step='SanitizationStep')
 
         original_words = set(original for _, _, original, _ in suggestions)
+        if looked_up:
+            original_words.update(read_whitelist_candidates(whitelist_candidates_file))
         with open(whitelist_candidates_file, "w") as wf:
             for word in original_words:
                 wf.write(word + "\n")
@@ -104,20 +186,97 @@ class SanitizationStep(PipelineStep):
             input("Review the suggestions and press Enter to apply changes...")
 
         # Apply suggestions to the output JSON structure
+        corrections = self.correction_index(suggestions)
+        with page_writer(output_file, append=bool(done)) as writer:
+            for page_index, page in enumerate(read_pages(input_file)):
+                if page["source_file"] in done:
+                    continue
+                corrections.apply(page_index, page)
+                writer.write(page)
+        self.dictionary.flush()
+        return output_dir
+
+    def prefetch_lookups(self, ocr_output):
+        """Look up the unique words of the document across worker processes. Returns
+        (check result, suggestions or None) by word for the serial pass that follows,
+        so its output is the same as without workers. The results are also stored in
+        the dictionary cache, but its memory holds fewer entries than a large document
+        has words."""
+        words = set()
         for page in ocr_output:
             text_lines = page.get("text_lines", [])
-            for i, line in enumerate(text_lines):
-                words = line.split()
-                corrected_line = " ".join([self.apply_suggestion(word, suggestions) for word in words])
-                text_lines[i] = corrected_line
-            page["text_lines"] = text_lines
-
-        with open(output_file, "w") as f:
-            json.dump(ocr_output, f, indent=4)
-        return output_dir
+            for line_index, line in enumerate(text_lines):
+                words.update(word for _, word in self.lookup_words(line, text_lines, line_index))
+        words = [word for word in sorted(words) if not self.dictionary.is_cached('check', word)]
+        if not words:
+            return {}
+        chunk_count = min(len(words), self.workers * CHUNKS_PER_WORKER)
+        chunks = [words[i::chunk_count] for i in range(chunk_count)]
+        prefetched = {}
+        with ExitStack() as stack:
+            index_path = self.index_path
+            if self.index is not None and pool_forks():
+                # Every worker would otherwise unpickle its own copy of the index
+                share_index(self.index)
+                stack.callback(share_index, None)
+                index_path = None
+            elif self.index is not None and index_path is None:
+                # Without a cache directory the index reaches the workers through a temporary file
+                index_path = os.path.join(stack.enter_context(tempfile.TemporaryDirectory()), 'symspell.pickle')
+                write_index(self.index, index_path)
+            pool = stack.enter_context(create_process_pool(min(self.workers, chunk_count), init_worker_dictionary, (self.args.language_enchanted, index_path)))
+            for results in pool.map(check_and_suggest, chunks):
+                for word, correct, suggestions in results:
+                    prefetched[word] = (correct, suggestions)
+                    self.dictionary.add('check', word, correct)
+                    if suggestions is not None:
+                        self.dictionary.add('suggest', word, suggestions)
+        logging.info(f"Looked up {len(words)} words in {min(self.workers, chunk_count)} worker processes")
+        return prefetched
+
+    def page_suggestions(self, page_index, page):
+        """Spelling suggestions (page_index, line_index, original, proposed) for one page."""
+        suggestions = []
+        text_lines = page.get("text_lines", [])
+        for line_index, line in enumerate(text_lines):
+            logging.debug(f"Preparing suggestions for page {page_index} line {line_index}")
+            line_suggestions = self.generate_suggestions(line, text_lines, line_index)
+            suggestions.extend([(page_index, line_index, word, sugg) for word, sugg in line_suggestions])
+        return suggestions
+
+    def write_suggestion(self, f, idx, page, suggestion):
+        page_index, line_index, original, proposed = suggestion
+        if not proposed:
+            return  # Skip if there are no suggestions
+        context = self.get_context(page["text_lines"], line_index, original)
+        f.write(f"Proposed Change {idx+1}:\n\n")
+        f.write(f"Source File: {page['source_file']}\n")
+        f.write(f"Page Number: {page_index + 1}\n")
+        f.write(f"Line Number: {line_index}\n")
+        f.write(f"Context: {context}\n\n")
+        f.write(f"now:      {original}\n")
+        f.write(f"then:      {proposed}\n\n")
+        f.write(f"{original}  --->   {proposed}\n")
+        f.write(f"--------------------------------------------\n\n")
+
+    def correction_index(self, suggestions):
+        return CorrectionIndex(suggestions, replacement=first_proposal, apply_globally=self.apply_globally)
 
     def generate_suggestions(self, text, text_lines, line_index):
         suggestions = []
+        for original, word in self.lookup_words(text, text_lines, line_index):
+            if word in self.prefetched:
+                correct, word_suggestions = self.prefetched[word]
+                if not correct:
+                    suggestions.append((original, word_suggestions))
+            elif not self.dictionary.check(word):
+                suggestions.append((original, self.dictionary.suggest(word)))
+        return suggestions
+
+    def lookup_words(self, text, text_lines, line_index):
+        """(original, word to look up) pairs of a line: the words that are not whitelisted,
+        then a word hyphenated at the end of the line joined with the start of the next line."""
+        lookups = []
         words = text.split()
         for word in words:
             if not re.match(r'^[a-zA-ZäöüÄÖÜß]+$', word):
@@ -126,8 +285,7 @@ class SanitizationStep(PipelineStep):
                 continue
             if word in self.whitelist:
                 continue
-            if not self.dictionary.check(word):
-                suggestions.append((word, self.dictionary.suggest(word)))
+            lookups.append((word, word))
 
         if words and words[-1].endswith('-'):
             next_line = self.get_next_line(text_lines, line_index)
@@ -135,11 +293,9 @@ class SanitizationStep(PipelineStep):
                 next_words = next_line.split()
                 if next_words:
                     next_word = next_words[0]
-                    combined_word = words[-1][:-1] + next_word
-                    if not self.dictionary.check(combined_word):
-                        suggestions.append((words[-1], self.dictionary.suggest(combined_word)))
+                    lookups.append((words[-1], words[-1][:-1] + next_word))
 
-        return suggestions
+        return lookups
 
     def get_next_line(self, text_lines, line_index):
         if line_index + 1 < len(text_lines):
@@ -157,12 +313,6 @@ class SanitizationStep(PipelineStep):
         end = min(len(words), index + self.CONTEXT_WORD_COUNT + 1)
         return " ".join(words[start:end])
 
-    def apply_suggestion(self, word, suggestions):
-        for page_index, line_index, original, proposed in suggestions:
-            if word == original:
-                return proposed[0] if proposed else word
-        return word
-
     def parse_suggestions(self, suggestions_text):
         suggestions = []
         lines = suggestions_text.split("\n")
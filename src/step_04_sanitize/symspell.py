@@ -0,0 +1,228 @@
+# File: step_04_sanitize/symspell.py
+import os
+import pickle
+import hashlib
+import logging
+from step_04_sanitize.hunspell import AffixFile, affix_file, read_dic
+
+SUGGESTION_BACKENDS = ['enchant', 'symspell']
+DEFAULT_SUGGESTION_BACKEND = 'enchant'
+
+# Where the enchant hunspell provider finds its <language>.dic wordlists
+HUNSPELL_DIRS = ['/usr/share/hunspell', '/usr/share/myspell', '/usr/share/myspell/dicts']
+INDEX_FORMAT_VERSION = 3  # bump when the pickled index layout changes
+MAX_EDIT_DISTANCE = 2
+PREFIX_LENGTH = 7  # only the start of a word is indexed, as in SymSpell
+MAX_SUGGESTIONS = 10
+
+# Typical OCR confusions and their cost, cheaper than a plain edit (1).
+# Multi-character confusions like rn/m would otherwise cost two edits.
+OCR_CONFUSION_COST = 0.5
+OCR_CONFUSIONS = [
+    ('rn', 'm'), ('cl', 'd'), ('vv', 'w'), ('ii', 'u'), ('li', 'h'),
+    ('l', '1'), ('l', 'i'), ('i', '1'), ('o', '0'), ('e', 'c'), ('s', '5'), ('b', '6'),
+    ('h', 'b'), ('f', 't'), ('u', 'v'),
+    ('ü', 'u'), ('ä', 'a'), ('ö', 'o'), ('ß', 'b'), ('ß', 'ss'),
+]
+
+def confusion_costs():
+    """Both directions of every confusion, keyed by (seen, meant)."""
+    costs = {}
+    for a, b in OCR_CONFUSIONS:
+        costs[(a, b)] = costs[(b, a)] = OCR_CONFUSION_COST
+    return costs
+
+CONFUSION_COSTS = confusion_costs()
+SINGLE_CONFUSIONS = {pair: cost for pair, cost in CONFUSION_COSTS.items() if len(pair[0]) == 1 and len(pair[1]) == 1}
+
+MULTI_CONFUSIONS = [(seen, meant, cost) for (seen, meant), cost in CONFUSION_COSTS.items() if len(seen) > 1 or len(meant) > 1]
+# Cheapest way to change the length of a word by one character: an insertion, a deletion or a confusion like rn/m
+LENGTH_CHANGE_COST = min([1] + [cost / abs(len(seen) - len(meant)) for seen, meant, cost in MULTI_CONFUSIONS if len(seen) != len(meant)])
+
+def ocr_distance(source, target, max_distance=None):
+    """Damerau-Levenshtein distance (optimal string alignment) in which the OCR
+    confusions above are cheaper than other edits.
+
+    With max_distance, only the diagonals reachable within max_distance are computed,
+    and a value above max_distance is returned as soon as the distance must exceed it.
+    """
+    columns = len(target) + 1
+    band = len(source) + columns if max_distance is None else int(max_distance / LENGTH_CHANGE_COST)
+    unreachable = float('inf')
+    multi = [(seen, meant, cost) for seen, meant, cost in MULTI_CONFUSIONS if seen in source and meant in target]
+    above2 = None
+    above = [j if j <= band else unreachable for j in range(columns)]
+    for i in range(1, len(source) + 1):
+        row = [unreachable] * columns
+        if i <= band:
+            row[0] = i
+        char = source[i - 1]
+        for j in range(max(1, i - band), min(columns, i + band + 1)):
+            other = target[j - 1]
+            best = above[j - 1] if char == other else above[j - 1] + SINGLE_CONFUSIONS.get((char, other), 1)
+            if above[j] + 1 < best:
+                best = above[j] + 1
+            if row[j - 1] + 1 < best:
+                best = row[j - 1] + 1
+            if i > 1 and j > 1 and char == target[j - 2] and source[i - 2] == other and above2[j - 2] + 1 < best:
+                best = above2[j - 2] + 1
+            for seen, meant, cost in multi:
+                if i >= len(seen) and j >= len(meant) and source.endswith(seen, 0, i) and target.endswith(meant, 0, j):
+                    previous = above if len(seen) == 1 else above2
+                    best = min(best, previous[j - len(meant)] + cost)
+            row[j] = best
+        # A confusion or transposition reaches back two rows, so both must exceed the limit
+        if max_distance is not None and min(row) > max_distance and min(above) > max_distance:
+            return min(row)
+        above2, above = above, row
+    return above[-1]
+
+def delete_levels(word, max_distance=MAX_EDIT_DISTANCE):
+    """The strings made from word by deleting 0, 1, ... max_distance characters, by level."""
+    levels = [{word}]
+    for _ in range(max_distance):
+        levels.append({candidate[:i] + candidate[i + 1:] for candidate in levels[-1] for i in range(len(candidate))})
+    return levels
+
+def deletes(word, max_distance=MAX_EDIT_DISTANCE):
+    """The word and all strings made from it by deleting up to max_distance characters."""
+    return set().union(*delete_levels(word, max_distance))
+
+def read_wordlist(path):
+    """(word, frequency) pairs of a hunspell .dic file, a plain wordlist or a SymSpell
+    frequency list ("word count" lines). Words without a count get frequency 0.
+
+    The stems of a .dic file are expanded by the affix rules of the .aff file next to
+    it, so inflected forms can be suggested; without one only the stems are read.
+    """
+    affixes = affix_file(path)
+    if affixes is not None:
+        return [(word, 0) for word in read_dic(path, AffixFile(affixes))]
+    with open(path, 'rb') as f:
+        data = f.read()
+    try:
+        text = data.decode('utf-8')
+    except UnicodeDecodeError:
+        text = data.decode('latin-1')
+    words = []
+    for line_number, line in enumerate(text.splitlines()):
+        line = line.strip()
+        if not line or line.startswith('#') or (line_number == 0 and line.isdigit()):
+            continue
+        fields = line.split('/', 1)[0].split()
+        if not fields:
+            continue
+        count = int(fields[1]) if len(fields) > 1 and fields[1].isdigit() else 0
+        words.append((fields[0], count))
+    return words
+
+def find_wordlist(language):
+    for directory in HUNSPELL_DIRS:
+        path = os.path.join(directory, f"{language}.dic")
+        if os.path.exists(path):
+            return path
+    raise ValueError(f"No hunspell wordlist found for language: {language} (searched {', '.join(HUNSPELL_DIRS)})")
+
+class SymSpellIndex:
+    """Symmetric delete spelling correction: the deletes of every dictionary word are
+    precomputed, so a lookup only needs the deletes of the query and a handful of
+    distance computations instead of a scan over the dictionary."""
+    def __init__(self, words, max_distance=MAX_EDIT_DISTANCE, prefix_length=PREFIX_LENGTH):
+        """words are (word, frequency) pairs; equally close suggestions are ordered by
+        frequency, then by their position in words (wordlists are often sorted by frequency)."""
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.words = {}
+        self.deletes = {}
+        for word, count in words:
+            key = word.lower()
+            if key in self.words:
+                continue
+            self.words[key] = (word, count, len(self.words))
+            for delete in deletes(key[:prefix_length], max_distance):
+                self.deletes.setdefault(delete, []).append(key)
+
+    def lookup(self, word, max_suggestions=MAX_SUGGESTIONS):
+        """The closest dictionary words within max_distance of word, most frequent first.
+
+        Like SymSpell's "closest" verbosity, only the suggestions of the smallest distance
+        are returned; the limit shrinks as closer words are found, which lets most
+        distance computations stop after a few rows.
+        """
+        query = word.lower()
+        limit = self.max_distance
+        closest = []
+        visited = set()
+        for level in delete_levels(query[:self.prefix_length], self.max_distance):
+            for delete in level:
+                for candidate in self.deletes.get(delete, ()):
+                    if candidate in visited:
+                        continue
+                    visited.add(candidate)
+                    if abs(len(candidate) - len(query)) * LENGTH_CHANGE_COST > limit:
+                        continue
+                    distance = ocr_distance(query, candidate, limit)
+                    if distance < limit:
+                        limit, closest = distance, [candidate]
+                    elif distance == limit:
+                        closest.append(candidate)
+        closest.sort(key=lambda candidate: (-self.words[candidate][1], self.words[candidate][2]))
+        return [match_case(word, self.words[candidate][0]) for candidate in closest[:max_suggestions]]
+
+def match_case(word, suggestion):
+    """Carry an all-caps or capitalized query over to a lowercase dictionary word."""
+    if word.isupper() and len(word) > 1:
+        return suggestion.upper()
+    if word[:1].isupper() and suggestion[:1].islower():
+        return suggestion[:1].upper() + suggestion[1:]
+    return suggestion
+
+def index_file(language, whitelist, wordlist=None, cache_dir=None):
+    """Path of the cached index built from the wordlist and whitelist, or None without cache_dir."""
+    if cache_dir is None:
+        return None
+    wordlist = wordlist or find_wordlist(language)
+    files = [wordlist] + [path for path in [affix_file(wordlist)] if path is not None]
+    stats = '|'.join(f"{os.path.abspath(path)}|{os.stat(path).st_size}|{os.stat(path).st_mtime_ns}" for path in files)
+    identity = f"{INDEX_FORMAT_VERSION}|{stats}|{MAX_EDIT_DISTANCE}|{PREFIX_LENGTH}|" + '\n'.join(sorted(whitelist))
+    return os.path.join(cache_dir, f"symspell-{language}-{hashlib.sha256(identity.encode('utf-8')).hexdigest()[:16]}.pickle")
+
+def read_index(path):
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+def write_index(index, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.tmp', 'wb') as f:
+        pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(path + '.tmp', path)
+
+def load_index(language, whitelist, wordlist=None, cache_dir=None):
+    """Build the index for the language wordlist plus the whitelist, or load it from
+    cache_dir if it was built from the same files before."""
+    wordlist = wordlist or find_wordlist(language)
+    path = index_file(language, whitelist, wordlist, cache_dir)
+    if path is not None:
+        try:
+            index = read_index(path)
+            logging.info(f"Loaded SymSpell index {path}")
+            return index
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            pass
+    index = SymSpellIndex(read_wordlist(wordlist) + [(word, 0) for word in sorted(whitelist)])
+    logging.info(f"Built SymSpell index for {language}: {len(index.words)} words, {len(index.deletes)} deletes")
+    if path is not None:
+        write_index(index, path)
+    return index
+
+class SymSpellDictionary:
+    """Enchant's check() with suggestions from a SymSpell index."""
+    def __init__(self, dictionary, index):
+        self.dictionary = dictionary
+        self.index = index
+
+    def check(self, word):
+        return self.dictionary.check(word)
+
+    def suggest(self, word):
+        return self.index.lookup(word)
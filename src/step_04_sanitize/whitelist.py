@@ -0,0 +1,109 @@
+# File: step_04_sanitize/whitelist.py
+import os
+import re
+import pickle
+import hashlib
+import logging
+from manifest import fingerprint
+
+INDEX_FORMAT_VERSION = 1  # bump when the pickled index layout changes
+
+# Entry kinds of a whitelist line; a line without a marker is an exact entry
+CASEFOLD_MARKER = 'casefold:'  # casefold:Kaiser also accepts KAISER and kaiser
+PREFIX_MARKER = 'prefix:'  # prefix:Bundes accepts Bundesrat, Bundestag, ...
+REGEX_MARKER = 're:'  # re:[IVXLC]+ must match the whole word
+
+def parse_whitelist(path):
+    """The entries of a whitelist file: one per line, '#' starts a comment."""
+    entries = []
+    with open(path, "r") as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if line:
+                entries.append(line)
+    return entries
+
+class WhitelistIndex:
+    """Whitelist entries compiled for fast membership tests with `word in index`.
+
+    Exact and case-folded entries are set lookups, prefixes are looked up by the
+    prefix lengths that occur, and all regex entries are combined into one pattern
+    that is only tried when nothing else matched.
+    """
+    def __init__(self, entries=()):
+        self.entries = []
+        self.exact = set()
+        self.casefolded = set()
+        self.prefixes = set()
+        self.prefix_lengths = []
+        self.regex = None
+        patterns = []
+        for entry in entries:
+            self.entries.append(entry)
+            if entry.startswith(CASEFOLD_MARKER):
+                self.casefolded.add(entry[len(CASEFOLD_MARKER):].strip().casefold())
+            elif entry.startswith(PREFIX_MARKER):
+                self.prefixes.add(entry[len(PREFIX_MARKER):].strip())
+            elif entry.startswith(REGEX_MARKER):
+                pattern = entry[len(REGEX_MARKER):].strip()
+                try:
+                    re.compile(pattern)
+                except re.error as e:
+                    raise ValueError(f"Invalid whitelist pattern {pattern!r}: {e}")
+                patterns.append(f"(?:{pattern})")
+            else:
+                self.exact.add(entry)
+        self.prefix_lengths = sorted({len(prefix) for prefix in self.prefixes})
+        if patterns:
+            self.regex = re.compile('|'.join(patterns))
+
+    def __contains__(self, word):
+        if word in self.exact:
+            return True
+        if self.casefolded and word.casefold() in self.casefolded:
+            return True
+        for length in self.prefix_lengths:
+            if length > len(word):
+                break
+            if word[:length] in self.prefixes:
+                return True
+        return self.regex is not None and self.regex.fullmatch(word) is not None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __bool__(self):
+        return bool(self.entries)
+
+    @property
+    def words(self):
+        """The whitelisted words that can be offered as suggestions: exact and case-folded entries."""
+        return self.exact | self.casefolded
+
+def load_whitelist_index(paths, name, cache_dir=None):
+    """The compiled index of the whitelist files, loaded from cache_dir when none of the
+    files changed since it was built. Every name (e.g. language and filter) keeps its
+    own cache file."""
+    identity = [INDEX_FORMAT_VERSION] + [(os.path.abspath(path), fingerprint(path)) for path in paths]
+    cache_path = None
+    if cache_dir is not None:
+        cache_path = os.path.join(cache_dir, f"whitelist-{hashlib.sha256(name.encode('utf-8')).hexdigest()[:16]}.pickle")
+        try:
+            with open(cache_path, 'rb') as f:
+                cached_identity, index = pickle.load(f)
+            if cached_identity == identity:
+                logging.info(f"Loaded compiled whitelist {cache_path} ({len(index)} entries)")
+                return index
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            pass
+    entries = []
+    for path in paths:
+        entries.extend(parse_whitelist(path))
+        logging.info(f"Loaded whitelist from {path}")
+    index = WhitelistIndex(entries)
+    if cache_path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(cache_path + '.tmp', 'wb') as f:
+            pickle.dump((identity, index), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(cache_path + '.tmp', cache_path)
+    return index
@@ -0,0 +1,172 @@
+# File: streaming.py
+import os
+import copy
+import time
+import queue
+import logging
+import threading
+from metrics import get_metrics
+from profiling import profile_step
+from page_io import page_writer, read_pages, resumable_pages
+from step_01_preprocess.preprocess_step import PreprocessStep
+from step_02_ocr.ocr_step import OCRStep
+from step_03_hyphenation.hyphenation_step import HyphenationStep
+from step_04_sanitize.sanitization_step import SanitizationStep
+
+STREAM_BUFFER_SIZE = 4  # pages buffered between two stages
+QUEUE_POLL_INTERVAL = 0.1  # seconds, how often a blocked stage checks for a failure elsewhere
+
+_END = object()
+
+class StreamAborted(Exception):
+    """Raised to the consumer of a stage that stopped before its last page, so its own
+    writers do not finish a truncated file as if it were complete."""
+
+class StageThread(threading.Thread):
+    """Runs one stage (a generator over the pages of the previous stage) and hands its
+    pages on through a bounded queue, so a fast stage waits for a slow one instead of
+    buffering the whole document."""
+    def __init__(self, name, stage, source, stop_event, maxsize=STREAM_BUFFER_SIZE):
+        super().__init__(name=name, daemon=True)
+        self.stage = stage
+        self.source = source
+        self.stop_event = stop_event
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.error = None
+
+    def run(self):
+        try:
+            with get_metrics().step(self.name, streaming=True), profile_step(self.name, own_thread_only=True):
+                pages = self.stage(self.source)
+                try:
+                    for page in pages:
+                        if not self.put(page):
+                            return
+                finally:
+                    # A stage stopped by a failure elsewhere leaves its writers unfinished too
+                    pages.close()
+        except StreamAborted:
+            logging.info(f"Streaming stage {self.name} stopped, an earlier stage failed")
+        except Exception as e:
+            logging.exception(f"Streaming stage {self.name} failed")
+            self.error = e
+            self.stop_event.set()
+        finally:
+            self.put(_END)
+
+    def put(self, item):
+        while not self.stop_event.is_set():
+            try:
+                self.queue.put(item, timeout=QUEUE_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def __iter__(self):
+        while True:
+            try:
+                item = self.queue.get(timeout=QUEUE_POLL_INTERVAL)
+            except queue.Empty:
+                if self.stop_event.is_set() and not self.is_alive():
+                    raise StreamAborted(f"Streaming stage {self.name} stopped before its last page")
+                continue
+            if item is _END:
+                return
+            yield item
+
+def preprocess_stage(step, input_directory, in_memory=False):
+    """Preprocess the input images one at a time; yields (image_file, path or array)."""
+    if in_memory:
+        yield from step.iter_processed(input_directory)
+        return
+    preprocessed_dir = os.path.join(input_directory, 'preprocessed')
+    os.makedirs(preprocessed_dir, exist_ok=True)
+    pages = step.input_pages(input_directory)
+    tasks = [(source, os.path.join(preprocessed_dir, image_file)) for image_file, source in pages]
+    # The generator goes first so it runs to completion and logs its timings
+    for _, (image_file, _), (_, output_path) in zip(step.preprocess_pages(tasks), pages, tasks):
+        yield image_file, output_path
+
+def ocr_stage(step, input_directory, pages):
+    """OCR pages as they arrive and append them to the OCR result file; yields the page
+    results. With --resume, pages stored by an interrupted run are passed on from the
+    file instead of being recognized again."""
+    output_file = step.output_file(input_directory)
+    done = resumable_pages(output_file, step.resume)
+    results = step.recognize(input_directory, pages, skip=done)
+    if done:
+        yield from read_pages(output_file)
+    with page_writer(output_file, ensure_ascii=False, append=bool(done)) as writer:
+        for result in results:
+            writer.write(result)
+            yield result
+
+def text_stage(step, input_directory, pages):
+    """Suggest and apply corrections page by page; writes the step's outputs and passes
+    the unmodified OCR pages on, just like the batch steps all read the OCR result file."""
+    suggestions_file, whitelist_candidates_file, output_file = step.output_files(input_directory)
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    original_words = set()
+    idx = 0
+    metrics = get_metrics()
+    name = type(step).__name__
+    with open(suggestions_file, "w") as f, page_writer(output_file) as writer:
+        for page_index, page in enumerate(pages):
+            with metrics.span(f"{name}.page", source_file=page["source_file"]):
+                suggestions = step.page_suggestions(page_index, page)
+            metrics.count('suggestions_total', len(suggestions), step=name)
+            for suggestion in suggestions:
+                step.write_suggestion(f, idx, page, suggestion)
+                idx += 1
+            f.flush()
+            original_words.update(original for _, _, original, _ in suggestions)
+            corrected = copy.deepcopy(page)
+            step.correction_index(suggestions).apply(page_index, corrected)
+            writer.write(corrected)
+            yield page
+
+    with open(whitelist_candidates_file, "w") as wf:
+        for word in original_words:
+            wf.write(word + "\n")
+    step.dictionary.flush()
+
+def run_streaming_pipeline(args, input_directory):
+    """Run all steps concurrently, page by page, connected by bounded queues.
+
+    Corrections are applied per page, so --apply-corrections-globally only reaches the
+    words of the page a suggestion was made on. Interactive review is not available in
+    this mode.
+    """
+    if getattr(args, 'interactive_mode', False):
+        logging.warning("Interactive mode is ignored when streaming")
+    start_time = time.perf_counter()
+    preprocess, ocr = PreprocessStep(args), OCRStep(args)
+    hyphenation, sanitization = HyphenationStep(args), SanitizationStep(args)
+    stop_event = threading.Event()
+
+    stages = [
+        StageThread('PreprocessStep', lambda _: preprocess_stage(preprocess, input_directory, getattr(args, 'in_memory', False)), None, stop_event),
+    ]
+    stages.append(StageThread('OCRStep', lambda pages: ocr_stage(ocr, input_directory, pages), stages[-1], stop_event))
+    stages.append(StageThread('HyphenationStep', lambda pages: text_stage(hyphenation, input_directory, pages), stages[-1], stop_event))
+    stages.append(StageThread('SanitizationStep', lambda pages: text_stage(sanitization, input_directory, pages), stages[-1], stop_event))
+    for stage in stages:
+        stage.start()
+
+    page_count = 0
+    aborted = None
+    try:
+        for page in stages[-1]:
+            page_count += 1
+            logging.info(f"Page {page['page_number']} ({page['source_file']}) streamed through all steps after {time.perf_counter() - start_time:.1f}s")
+    except StreamAborted as e:
+        aborted = e
+
+    for stage in stages:
+        stage.join()
+        if stage.error is not None:
+            raise RuntimeError(f"Streaming stage {stage.name} failed") from stage.error
+    if aborted is not None:
+        raise aborted
+    logging.info(f"Streamed {page_count} pages in {time.perf_counter() - start_time:.1f}s")
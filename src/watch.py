@@ -0,0 +1,194 @@
+# File: watch.py
+import os
+import copy
+import json
+import time
+import shutil
+import logging
+import threading
+from dictionary_cache import cache_dir_from_args
+from metrics import metrics_dir_from_args, reset_metrics
+from profiling import disable_profiling, enable_profiling, profile_dir_from_args, profile_step
+from step_01_preprocess.documents import DOCUMENT_EXTENSIONS, IMAGE_EXTENSIONS, input_pages
+
+try:
+    import inotify_simple
+except ImportError:
+    inotify_simple = None
+
+DOCUMENTS_DIR_NAME = 'documents'  # one working directory per document, inside the input directory
+DOCUMENT_RECORD = 'document.json'
+DEFAULT_POLL_INTERVAL = 1.0  # seconds between two scans of the input directory
+
+def is_document(filename):
+    """Input files the pipeline reads; hidden files are left alone while they are being copied."""
+    return not filename.startswith('.') and (filename.lower().endswith(DOCUMENT_EXTENSIONS) or filename.endswith(IMAGE_EXTENSIONS))
+
+class DirectoryWatcher:
+    """Finds the documents of a directory that are complete and not processed yet.
+
+    A file is complete when inotify reports it was closed after writing or moved in, or
+    when its size and modification time did not change between two scans. Without
+    inotify_simple (or inotify) the directory is only scanned every poll_interval.
+    """
+    def __init__(self, directory, poll_interval=DEFAULT_POLL_INTERVAL):
+        self.directory = directory
+        self.poll_interval = poll_interval
+        self.last_scan = {}
+        self.inotify = None
+        if inotify_simple is not None:
+            try:
+                self.inotify = inotify_simple.INotify()
+                self.inotify.add_watch(directory, inotify_simple.flags.CLOSE_WRITE | inotify_simple.flags.MOVED_TO)
+            except OSError as e:
+                logging.warning(f"inotify is not available ({e}), polling {directory}")
+                self.inotify = None
+        logging.info(f"Watching {directory} " + ("with inotify" if self.inotify is not None else f"every {poll_interval}s"))
+
+    def wait(self, stop_event):
+        """Names of the files completed while waiting for the next event or scan."""
+        if self.inotify is None:
+            stop_event.wait(self.poll_interval)
+            return set()
+        return {event.name for event in self.inotify.read(timeout=round(self.poll_interval * 1000))}
+
+    def scan(self, processed, completed=()):
+        """(filename, signature) of the complete documents whose signature (size,
+        modification time) is not the one in processed."""
+        scan = {}
+        ready = []
+        for entry in sorted(os.scandir(self.directory), key=lambda entry: entry.name):
+            if not is_document(entry.name) or not entry.is_file():
+                continue
+            stat = entry.stat()
+            signature = [stat.st_size, stat.st_mtime_ns]
+            scan[entry.name] = signature
+            if processed.get(entry.name) != signature and (entry.name in completed or self.last_scan.get(entry.name) == signature):
+                ready.append((entry.name, signature))
+        self.last_scan = scan
+        return ready
+
+    def close(self):
+        if self.inotify is not None:
+            self.inotify.close()
+
+class WarmPipeline:
+    """The steps, created once so the Tesseract engines, Enchant dictionaries, whitelists
+    and suggestion indexes stay loaded from one document to the next.
+
+    Process pools (--workers > 1) are still started per document; with workers=1 the
+    Tesseract engines of the daemon process itself stay loaded.
+    """
+    def __init__(self, args, steps):
+        self.args = args
+        self.steps = [(name, step_class(args)) for name, step_class in steps]
+        self.in_memory = getattr(args, 'in_memory', False) and [name for name, _ in self.steps[:2]] == ['PreprocessStep', 'OCRStep']
+
+    def run(self, directory, metrics):
+        steps = self.steps
+        if self.in_memory:
+            (_, preprocess), (_, ocr) = steps[:2]
+            with metrics.step('InMemoryOCRStep'), profile_step('InMemoryOCRStep'):
+                ocr.run(directory, preprocess.iter_processed(directory))
+            steps = steps[2:]
+        for name, step in steps:
+            with metrics.step(name), profile_step(name):
+                step.run(directory)
+
+def document_dir(input_directory, filename):
+    return os.path.join(input_directory, DOCUMENTS_DIR_NAME, filename)
+
+def load_processed(input_directory):
+    """Signatures of the documents processed (or failed) before, by file name."""
+    processed = {}
+    documents_dir = os.path.join(input_directory, DOCUMENTS_DIR_NAME)
+    if not os.path.isdir(documents_dir):
+        return processed
+    for filename in os.listdir(documents_dir):
+        try:
+            with open(os.path.join(documents_dir, filename, DOCUMENT_RECORD), encoding='utf-8') as f:
+                processed[filename] = json.load(f)["signature"]
+        except (FileNotFoundError, ValueError, KeyError):
+            continue
+    return processed
+
+def prepare_document(input_directory, filename):
+    """Link (or copy) the document into its own working directory. The outputs of an
+    earlier version of the document are removed; those of an interrupted run are kept
+    for --resume."""
+    directory = document_dir(input_directory, filename)
+    if os.path.exists(os.path.join(directory, DOCUMENT_RECORD)):
+        shutil.rmtree(directory)
+    os.makedirs(directory, exist_ok=True)
+    source, target = os.path.join(input_directory, filename), os.path.join(directory, filename)
+    if os.path.exists(target):
+        os.remove(target)
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+    return directory
+
+def process_document(pipeline, args, input_directory, filename, signature):
+    """Run the steps on one document and write its metrics and document.json record,
+    also when a step fails. Returns the record."""
+    start_time = time.perf_counter()
+    directory = prepare_document(input_directory, filename)
+    metrics = reset_metrics(tracing=getattr(args, 'trace', False))
+    profile_dir = profile_dir_from_args(args, directory)
+    if profile_dir is not None:
+        enable_profiling(profile_dir)
+    record = {"source_file": filename, "signature": signature, "directory": directory}
+    try:
+        record["pages"] = len(input_pages(directory))
+        pipeline.run(directory, metrics)
+        record["status"] = "done"
+    except Exception as e:
+        logging.exception(f"Processing {filename} failed")
+        record.update(status="failed", error=str(e))
+    finally:
+        disable_profiling()
+        metrics_dir = getattr(args, 'metrics_dir', None) and os.path.join(args.metrics_dir, filename)
+        record["metrics_dir"] = metrics.write(metrics_dir or metrics_dir_from_args(args, directory))
+    record["seconds"] = time.perf_counter() - start_time
+    with open(os.path.join(directory, DOCUMENT_RECORD), 'w', encoding='utf-8') as f:
+        json.dump(record, f, indent=4)
+    logging.info(f"Processed {filename} ({record.get('pages', 0)} pages) in {record['seconds']:.2f}s: {record['status']}, results in {directory}")
+    return record
+
+def run_watch(args, input_directory, steps, stop_event=None, poll_interval=DEFAULT_POLL_INTERVAL):
+    """Process every document that appears in (or changes in) input_directory, one at a
+    time with warm steps, until stop_event is set. Documents processed before a restart
+    are not processed again."""
+    stop_event = stop_event or threading.Event()
+    args = copy.copy(args)
+    if not getattr(args, 'no_cache', False):
+        # Share the OCR cache between the documents, like the dictionary caches
+        args.cache_dir = cache_dir_from_args(args) or os.path.join(input_directory, 'cache')
+    if getattr(args, 'streaming', False):
+        logging.warning("Streaming mode is not available with --watch, documents are processed step by step")
+    if getattr(args, 'interactive_mode', False):
+        logging.warning("Interactive mode is ignored with --watch")
+        args.interactive_mode = False
+
+    start_time = time.perf_counter()
+    pipeline = WarmPipeline(args, steps)
+    logging.info(f"Loaded {len(steps)} steps in {time.perf_counter() - start_time:.1f}s")
+    processed = load_processed(input_directory)
+    watcher = DirectoryWatcher(input_directory, poll_interval)
+    try:
+        completed = set()
+        while not stop_event.is_set():
+            for filename, signature in watcher.scan(processed, completed):
+                if stop_event.is_set():
+                    break
+                try:
+                    process_document(pipeline, args, input_directory, filename, signature)
+                except OSError as e:
+                    # Removed again, or not readable; it is retried once it changes
+                    logging.error(f"Could not process {filename}: {e}")
+                processed[filename] = signature
+            completed = watcher.wait(stop_event)
+    finally:
+        watcher.close()
+    logging.info("Stopped watching")
@@ -0,0 +1,76 @@
+import os
+import pytest
+from PIL import Image
+from step_01_preprocess import documents
+from step_01_preprocess.documents import close_documents, input_pages, page_fields, read_page
+
+@pytest.mark.unit
+def test_tiff_frames_are_pages(tmpdir):
+    frames = [Image.new('RGB', (40, 20), color) for color in ('white', 'black', 'red')]
+    frames[0].save(str(tmpdir.join('fax.tiff')), save_all=True, append_images=frames[1:])
+    Image.new('RGB', (40, 20), 'white').save(str(tmpdir.join('photo.png')))
+    tmpdir.join('notes.txt').write('not a page')
+
+    pages = input_pages(str(tmpdir))
+    assert [image_file for image_file, _ in pages] == ['fax.tiff.p0001.png', 'fax.tiff.p0002.png', 'fax.tiff.p0003.png', 'photo.png']
+    assert pages[2][1] == (str(tmpdir.join('fax.tiff')), 3)
+
+    red = read_page(pages[2][1])
+    assert red.shape == (20, 40, 3)
+    assert tuple(red[0, 0]) == (0, 0, 255)  # BGR, like cv2.imread
+    assert read_page(pages[1][1]).max() == 0
+
+@pytest.mark.unit
+def test_pdf_pages_are_rendered_at_the_requested_dpi(tmpdir):
+    pymupdf = pytest.importorskip('pymupdf')
+    document = pymupdf.open()
+    for _ in range(2):
+        document.new_page(width=144, height=72)  # points, 2 x 1 inch
+    document.save(str(tmpdir.join('scan.pdf')))
+
+    pages = input_pages(str(tmpdir))
+    assert [image_file for image_file, _ in pages] == ['scan.pdf.p0001.png', 'scan.pdf.p0002.png']
+    assert read_page(pages[1][1], dpi=100).shape == (100, 200, 3)
+
+@pytest.mark.unit
+def test_pdf_pages_are_rendered_from_one_open_document(tmpdir, monkeypatch):
+    pymupdf = pytest.importorskip('pymupdf')
+    document = pymupdf.open()
+    for _ in range(3):
+        document.new_page(width=144, height=72)
+    document.save(str(tmpdir.join('scan.pdf')))
+    pages = input_pages(str(tmpdir))
+    opened = []
+    open_document = pymupdf.open
+    monkeypatch.setattr(pymupdf, 'open', lambda path: opened.append(path) or open_document(path))
+
+    try:
+        for _, source in pages:
+            read_page(source, dpi=50)
+    finally:
+        close_documents()
+
+    assert opened == [str(tmpdir.join('scan.pdf'))]
+
+@pytest.mark.unit
+def test_page_counts_are_cached_until_the_document_changes(tmpdir, monkeypatch):
+    path = str(tmpdir.join('fax.tiff'))
+    frames = [Image.new('RGB', (40, 20), color) for color in ('white', 'black')]
+    frames[0].save(path, save_all=True, append_images=frames[1:])
+    counted = []
+    page_count = documents.page_count
+    monkeypatch.setattr(documents, 'page_count', lambda path: counted.append(path) or page_count(path))
+
+    assert len(input_pages(str(tmpdir))) == 2
+    assert len(input_pages(str(tmpdir))) == 2
+    assert len(counted) == 1
+
+    frames[0].save(path, save_all=True, append_images=frames[1:] * 2)
+    os.utime(path, ns=(0, 0))
+    assert len(input_pages(str(tmpdir))) == 3
+    assert len(counted) == 2
+
+@pytest.mark.unit
+def test_page_fields():
+    assert page_fields('scan.pdf.p0012.png') == {"document": "scan.pdf", "document_page": 12}
+    assert page_fields('photo.png') == {}
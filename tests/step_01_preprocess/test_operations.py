@@ -0,0 +1,38 @@
+import cv2
+import numpy as np
+import pytest
+from argparse import Namespace
+from step_01_preprocess.operations import MORPH_KERNEL, PreprocessChain
+
+def make_args(**flags):
+    args = dict(grayscale=False, remove_noise=False, threshold=0, dilate=False, erode=False, opening=False, canny=False, deskew=False)
+    args.update(flags)
+    return Namespace(**args)
+
+def page(seed):
+    image = np.full((60, 80, 3), 255, np.uint8)
+    rng = np.random.default_rng(seed)
+    image[rng.integers(0, 60, 200), rng.integers(0, 80, 200)] = 0
+    return image
+
+@pytest.mark.unit
+def test_chain_matches_the_operations_applied_one_by_one():
+    chain = PreprocessChain(make_args(grayscale=True, remove_noise=True, threshold=1, dilate=True, erode=True))
+    image = page(0)
+
+    expected = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    expected = cv2.medianBlur(expected, 5)
+    _, expected = cv2.threshold(expected, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    expected = cv2.dilate(expected, MORPH_KERNEL, iterations=1)
+    expected = cv2.erode(expected, MORPH_KERNEL, iterations=1)
+
+    assert np.array_equal(chain(image), expected)
+    assert set(chain.timings) == {'grayscale', 'remove_noise', 'threshold', 'dilate', 'erode'}
+
+@pytest.mark.unit
+def test_results_do_not_share_reused_buffers():
+    chain = PreprocessChain(make_args(grayscale=True, opening=True, deskew=True))
+    first = chain(page(1))
+    first_copy = first.copy()
+    chain(page(2))
+    assert np.array_equal(first, first_copy)
@@ -0,0 +1,44 @@
+import logging
+import numpy as np
+import pytest
+from PIL import Image
+from step_02_ocr import engines
+from step_02_ocr.engines import PytesseractEngine, TesserocrEngine, get_engine, resolve_backend, tessdata_dir_from_config
+
+@pytest.mark.unit
+def test_tessdata_dir_from_config():
+    assert tessdata_dir_from_config('--tessdata-dir "/usr/share/tesseract-ocr/4.00/tessdata"') == '/usr/share/tesseract-ocr/4.00/tessdata'
+    assert tessdata_dir_from_config('') is None
+
+@pytest.mark.unit
+def test_get_engine_is_cached_per_configuration():
+    engine = get_engine('eng', '', 6, 'pytesseract')
+    assert isinstance(engine, PytesseractEngine)
+    assert get_engine('eng', '', 6, 'pytesseract') is engine
+    assert get_engine('deu', '', 6, 'pytesseract') is not engine
+
+@pytest.mark.unit
+def test_auto_fallback_is_reported_once(monkeypatch, caplog):
+    monkeypatch.setattr(engines, 'tesserocr', None)
+    monkeypatch.setattr(engines, '_fallbacks_reported', set())
+    with caplog.at_level(logging.WARNING):
+        assert resolve_backend('auto') == 'pytesseract'
+        assert resolve_backend('auto') == 'pytesseract'
+    assert len([record for record in caplog.records if 'falls back to pytesseract' in record.message]) == 1
+
+class RecordingAPI:
+    def SetImageBytes(self, imagedata, width, height, bytes_per_pixel, bytes_per_line):
+        self.call = (imagedata, width, height, bytes_per_pixel, bytes_per_line)
+
+@pytest.mark.unit
+def test_tesserocr_gets_the_pixels_without_a_copy():
+    engine = TesserocrEngine.__new__(TesserocrEngine)
+    engine.api = RecordingAPI()
+    page = np.full((40, 60), 255, np.uint8)
+    engine.set_image(page)
+    buffer, width, height, bytes_per_pixel, bytes_per_line = engine.api.call
+    assert np.shares_memory(np.frombuffer(buffer, np.uint8), page)
+    assert (width, height, bytes_per_pixel, bytes_per_line) == (60, 40, 1, 60)
+
+    engine.set_image(Image.fromarray(page).convert('RGB'))
+    assert engine.api.call[1:] == (60, 40, 3, 180)
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+from step_02_ocr import ocr_cache
+from step_02_ocr.ocr_cache import OCRCache, array_digest, tessdata_version
+
+ENTRY = {"final_angle": 90, "confidence": 91.5, "text_lines": ["This is a test image with text."]}
+
+@pytest.mark.unit
+def test_cache_hit_and_miss(tmpdir):
+    cache = OCRCache(str(tmpdir), {"language": "eng", "psm": 6})
+    key = cache.key("digest-1")
+    assert cache.get(key) is None
+    cache.put(key, ENTRY)
+    cache.close()
+
+    reopened = OCRCache(str(tmpdir), {"language": "eng", "psm": 6})
+    assert reopened.get(reopened.key("digest-1")) == ENTRY
+    assert (reopened.hits, reopened.misses) == (1, 0)
+
+@pytest.mark.unit
+def test_stored_results_survive_a_run_that_never_closes_the_cache(tmpdir):
+    cache = OCRCache(str(tmpdir), {"language": "eng", "psm": 6})
+    cache.put(cache.key("digest-1"), ENTRY)
+
+    # A second process reads the entry while the first one is still open (or crashed)
+    other = OCRCache(str(tmpdir), {"language": "eng", "psm": 6})
+    assert other.get(other.key("digest-1")) == ENTRY
+
+@pytest.mark.unit
+def test_tessdata_version_follows_the_engine_in_use(tmpdir, monkeypatch):
+    class FakeTesserocr:
+        @staticmethod
+        def tesseract_version():
+            return "tesseract 5.3.0"
+    monkeypatch.setattr(ocr_cache, 'tesserocr', FakeTesserocr)
+    monkeypatch.setattr(ocr_cache.pytesseract, 'get_tesseract_version', lambda: "4.1.1")
+
+    assert tessdata_version("eng", str(tmpdir), 'tesserocr') == "tesseract 5.3.0|eng:missing"
+    assert tessdata_version("eng", str(tmpdir), 'pytesseract') == "4.1.1|eng:missing"
+
+@pytest.mark.unit
+def test_config_is_part_of_the_key(tmpdir):
+    english = OCRCache(str(tmpdir), {"language": "eng", "psm": 6})
+    german = OCRCache(str(tmpdir), {"language": "deu", "psm": 6})
+    assert english.key("digest-1") != german.key("digest-1")
+
+@pytest.mark.unit
+def test_least_recently_used_entry_is_evicted(tmpdir):
+    cache = OCRCache(str(tmpdir), {"language": "eng"}, max_bytes=250)
+    for digest in ("a", "b"):
+        cache.put(cache.key(digest), ENTRY)
+    cache.get(cache.key("a"))
+    cache.put(cache.key("c"), ENTRY)
+
+    assert cache.get(cache.key("b")) is None
+    assert cache.get(cache.key("a")) == ENTRY
+    assert cache.get(cache.key("c")) == ENTRY
+
+@pytest.mark.unit
+def test_array_digest_depends_on_shape_and_content():
+    image = np.zeros((4, 6), np.uint8)
+    assert array_digest(image) == array_digest(image.copy())
+    assert array_digest(image) != array_digest(image.reshape(6, 4))
+    changed = image.copy()
+    changed[0, 0] = 255
+    assert array_digest(image) != array_digest(changed)
@@ -0,0 +1,42 @@
+import os
+import json
+import pytest
+from PIL import Image
+from step_02_ocr.ocr_debug import DEBUG_DATA_FILE, PageDebug, close_debug_writer, submit_page_debug
+
+def probed_page():
+    page = PageDebug("scan.png")
+    page.set_source(Image.new('L', (8, 4)))
+    proxy = page.scoped('proxy')
+    for angle in (0, 90):
+        page.add(angle, data={"text": [f"word{angle}"], "conf": [90]}, confidence=40 + angle / 10)
+    proxy.add(90, data={"text": ["proxy"], "conf": [80]}, confidence=80)
+    return page
+
+def read_probes(directory):
+    with open(os.path.join(directory, DEBUG_DATA_FILE), encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+@pytest.mark.unit
+def test_debug_artifacts_are_written_in_the_background(tmpdir):
+    directory = str(tmpdir)
+    submit_page_debug(directory, probed_page(), 3, 90, 49.0)
+    close_debug_writer()
+
+    probes = read_probes(directory)
+    assert [(probe["scope"], probe["angle"], probe["winner"]) for probe in probes] == [("full", 0, False), ("full", 90, True), ("proxy", 90, False)]
+    assert probes[1]["page_number"] == 3 and probes[1]["data"]["text"] == ["word90"]
+    assert sorted(f for f in os.listdir(directory) if f.endswith('.jpg')) == ["scan.png.angle_0.jpg", "scan.png.angle_90.jpg"]
+    # Rendered again from the page at the probed angle
+    assert Image.open(os.path.join(directory, "scan.png.angle_90.jpg")).size == (4, 8)
+
+@pytest.mark.unit
+def test_debug_artifacts_are_sampled(tmpdir):
+    directory = str(tmpdir)
+    submit_page_debug(directory, probed_page(), 1, 90, 96.0, below_confidence=80)
+    submit_page_debug(directory, probed_page(), 2, 90, 49.0, below_confidence=80, winner_only=True)
+    close_debug_writer()
+
+    probes = read_probes(directory)
+    assert [(probe["page_number"], probe["angle"]) for probe in probes] == [(2, 90)]
+    assert sorted(f for f in os.listdir(directory) if f.endswith('.jpg')) == ["scan.png.angle_90.jpg"]
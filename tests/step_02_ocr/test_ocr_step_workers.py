@@ -0,0 +1,69 @@
+import os
+import time
+import numpy as np
+import pytest
+from argparse import Namespace
+from unittest import mock
+from PIL import Image
+from page_io import read_pages
+import parallel
+from parallel import MAX_ORIENTATION_WORKERS, WORKER_CV2_THREADS, WORKER_OMP_THREAD_LIMIT, resolve_orientation_workers
+from step_02_ocr import ocr_step
+from step_02_ocr.ocr_step import OCRStep
+
+PAGES = 6
+
+def read_gray_level(img, *args, **kwargs):
+    """Stands in for the orientation search: the text is the gray level of the page.
+    Earlier pages take longer, so the workers finish them out of order."""
+    level = int(np.asarray(img).mean())
+    time.sleep(0.02 * (PAGES - level // 10))
+    return f"gray level {level}\nsecond line", 0, float(level)
+
+class FakeTesseractOCRStep(OCRStep):
+    """At module level so the worker processes can unpickle its ocr_page."""
+    def ocr_page(self, page):
+        with mock.patch.object(ocr_step, 'check_orientations', read_gray_level):
+            return super().ocr_page(page)
+
+def run_ocr(directory, workers):
+    args = Namespace(language='eng', path_to_tesseract='/tessdata', check_orientation='BASIC', psm=6, save_preprocessed=False,
+                     workers=workers, no_cache=True)
+    step = FakeTesseractOCRStep(args)
+    step.run(directory)
+    return list(read_pages(step.output_file(directory)))
+
+@pytest.mark.unit
+def test_worker_processes_return_the_pages_in_order(tmpdir):
+    preprocessed = tmpdir.mkdir("preprocessed")
+    for page in range(1, PAGES + 1):
+        Image.new('L', (60, 40), color=page * 10).save(str(preprocessed.join(f"page_{page:03d}.png")))
+
+    sequential = run_ocr(str(tmpdir), workers=1)
+    parallel = run_ocr(str(tmpdir), workers=2)
+
+    assert [page["page_number"] for page in parallel] == list(range(1, PAGES + 1))
+    assert [page["text_lines"][0] for page in parallel] == [f"gray level {page * 10}" for page in range(1, PAGES + 1)]
+    assert parallel == sequential
+
+@pytest.mark.unit
+def test_orientation_workers_share_the_cores_between_workers(monkeypatch):
+    monkeypatch.setattr(os, 'cpu_count', lambda: 8)
+    assert resolve_orientation_workers(None, 1) == MAX_ORIENTATION_WORKERS
+    assert resolve_orientation_workers(None, 4) == 2
+    assert resolve_orientation_workers(0, 16) == 1
+    assert resolve_orientation_workers(3, 4) == 3
+
+@pytest.mark.unit
+def test_orientation_threads_limit_the_native_threads_of_the_main_process(tmpdir, monkeypatch):
+    Image.new('L', (60, 40), color=10).save(str(tmpdir.mkdir("preprocessed").join("page_001.png")))
+    monkeypatch.delenv('OMP_THREAD_LIMIT', raising=False)
+    cv2_threads = []
+    monkeypatch.setattr(parallel.cv2, 'setNumThreads', cv2_threads.append)
+    args = Namespace(language='eng', path_to_tesseract='/tessdata', check_orientation='BASIC', psm=6, save_preprocessed=False,
+                     workers=1, orientation_workers=2, no_cache=True)
+
+    FakeTesseractOCRStep(args).run(str(tmpdir))
+
+    assert os.environ['OMP_THREAD_LIMIT'] == str(WORKER_OMP_THREAD_LIMIT)
+    assert cv2_threads == [WORKER_CV2_THREADS]
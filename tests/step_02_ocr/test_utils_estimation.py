@@ -0,0 +1,43 @@
+import os
+import pytest
+import pytesseract
+from PIL import Image, ImageDraw, ImageFont
+from step_02_ocr import utils_estimation
+from step_02_ocr.utils_estimation import estimate_orientation
+
+FONT_PATH = os.path.join(os.path.dirname(__file__), '..', 'data', 'arial.ttf')
+
+@pytest.mark.unit
+def test_estimate_orientation_detects_vertical_text():
+    image = create_text_page().rotate(273, expand=True, fillcolor=255)
+    # Without OSD up and down cannot be told apart, both candidates undo the rotation modulo 180
+    candidates = estimate_orientation(image, '')
+    assert [round(angle) % 180 for angle in candidates] == [87, 87]
+
+@pytest.mark.unit
+@pytest.mark.parametrize("error, calls", [
+    (pytesseract.TesseractNotFoundError(), 1),
+    (pytesseract.TesseractError(1, "Error opening data file osd.traineddata"), 1),
+    (pytesseract.TesseractError(1, "Too few characters. Skipping this page"), 3),
+])
+def test_osd_is_not_run_again_once_it_is_unavailable(monkeypatch, error, calls):
+    runs = []
+    def failing_osd(*args, **kwargs):
+        runs.append(1)
+        raise error
+    monkeypatch.setattr(utils_estimation, '_osd_unavailable', False)
+    monkeypatch.setattr(utils_estimation.pytesseract, 'image_to_osd', failing_osd)
+
+    image = create_text_page()
+    for _ in range(3):
+        assert [round(angle) for angle in estimate_orientation(image, '')] == [0, 180]
+    assert len(runs) == calls
+
+def create_text_page():
+    """Creates a page with several lines of text so the projection profile has structure."""
+    image = Image.new('L', (1200, 900), color=255)
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.truetype(FONT_PATH, 28)
+    for line in range(12):
+        draw.text((50, 40 + line * 60), f"The quick brown fox jumps over the lazy dog {line}", font=font, fill=0)
+    return image
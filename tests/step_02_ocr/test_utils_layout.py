@@ -0,0 +1,52 @@
+import os
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw, ImageFont
+from step_02_ocr.utils_layout import find_text_blocks, reading_order, rotate_boxes
+
+FONT_PATH = os.path.join(os.path.dirname(__file__), '..', 'data', 'arial.ttf')
+
+def create_layout_page():
+    """A heading over two columns, a photo with a caption, a rule and a page number."""
+    image = Image.new('L', (1240, 1754), color=255)
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.truetype(FONT_PATH, 28)
+    draw.text((100, 80), "Annual report of the quick brown fox", font=font, fill=0)
+    for line in range(12):
+        draw.text((100, 200 + line * 40), f"left column line {line} words", font=font, fill=0)
+        draw.text((680, 200 + line * 40), f"right column line {line} text", font=font, fill=0)
+    for line in range(5):
+        draw.text((680, 850 + line * 40), f"caption {line} near the photo", font=font, fill=0)
+    draw.line((100, 1250, 1100, 1250), fill=0, width=3)
+    draw.text((600, 1650), "12", font=font, fill=0)
+    page = np.asarray(image).copy()
+    page[800:1200, 100:600] = np.random.default_rng(0).integers(0, 255, (400, 500))
+    return page
+
+def contains(box, x, y):
+    left, top, width, height = box
+    return left <= x <= left + width and top <= y <= top + height
+
+@pytest.mark.unit
+def test_text_blocks_leave_out_pictures_and_rules():
+    blocks = find_text_blocks(create_layout_page())
+
+    assert len(blocks) == 5
+    ordered = [blocks[index] for index in reading_order(blocks)]
+    # Heading, left column, right column, caption, page number
+    for box, (x, y) in zip(ordered, [(110, 90), (110, 210), (690, 210), (690, 860), (610, 1660)]):
+        assert contains(box, x, y)
+    assert not any(contains(box, 350, 1000) or contains(box, 350, 1250) for box in blocks)
+
+@pytest.mark.unit
+def test_reading_order_follows_the_rotation_of_the_page():
+    page = create_layout_page()
+    upright = find_text_blocks(page)
+    blocks = find_text_blocks(np.rot90(page))
+
+    # The page is turned back by 270 degrees before it is read; the blocks swap width and height
+    ordered = [blocks[index] for index in reading_order(rotate_boxes(blocks, 270))]
+    expected = [upright[index] for index in reading_order(upright)]
+    assert len(ordered) == len(expected)
+    for box, expected_box in zip(ordered, expected):
+        assert abs(box[3] - expected_box[2]) <= 4 and abs(box[2] - expected_box[3]) <= 4
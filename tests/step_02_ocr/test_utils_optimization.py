@@ -0,0 +1,159 @@
+import os
+import pytest
+from PIL import Image
+import step_02_ocr.utils_optimization as utils_optimization
+from step_02_ocr.ocr_debug import PageDebug
+from step_02_ocr.utils_optimization import check_orientations
+
+BEST_ANGLE = 95
+
+def fake_tesseract_ocr(image, language, tessdata_dir_config, psm, ocr_debug_dir, angle, backend=None):
+    """Scores angles by their distance to BEST_ANGLE so the search has a well defined optimum."""
+    distance = min(abs(angle - BEST_ANGLE), 360 - abs(angle - BEST_ANGLE))
+    confidence = max(0, 100 - distance)
+    return f"text at {angle}", confidence
+
+@pytest.mark.unit
+@pytest.mark.parametrize("check_orientation", ['BASIC', 'FINE'])
+def test_concurrent_search_matches_serial(monkeypatch, check_orientation):
+    monkeypatch.setattr(utils_optimization, 'tesseract_ocr', fake_tesseract_ocr)
+    image = Image.new('L', (40, 20), color=255)
+
+    serial = check_orientations(image, 'eng', '', 6, check_orientation, None)
+    concurrent = check_orientations(image, 'eng', '', 6, check_orientation, None, max_workers=4)
+
+    assert concurrent == serial
+
+@pytest.mark.unit
+def test_proxy_search_ocrs_winner_at_full_resolution(monkeypatch):
+    probed_sizes = []
+    def recording_tesseract_ocr(image, language, tessdata_dir_config, psm, ocr_debug_dir, angle, backend=None):
+        probed_sizes.append((angle, image.size))
+        return fake_tesseract_ocr(image, language, tessdata_dir_config, psm, ocr_debug_dir, angle)
+    monkeypatch.setattr(utils_optimization, 'tesseract_ocr', recording_tesseract_ocr)
+    image = Image.new('L', (400, 200), color=255)
+
+    text, angle, confidence = check_orientations(image, 'eng', '', 6, 'BASIC', None, proxy_scale=0.5)
+
+    assert angle == 90
+    # Four proxy probes, then the winning angle once at full resolution (rotated by 90 degrees)
+    assert probed_sizes[-1] == (90, (200, 400))
+    assert all(size[0] <= 200 and size[1] <= 200 for _, size in probed_sizes[:-1])
+
+def peaked_tesseract_ocr(best_angle, probed_angles):
+    """A fake OCR whose confidence peaks at best_angle and that records the probed angles."""
+    def fake(image, language, tessdata_dir_config, psm, ocr_debug, angle, backend=None):
+        probed_angles.append(angle)
+        distance = min(abs(angle - best_angle), 360 - abs(angle - best_angle))
+        return "text", max(0, 100 - distance)
+    return fake
+
+@pytest.mark.unit
+@pytest.mark.parametrize("best_angle", [81, 84, 96, 97, 100, 270 + 7])
+@pytest.mark.parametrize("max_workers", [1, 4])
+def test_golden_fine_search_finds_the_peak(monkeypatch, best_angle, max_workers):
+    probed_angles = []
+    monkeypatch.setattr(utils_optimization, 'tesseract_ocr', peaked_tesseract_ocr(best_angle, probed_angles))
+    image = Image.new('L', (40, 20), color=255)
+
+    _, angle, confidence = check_orientations(image, 'eng', '', 6, 'FINE', None, max_workers, fine_search='golden', probe_budget=0)
+
+    assert (angle, confidence) == (best_angle, 100)
+    assert len(set(probed_angles)) <= 12
+
+@pytest.mark.unit
+def test_golden_fine_search_skips_confident_pages(monkeypatch):
+    probed_angles = []
+    monkeypatch.setattr(utils_optimization, 'tesseract_ocr', peaked_tesseract_ocr(92, probed_angles))
+    image = Image.new('L', (40, 20), color=255)
+
+    _, angle, _ = check_orientations(image, 'eng', '', 6, 'FINE', None, fine_search='golden')
+
+    assert angle == 90
+    assert sorted(probed_angles) == [0, 90, 180, 270]
+
+@pytest.mark.unit
+@pytest.mark.parametrize("fine_search", ['linear', 'golden'])
+def test_probe_budget_caps_the_fine_search(monkeypatch, fine_search):
+    probed_angles = []
+    monkeypatch.setattr(utils_optimization, 'tesseract_ocr', peaked_tesseract_ocr(100, probed_angles))
+    image = Image.new('L', (40, 20), color=255)
+
+    check_orientations(image, 'eng', '', 6, 'FINE', None, max_workers=4, fine_search=fine_search, probe_budget=6)
+
+    assert len(set(probed_angles)) <= 6
+
+@pytest.mark.unit
+def test_text_blocks_search_the_orientation_on_the_largest_block(monkeypatch):
+    from PIL import ImageDraw, ImageFont
+    probed = []
+    def block_tesseract_ocr(image, language, tessdata_dir_config, psm, ocr_debug, angle, backend=None):
+        # Blocks are told apart by their area, which the rotations keep
+        probed.append((angle, image.size[0] * image.size[1]))
+        return f"block {image.size[0] * image.size[1]}", 100 if angle == 0 else 50
+    monkeypatch.setattr(utils_optimization, 'tesseract_ocr', block_tesseract_ocr)
+    image = Image.new('L', (1240, 1754), color=255)
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.truetype(os.path.join(os.path.dirname(__file__), '..', 'data', 'arial.ttf'), 28)
+    draw.text((100, 80), "Heading of the page", font=font, fill=0)
+    for line in range(12):
+        draw.text((100, 300 + line * 40), f"line {line} of the paragraph below", font=font, fill=0)
+
+    text, angle, confidence = check_orientations(image, 'eng', '', 6, 'BASIC', None, max_workers=4, text_blocks=True)
+
+    heading_area, paragraph_area = sorted({area for _, area in probed})
+    assert sorted(angle for angle, area in probed if area == paragraph_area) == [0, 90, 180, 270]
+    assert [angle for angle, area in probed if area == heading_area] == [0]
+    assert (angle, confidence) == (0, 100)
+    assert text == f"block {heading_area}\nblock {paragraph_area}"
+
+@pytest.mark.unit
+@pytest.mark.parametrize("best_angle", [0, 2, -3])
+def test_default_fine_search_costs_no_more_probes_than_linear(monkeypatch, best_angle):
+    image = Image.new('L', (40, 20), color=255)
+    counts = {}
+    for fine_search in ('linear', None):
+        probed_angles = []
+        peaked = peaked_tesseract_ocr(best_angle, probed_angles)
+        # Below HIGH_CONFIDENCE_THRESHOLD, so golden does not skip the fine check
+        def unconfident_ocr(*args, **kwargs):
+            text, confidence = peaked(*args, **kwargs)
+            return text, confidence - 10
+        monkeypatch.setattr(utils_optimization, 'tesseract_ocr', unconfident_ocr)
+        options = {} if fine_search is None else {'fine_search': fine_search}
+        check_orientations(image, 'eng', '', 6, 'FINE', None, **options)
+        counts[fine_search] = len(probed_angles)
+
+    assert counts[None] == counts['linear'] <= 7
+
+@pytest.mark.unit
+def test_debug_keeps_the_word_data_but_not_the_probe_images(monkeypatch):
+    def debugged_tesseract_ocr(image, language, tessdata_dir_config, psm, ocr_debug, angle, backend=None):
+        ocr_debug.add(angle, data={"text": ["text"]}, confidence=0)
+        return fake_tesseract_ocr(image, language, tessdata_dir_config, psm, ocr_debug, angle)
+    monkeypatch.setattr(utils_optimization, 'tesseract_ocr', debugged_tesseract_ocr)
+    image = Image.new('L', (40, 20), color=255)
+    debug = PageDebug("scan.png")
+
+    check_orientations(image, 'eng', '', 6, 'FINE', debug)
+
+    assert len(debug.probes) > 4
+    assert all(set(artifacts) == {"data", "confidence"} for artifacts in debug.probes.values())
+    assert debug.sources == {'': image}
+
+@pytest.mark.unit
+def test_linear_fine_search_prefetches_the_other_direction_once(monkeypatch):
+    monkeypatch.setattr(utils_optimization, 'tesseract_ocr', peaked_tesseract_ocr(6, []))
+    prefetched = []
+    prefetch = utils_optimization.OrientationProber.prefetch
+    def recording_prefetch(self, *angles):
+        prefetched.append(angles)
+        return prefetch(self, *angles)
+    monkeypatch.setattr(utils_optimization.OrientationProber, 'prefetch', recording_prefetch)
+    image = Image.new('L', (40, 20), color=255)
+
+    _, angle, _ = check_orientations(image, 'eng', '', 6, 'FINE', None, max_workers=4, fine_search='linear')
+
+    # Two improving steps (2 and 5 degrees), the first paired with the opposite direction
+    assert angle == 5
+    assert [angles for angles in prefetched if len(angles) == 2] == [(2, -2)]
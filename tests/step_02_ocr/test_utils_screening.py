@@ -0,0 +1,45 @@
+import os
+import random
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw, ImageFont
+from step_02_ocr.utils_screening import DuplicateIndex, PageSignature, is_blank, screening_image
+
+FONT_PATH = os.path.join(os.path.dirname(__file__), '..', 'data', 'arial.ttf')
+WORDS = ["invoice", "amount", "delivery", "customer", "payment", "order", "total", "address", "date", "number"]
+
+def create_text_page(seed):
+    """A page of random words; pages with different seeds share the layout but not the text."""
+    rng = random.Random(seed)
+    image = Image.new('L', (1240, 1754), color=255)
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.truetype(FONT_PATH, 28)
+    for line in range(30):
+        draw.text((90, 100 + line * 50), " ".join(rng.choice(WORDS) for _ in range(7)), font=font, fill=0)
+    return image
+
+def rescan(image, angle, dx, dy, seed=0):
+    """The page scanned again: slightly rotated, shifted and noisy."""
+    moved = image.rotate(angle, translate=(dx, dy), fillcolor=255)
+    noise = np.random.default_rng(seed).integers(-20, 20, (image.height, image.width))
+    return np.clip(np.asarray(moved, dtype=int) + noise, 0, 255).astype(np.uint8)
+
+@pytest.mark.unit
+def test_blank_pages_are_recognized():
+    rng = np.random.default_rng(0)
+    blank = np.clip(235 + rng.integers(-15, 15, (1754, 1240)), 0, 255).astype(np.uint8)
+    blank[rng.random(blank.shape) < 0.0005] = 0  # dust
+    blank[:, :40] = 30  # scanner border
+    assert is_blank(screening_image(blank))
+    assert not is_blank(screening_image(create_text_page(1)))
+
+@pytest.mark.unit
+def test_rescanned_pages_are_found_as_duplicates():
+    index = DuplicateIndex()
+    for page_number in range(1, 4):
+        signature = PageSignature(screening_image(create_text_page(page_number)))
+        assert index.find(signature) is None
+        index.add(signature, page_number, f"page_{page_number}.png")
+
+    assert index.find(PageSignature(screening_image(rescan(create_text_page(2), -1.0, 25, -20)))) == (2, "page_2.png")
+    assert index.find(PageSignature(screening_image(rescan(create_text_page(4), 0.5, 10, 10)))) is None
@@ -0,0 +1,45 @@
+import os
+import pytest
+from argparse import Namespace
+
+pytest.importorskip("enchant", exc_type=ImportError)
+
+from page_io import page_writer, read_pages
+from step_03_hyphenation.hyphenation_step import HyphenationStep
+
+class RecordingDictionary:
+    def __init__(self):
+        self.words = set()
+
+    def check(self, word):
+        self.words.add(word)
+        return word in {"hyphen", "ation", "hyphenation", "docu", "ment", "document"}
+
+@pytest.mark.unit
+def test_resumed_pages_are_not_looked_up(tmp_path, monkeypatch):
+    (tmp_path / "ocr_result").mkdir()
+    with page_writer(str(tmp_path / "ocr_result" / "ocr_result.jsonl")) as writer:
+        writer.write({"page_number": 1, "source_file": "page_1.png", "text_lines": ["hyphen-", "ation"]})
+        writer.write({"page_number": 2, "source_file": "page_2.png", "text_lines": ["docu-", "ment"]})
+    dictionary = RecordingDictionary()
+    monkeypatch.setattr(HyphenationStep, 'load_dictionary', lambda self, language: dictionary)
+    args = Namespace(language_enchanted='en_US', input_dir=str(tmp_path), no_cache=True, interactive_mode=False,
+                     output_format='jsonl', resume=True)
+    step = HyphenationStep(args)
+    # An interrupted run stored the first page
+    suggestions_file, _, output_file = step.output_files(str(tmp_path))
+    os.makedirs(os.path.dirname(output_file))
+    with open(suggestions_file, "w") as f:
+        step.write_suggestion(f, 0, {"source_file": "page_1.png", "text_lines": ["hyphen-", "ation"]}, (0, 0, "hyphen-", "hyphenation"))
+    with page_writer(output_file) as writer:
+        writer.write({"page_number": 1, "source_file": "page_1.png", "text_lines": ["hyphen-ation", ""]})
+
+    step.run(str(tmp_path))
+
+    assert {"docu", "ment"} <= dictionary.words
+    assert not dictionary.words & {"hyphen", "ation", "hyphenation"}
+    assert [page["source_file"] for page in read_pages(output_file)] == ["page_1.png", "page_2.png"]
+    with open(suggestions_file) as f:
+        suggestions = f.read()
+    assert "Proposed Change 1:" in suggestions and "hyphen-  --->   hyphenation" in suggestions
+    assert "Proposed Change 2:" in suggestions and "docu-  --->   docu-ment" in suggestions
@@ -0,0 +1,50 @@
+import pytest
+from step_04_sanitize.hunspell import AffixFile, read_dic
+from step_04_sanitize.symspell import SymSpellIndex, read_wordlist
+
+# Excerpt of the en_US affix rules
+AFF = """SET UTF-8
+TRY esianrtolcdugmphbyfvkwzESIANRTOLCDUGMPHBYFVKWZ'
+
+PFX U Y 1
+PFX U   0     un         .
+
+SFX D Y 4
+SFX D   0     d          e
+SFX D   y     ied        [^aeiou]y
+SFX D   0     ed         [^ey]
+SFX D   0     ed         [aeiou]y
+
+SFX S Y 4
+SFX S   y     ies        [^aeiou]y
+SFX S   0     s          [aeiou]y
+SFX S   0     es         [sxzh]
+SFX S   0     s          [^sxzhy]
+"""
+
+DIC = """4
+claim/USD
+try/DS
+box/S
+the
+"""
+
+@pytest.fixture
+def en_us(tmpdir):
+    tmpdir.join("en_US.aff").write_text(AFF, encoding="utf-8")
+    dic = tmpdir.join("en_US.dic")
+    dic.write_text(DIC, encoding="utf-8")
+    return str(dic)
+
+@pytest.mark.unit
+def test_stems_are_expanded_by_their_affix_rules(en_us, tmpdir):
+    words = read_dic(en_us, AffixFile(str(tmpdir.join("en_US.aff"))))
+    assert set(words) == {"claim", "claimed", "claims", "unclaim", "unclaimed", "unclaims",
+                          "try", "tried", "tries", "box", "boxes", "the"}
+
+@pytest.mark.unit
+def test_inflected_words_are_suggested(en_us):
+    index = SymSpellIndex(read_wordlist(en_us))
+    assert index.lookup("clairned") == ["claimed"]
+    assert index.lookup("trled") == ["tried"]
+    assert index.lookup("unc1aimed") == ["unclaimed"]
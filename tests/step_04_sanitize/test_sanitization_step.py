@@ -0,0 +1,114 @@
+import os
+import pytest
+from argparse import Namespace
+from concurrent.futures import ThreadPoolExecutor
+
+pytest.importorskip("enchant", exc_type=ImportError)
+
+from page_io import page_writer, read_pages
+from step_04_sanitize import sanitization_step
+from step_04_sanitize.sanitization_step import SanitizationStep
+
+WORDS = {"the", "modern", "claim", "house"}
+
+class CountingDictionary:
+    def __init__(self, language=None):
+        self.calls = 0
+        self.words = set()
+
+    def check(self, word):
+        self.calls += 1
+        self.words.add(word)
+        return word.lower() in WORDS
+
+    def suggest(self, word):
+        self.calls += 1
+        self.words.add(word)
+        return ["house"]
+
+def in_process_pool(workers, initializer=None, initargs=()):
+    """The worker initializer and lookups run in this process, where enchant is patched."""
+    initializer(*initargs)
+    return ThreadPoolExecutor(workers)
+
+def write_ocr_result(directory, pages, output_format='json'):
+    (directory / "ocr_result").mkdir()
+    with page_writer(str(directory / "ocr_result" / f"ocr_result.{output_format}")) as writer:
+        for page_number, text_lines in enumerate(pages, start=1):
+            writer.write({"page_number": page_number, "source_file": f"page_{page_number}.png", "text_lines": text_lines})
+
+@pytest.mark.unit
+def test_prefetched_results_are_used_after_the_cache_memory_overflows(tmp_path, monkeypatch):
+    wordlist = tmp_path / "words.txt"
+    wordlist.write_text("the 100\nmodern 10\nclaim 5\nhouse 1\n")
+    write_ocr_result(tmp_path, [["the modern clairn"], ["the rnodern house"]])
+    serial = CountingDictionary()
+    monkeypatch.setattr(SanitizationStep, 'load_dictionary', lambda self, language: serial)
+    monkeypatch.setattr(sanitization_step.enchant, 'Dict', CountingDictionary)
+    monkeypatch.setattr(sanitization_step, 'create_process_pool', in_process_pool)
+    # Workers started by a fork server
+    monkeypatch.setattr(sanitization_step, 'pool_forks', lambda: False)
+    args = Namespace(language='eng', language_enchanted='en_US', whitelist_filter=None, input_dir=str(tmp_path), workers=2,
+                     suggestion_backend='symspell', wordlist=str(wordlist), no_cache=True, interactive_mode=False)
+
+    step = SanitizationStep(args)
+    step.dictionary.memory_entries = 1
+    step.run(str(tmp_path))
+
+    # Every word was looked up by the workers, with the index they read from a temporary file
+    assert serial.calls == 0
+    suggestions = (tmp_path / "sanitized" / "suggestions.txt").read_text()
+    assert "clairn  --->   ['claim']" in suggestions
+    assert "rnodern  --->   ['modern']" in suggestions
+
+@pytest.mark.unit
+def test_forked_workers_share_the_index_of_the_parent(tmp_path, monkeypatch):
+    wordlist = tmp_path / "words.txt"
+    wordlist.write_text("the 100\nmodern 10\nclaim 5\nhouse 1\n")
+    write_ocr_result(tmp_path, [["the modern clairn"]])
+    monkeypatch.setattr(SanitizationStep, 'load_dictionary', lambda self, language: CountingDictionary())
+    monkeypatch.setattr(sanitization_step.enchant, 'Dict', CountingDictionary)
+    monkeypatch.setattr(sanitization_step, 'create_process_pool', in_process_pool)
+    monkeypatch.setattr(sanitization_step, 'pool_forks', lambda: True)
+    def unpickled(path):
+        raise AssertionError("a forked worker read the index from disk")
+    monkeypatch.setattr(sanitization_step, 'read_index', unpickled)
+    args = Namespace(language='eng', language_enchanted='en_US', whitelist_filter=None, input_dir=str(tmp_path), workers=2,
+                     suggestion_backend='symspell', wordlist=str(wordlist), no_cache=True, interactive_mode=False)
+
+    step = SanitizationStep(args)
+    step.run(str(tmp_path))
+
+    assert "clairn  --->   ['claim']" in (tmp_path / "sanitized" / "suggestions.txt").read_text()
+    assert sanitization_step._shared_index is None
+
+@pytest.mark.unit
+def test_resumed_pages_are_not_looked_up(tmp_path, monkeypatch):
+    write_ocr_result(tmp_path, [["the modern clairn"], ["the rnodern house"]], 'jsonl')
+    dictionary = CountingDictionary()
+    monkeypatch.setattr(SanitizationStep, 'load_dictionary', lambda self, language: dictionary)
+    args = Namespace(language='eng', language_enchanted='en_US', whitelist_filter=None, input_dir=str(tmp_path), no_cache=True,
+                     interactive_mode=False, output_format='jsonl', resume=True)
+    step = SanitizationStep(args)
+    # An interrupted run made the suggestions of both pages and stored the first page
+    suggestions_file, whitelist_candidates_file, output_file = step.output_files(str(tmp_path))
+    os.makedirs(os.path.dirname(output_file))
+    with open(suggestions_file, "w") as f:
+        step.write_suggestion(f, 0, {"source_file": "page_1.png", "text_lines": ["the modern clairn"]}, (0, 0, "clairn", ["claim"]))
+        step.write_suggestion(f, 1, {"source_file": "page_2.png", "text_lines": ["the rnodern house"]}, (1, 0, "rnodern", ["house"]))
+    with open(whitelist_candidates_file, "w") as f:
+        f.write("clairn\nrnodern\n")
+    with page_writer(output_file) as writer:
+        writer.write({"page_number": 1, "source_file": "page_1.png", "text_lines": ["the modern claim"]})
+
+    step.run(str(tmp_path))
+
+    assert dictionary.words == {"the", "rnodern", "house"}
+    assert [page["text_lines"] for page in read_pages(output_file)] == [["the modern claim"], ["the house house"]]
+    with open(suggestions_file) as f:
+        suggestions = f.read()
+    assert suggestions.count("Proposed Change") == 2
+    assert "Proposed Change 1:" in suggestions and "clairn  --->   ['claim']" in suggestions
+    assert "Proposed Change 2:" in suggestions and suggestions.count("rnodern  --->   ['house']") == 1
+    with open(whitelist_candidates_file) as f:
+        assert sorted(f.read().split()) == ["clairn", "rnodern"]
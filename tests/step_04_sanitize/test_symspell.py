@@ -0,0 +1,45 @@
+# tests/step_04_sanitize/test_symspell.py
+
+import pytest
+from step_04_sanitize.symspell import SymSpellIndex, load_index, ocr_distance, read_wordlist
+
+WORDS = [("the", 100), ("then", 20), ("modern", 10), ("children", 8), ("claim", 5), ("ten", 5), ("word", 3)]
+
+@pytest.mark.unit
+def test_ocr_confusions_are_cheaper_than_other_edits():
+    assert ocr_distance("rnodern", "modern") == 0.5
+    assert ocr_distance("chi1dren", "children") == 0.5
+    assert ocr_distance("chixdren", "children") == 1
+    assert ocr_distance("wrod", "word") == 1
+    assert ocr_distance("abcdef", "uvwxyz", max_distance=1) > 1
+
+@pytest.mark.unit
+def test_lookup_returns_the_closest_words_in_the_case_of_the_query():
+    index = SymSpellIndex(WORDS)
+    assert index.lookup("rnodern") == ["modern"]
+    assert index.lookup("Clairn") == ["Claim"]
+    assert index.lookup("THE") == ["THE"]
+    assert index.lookup("tbe") == ["the"]
+    assert index.lookup("xyzzy") == []
+
+@pytest.mark.unit
+def test_read_wordlist_formats(tmpdir):
+    dic = tmpdir.join("de_DE.dic")
+    dic.write_text("3\nHaus/Sp\nhaben/DI\n# comment\nGrüße\n", encoding="utf-8")
+    assert read_wordlist(str(dic)) == [("Haus", 0), ("haben", 0), ("Grüße", 0)]
+    frequencies = tmpdir.join("frequencies.txt")
+    frequencies.write("the 100\nmodern 10\n")
+    assert read_wordlist(str(frequencies)) == [("the", 100), ("modern", 10)]
+
+@pytest.mark.unit
+def test_index_is_loaded_from_the_cache(tmpdir):
+    wordlist = tmpdir.join("words.txt")
+    wordlist.write("the 100\nmodern 10\n")
+    cache_dir = str(tmpdir.join("cache"))
+    built = load_index("en_US", {"DocuFlow"}, str(wordlist), cache_dir)
+    assert len(tmpdir.join("cache").listdir()) == 1
+    loaded = load_index("en_US", {"DocuFlow"}, str(wordlist), cache_dir)
+    assert loaded.words == built.words
+    assert loaded.lookup("DocuF1ow") == ["DocuFlow"]
+    load_index("en_US", {"DocuFlow", "OCR"}, str(wordlist), cache_dir)
+    assert len(tmpdir.join("cache").listdir()) == 2
@@ -0,0 +1,41 @@
+# tests/step_04_sanitize/test_whitelist.py
+
+import os
+import pytest
+from step_04_sanitize.whitelist import WhitelistIndex, load_whitelist_index
+
+@pytest.mark.unit
+def test_entry_kinds():
+    whitelist = WhitelistIndex(["DocuFlow", "casefold:Kaiser", "prefix:Bundes", r"re:[IVXLCDM]+", r"re:\w+-\w+"])
+    assert "DocuFlow" in whitelist
+    assert "docuflow" not in whitelist
+    assert "KAISER" in whitelist and "kaiser" in whitelist
+    assert "Bundestag" in whitelist and "Bundes" in whitelist
+    assert "bundestag" not in whitelist
+    assert "XIV" in whitelist
+    assert "XIVa" not in whitelist
+    assert "Nord-Süd" in whitelist
+    assert "Haus" not in whitelist
+    assert whitelist.words == {"DocuFlow", "kaiser"}
+
+@pytest.mark.unit
+def test_invalid_pattern_is_reported():
+    with pytest.raises(ValueError):
+        WhitelistIndex(["re:[unclosed"])
+
+@pytest.mark.unit
+def test_index_is_rebuilt_when_a_file_changes(tmpdir):
+    path = tmpdir.join("spelling-whitelist-deu.txt")
+    path.write("DocuFlow # the project\nprefix:Bundes\n")
+    cache_dir = str(tmpdir.join("cache"))
+    first = load_whitelist_index([str(path)], "deu|", cache_dir)
+    assert "Bundesrat" in first
+    assert load_whitelist_index([str(path)], "deu|", cache_dir).entries == first.entries
+
+    path.write("DocuFlow\nTesseract\n")
+    os.utime(str(path), ns=(0, 0))
+    changed = load_whitelist_index([str(path)], "deu|", cache_dir)
+    assert "Tesseract" in changed and "Bundesrat" not in changed
+
+    load_whitelist_index([str(path)], "deu|names", cache_dir)
+    assert len(tmpdir.join("cache").listdir()) == 2
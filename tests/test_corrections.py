@@ -0,0 +1,28 @@
+# tests/test_corrections.py
+
+import pytest
+from corrections import CorrectionIndex, first_proposal
+
+def pages():
+    return [{"text_lines": ["teh cat", "teh dog"]}, {"text_lines": ["teh end"]}]
+
+@pytest.mark.unit
+def test_correction_is_applied_where_it_was_suggested():
+    corrections = CorrectionIndex([(0, 1, "teh", "the")])
+    document = pages()
+    for page_index, page in enumerate(document):
+        corrections.apply(page_index, page)
+    assert [page["text_lines"] for page in document] == [["teh cat", "the dog"], ["teh end"]]
+
+@pytest.mark.unit
+def test_global_corrections_fall_back_to_the_word():
+    corrections = CorrectionIndex([(0, 1, "teh", ["the", "ten"]), (1, 0, "teh", ["tea"])], replacement=first_proposal, apply_globally=True)
+    document = pages()
+    for page_index, page in enumerate(document):
+        corrections.apply(page_index, page)
+    assert [page["text_lines"] for page in document] == [["the cat", "the dog"], ["tea end"]]
+
+@pytest.mark.unit
+def test_empty_proposal_keeps_the_word():
+    corrections = CorrectionIndex([(0, 0, "teh", []), (0, 0, "teh", ["the"])], replacement=first_proposal)
+    assert corrections.correct(0, 0, "teh") == "teh"
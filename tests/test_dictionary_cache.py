@@ -0,0 +1,102 @@
+# tests/test_dictionary_cache.py
+
+import pytest
+from dictionary_cache import CachedDictionary, dictionary_version
+
+class CountingDictionary:
+    def __init__(self):
+        self.calls = 0
+
+    def check(self, word):
+        self.calls += 1
+        return word == "the"
+
+    def suggest(self, word):
+        self.calls += 1
+        return ["the", "ten"]
+
+@pytest.mark.unit
+def test_repeated_words_are_looked_up_once():
+    dictionary = CountingDictionary()
+    cached = CachedDictionary(dictionary, "en_US")
+    for _ in range(3):
+        assert cached.check("teh") is False
+        assert cached.suggest("teh") == ["the", "ten"]
+    assert dictionary.calls == 2
+
+@pytest.mark.unit
+def test_results_survive_between_runs(tmpdir):
+    first = CachedDictionary(CountingDictionary(), "en_US", "v1", str(tmpdir))
+    first.check("the")
+    first.suggest("teh")
+    first.flush()
+
+    dictionary = CountingDictionary()
+    second = CachedDictionary(dictionary, "en_US", "v1", str(tmpdir))
+    assert second.check("the") is True
+    assert second.suggest("teh") == ["the", "ten"]
+    assert dictionary.calls == 0
+
+    other_whitelist = CachedDictionary(dictionary, "en_US", "v2", str(tmpdir))
+    other_whitelist.check("the")
+    assert dictionary.calls == 1
+
+@pytest.mark.unit
+def test_results_of_another_dictionary_version_are_dropped(tmpdir):
+    first = CachedDictionary(CountingDictionary(), "en_US", cache_dir=str(tmpdir), dictionary_version="d1")
+    first.check("the")
+    first.flush()
+
+    dictionary = CountingDictionary()
+    updated = CachedDictionary(dictionary, "en_US", cache_dir=str(tmpdir), dictionary_version="d2")
+    assert updated.connection.execute('SELECT COUNT(*) FROM dictionary_results').fetchone() == (0,)
+    updated.check("the")
+    assert dictionary.calls == 1
+
+@pytest.mark.unit
+def test_dictionary_version_follows_the_personal_word_list(tmpdir, monkeypatch):
+    class Tagged:
+        tag = "en_US"
+    monkeypatch.setenv('ENCHANT_CONFIG_DIR', str(tmpdir))
+    before = dictionary_version(Tagged())
+    tmpdir.join("en_US.dic").write("DocuFlow\n")
+    assert dictionary_version(Tagged()) != before
+
+@pytest.mark.unit
+def test_memory_is_bounded():
+    cached = CachedDictionary(CountingDictionary(), "en_US", memory_entries=2)
+    for word in ("a", "b", "c"):
+        cached.check(word)
+    assert len(cached.memory) == 2
+
+@pytest.mark.unit
+def test_added_results_are_served_without_lookups(tmpdir):
+    dictionary = CountingDictionary()
+    cached = CachedDictionary(dictionary, "en_US", "v1", str(tmpdir))
+    assert not cached.is_cached('check', "teh")
+    cached.add('check', "teh", False)
+    cached.add('suggest', "teh", ["the"])
+    assert cached.is_cached('check', "teh")
+    assert (cached.check("teh"), cached.suggest("teh")) == (False, ["the"])
+    assert dictionary.calls == 0
+
+@pytest.mark.unit
+def test_hyphenation_and_sanitization_share_enchant_results(tmpdir, monkeypatch):
+    pytest.importorskip("enchant", exc_type=ImportError)
+    from argparse import Namespace
+    from step_03_hyphenation.hyphenation_step import HyphenationStep
+    from step_04_sanitize.sanitization_step import SanitizationStep
+    dictionary = CountingDictionary()
+    monkeypatch.setattr(HyphenationStep, 'load_dictionary', lambda self, language: dictionary)
+    monkeypatch.setattr(SanitizationStep, 'load_dictionary', lambda self, language: dictionary)
+    args = Namespace(language='eng', language_enchanted='en_US', whitelist_filter=None, input_dir=str(tmpdir), cache_dir=str(tmpdir.join('cache')))
+
+    hyphenation = HyphenationStep(args)
+    hyphenation.dictionary.check("teh")
+    hyphenation.dictionary.suggest("teh")
+    hyphenation.dictionary.flush()
+
+    sanitization = SanitizationStep(args)
+    assert sanitization.dictionary.check("teh") is False
+    assert sanitization.dictionary.suggest("teh") == ["the", "ten"]
+    assert dictionary.calls == 2
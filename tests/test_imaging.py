@@ -0,0 +1,29 @@
+# tests/test_imaging.py
+
+import os
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw, ImageFont
+from imaging import estimate_skew, rotate_array
+
+FONT_PATH = os.path.join(os.path.dirname(__file__), 'data', 'arial.ttf')
+
+def create_text_page():
+    """Creates a page with several lines of text so the projection profile has structure."""
+    image = Image.new('L', (1200, 900), color=255)
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.truetype(FONT_PATH, 28)
+    for line in range(12):
+        draw.text((50, 40 + line * 60), f"The quick brown fox jumps over the lazy dog {line}", font=font, fill=0)
+    return image
+
+@pytest.mark.unit
+@pytest.mark.parametrize("rotation_angle", [-7, 0, 4])
+def test_estimate_skew(rotation_angle):
+    image = create_text_page().rotate(rotation_angle, expand=True, fillcolor=255)
+    assert abs(estimate_skew(image) + rotation_angle) <= 0.5
+
+@pytest.mark.unit
+def test_rotate_array_expands_the_canvas():
+    image = np.zeros((100, 200), np.uint8)
+    assert rotate_array(image, 90).shape == (200, 100)
@@ -0,0 +1,52 @@
+# tests/test_manifest.py
+
+import os
+import pytest
+from manifest import StepManifest
+
+def write(path, content):
+    with open(path, 'w') as f:
+        f.write(content)
+
+@pytest.mark.unit
+def test_step_is_up_to_date_until_something_changes(tmpdir):
+    data_dir = str(tmpdir)
+    source = os.path.join(data_dir, 'page.png')
+    result = os.path.join(data_dir, 'result.json')
+    write(source, 'image')
+    write(result, 'text')
+
+    StepManifest(data_dir, 'DummyStep').record([source], {"psm": 6}, [result])
+
+    manifest = StepManifest(data_dir, 'DummyStep')
+    assert manifest.is_up_to_date([source], {"psm": 6}, [result])
+    assert not manifest.is_up_to_date([source], {"psm": 3}, [result])
+
+    write(source, 'changed image')
+    assert not manifest.is_up_to_date([source], {"psm": 6}, [result])
+
+@pytest.mark.unit
+def test_missing_output_forces_a_rerun(tmpdir):
+    data_dir = str(tmpdir)
+    result = os.path.join(data_dir, 'result.json')
+    write(result, 'text')
+    manifest = StepManifest(data_dir, 'DummyStep')
+    manifest.record([], {}, [result])
+
+    os.remove(result)
+    assert not manifest.is_up_to_date([], {}, [result])
+
+@pytest.mark.unit
+def test_pages_are_tracked_individually(tmpdir):
+    data_dir = str(tmpdir)
+    first, second = os.path.join(data_dir, 'a.png'), os.path.join(data_dir, 'b.png')
+    write(first, 'a')
+    write(second, 'b')
+
+    manifest = StepManifest(data_dir, 'DummyStep.pages')
+    manifest.record_page('a.png', [first], {}, [])
+    manifest.save()
+
+    manifest = StepManifest(data_dir, 'DummyStep.pages')
+    assert manifest.page_is_up_to_date('a.png', [first], {}, [])
+    assert not manifest.page_is_up_to_date('b.png', [second], {}, [])
@@ -0,0 +1,53 @@
+# tests/test_metrics.py
+
+import json
+import pytest
+from metrics import Metrics
+
+@pytest.mark.unit
+def test_metrics_are_written_as_json_and_prometheus_text(tmpdir):
+    metrics = Metrics()
+    metrics.record_step('OCRStep', 1.5)
+    metrics.count('suggestions_total', 3, step='SanitizationStep')
+    metrics.count('suggestions_total', 2, step='SanitizationStep')
+    for seconds in (0.4, 0.8, 12):
+        metrics.observe('ocr_page_seconds', seconds)
+    metrics.record_page(step='OCRStep', source_file='page.png', final_angle=90, confidence=91.5)
+
+    directory = metrics.write(str(tmpdir))
+
+    with open(tmpdir.join('metrics.json'), encoding='utf-8') as f:
+        summary = json.load(f)
+    assert summary["steps"] == {"OCRStep": {"seconds": 1.5}}
+    assert summary["counters"] == [{"name": "suggestions_total", "labels": {"step": "SanitizationStep"}, "value": 5}]
+    assert summary["observations"]["ocr_page_seconds"][0]["count"] == 3
+    assert summary["pages"] == [{"step": "OCRStep", "source_file": "page.png", "final_angle": 90, "confidence": 91.5}]
+
+    lines = tmpdir.join('metrics.prom').read_text('utf-8').splitlines()
+    assert 'docuflow_step_seconds{step="OCRStep"} 1.5' in lines
+    assert '# TYPE docuflow_suggestions_total counter' in lines
+    assert 'docuflow_suggestions_total{step="SanitizationStep"} 5' in lines
+    assert 'docuflow_ocr_page_seconds_bucket{le="1"} 2' in lines
+    assert 'docuflow_ocr_page_seconds_bucket{le="+Inf"} 3' in lines
+    assert 'docuflow_ocr_page_seconds_count 3' in lines
+    assert not tmpdir.join('trace.json').exists()
+    assert directory == str(tmpdir)
+
+@pytest.mark.unit
+def test_spans_are_only_kept_with_tracing(tmpdir):
+    untraced = Metrics()
+    with untraced.span('OCRStep.page'):
+        pass
+    assert untraced.spans == []
+
+    metrics = Metrics(tracing=True)
+    with metrics.step('OCRStep'):
+        metrics.add_span('OCRStep.page', metrics.started, 0.25, pid=123, thread='MainThread', source_file='page.png')
+    metrics.write(str(tmpdir))
+
+    with open(tmpdir.join('trace.json'), encoding='utf-8') as f:
+        events = json.load(f)["traceEvents"]
+    assert [event["name"] for event in events] == ['OCRStep.page', 'OCRStep']
+    assert events[0]["pid"] == 123 and events[0]["dur"] == 250000
+    assert events[0]["args"] == {"source_file": "page.png"}
+    assert "OCRStep" in metrics.steps
@@ -0,0 +1,73 @@
+# tests/test_page_io.py
+
+import json
+import pytest
+from page_io import BackgroundWriter, JsonArrayWriter, JsonLinesWriter, completed_pages, read_pages
+
+@pytest.mark.unit
+@pytest.mark.parametrize("pages", [[], [{"page_number": 1, "text_lines": ["Grüße"]}, {"page_number": 2, "text_lines": []}]])
+def test_json_array_writer_produces_a_json_array(tmpdir, pages):
+    path = str(tmpdir.join("output.json"))
+    with JsonArrayWriter(path, ensure_ascii=False) as writer:
+        for page in pages:
+            writer.write(page)
+
+    with open(path, 'r', encoding='utf-8') as f:
+        assert json.load(f) == pages
+
+@pytest.mark.unit
+def test_json_array_writer_leaves_a_failed_file_incomplete(tmpdir):
+    path = str(tmpdir.join("output.json"))
+    with pytest.raises(RuntimeError):
+        with JsonArrayWriter(path) as writer:
+            writer.write({"page_number": 1})
+            raise RuntimeError("page 2 failed")
+
+    with open(path, 'r', encoding='utf-8') as f:
+        with pytest.raises(ValueError):
+            json.load(f)
+
+@pytest.mark.unit
+def test_json_lines_are_read_back_page_by_page(tmpdir):
+    path = str(tmpdir.join("output.jsonl"))
+    pages = [{"source_file": f"page{i}.png", "text_lines": ["Grüße"]} for i in range(3)]
+    with JsonLinesWriter(path, ensure_ascii=False) as writer:
+        for page in pages:
+            writer.write(page)
+    assert list(read_pages(path)) == pages
+
+@pytest.mark.unit
+def test_interrupted_json_lines_file_is_continued(tmpdir):
+    path = str(tmpdir.join("output.jsonl"))
+    with JsonLinesWriter(path) as writer:
+        writer.write({"source_file": "page1.png"})
+        writer.write({"source_file": "page2.png"})
+    with open(path, 'a') as f:
+        f.write('{"source_file": "pa')  # cut off by a crash
+
+    assert [page["source_file"] for page in read_pages(path)] == ["page1.png", "page2.png"]
+    assert completed_pages(path) == {"page1.png", "page2.png"}
+    with JsonLinesWriter(path, append=True) as writer:
+        writer.write({"source_file": "page3.png"})
+    assert [page["source_file"] for page in read_pages(path)] == ["page1.png", "page2.png", "page3.png"]
+    assert completed_pages(str(tmpdir.join("missing.jsonl"))) == set()
+
+@pytest.mark.unit
+def test_background_writer_finishes_writes_on_close(tmpdir):
+    paths = [str(tmpdir.join(f"page{i}.txt")) for i in range(10)]
+    with BackgroundWriter(maxsize=2) as writer:
+        for i, path in enumerate(paths):
+            writer.submit(write_text, path, str(i))
+
+    assert [open(path).read() for path in paths] == [str(i) for i in range(10)]
+
+@pytest.mark.unit
+def test_background_writer_reports_failed_writes(tmpdir):
+    writer = BackgroundWriter()
+    writer.submit(write_text, str(tmpdir.join("missing", "page.txt")), "text")
+    with pytest.raises(RuntimeError):
+        writer.close()
+
+def write_text(path, text):
+    with open(path, 'w') as f:
+        f.write(text)
@@ -0,0 +1,42 @@
+# tests/test_profiling.py
+
+import os
+import time
+import pstats
+import pytest
+import tracemalloc
+from profiling import disable_profiling, enable_profiling, profile_step, worker_profile
+
+def busy():
+    deadline = time.perf_counter() + 0.05
+    blocks = []
+    while time.perf_counter() < deadline:
+        blocks.append(bytearray(1024))
+    return blocks
+
+@pytest.mark.unit
+def test_profile_step_writes_the_profiles_of_the_step(tmpdir):
+    directory = str(tmpdir.join("profile"))
+    enable_profiling(directory)
+    try:
+        with profile_step('OCRStep'):
+            assert worker_profile() == (directory, 'OCRStep')
+            busy()
+    finally:
+        disable_profiling()
+
+    assert sorted(os.listdir(directory)) == ['OCRStep.allocations.txt', 'OCRStep.collapsed', 'OCRStep.pstats', 'OCRStep.tracemalloc', 'OCRStep.txt']
+    functions = {function for _, _, function in pstats.Stats(os.path.join(directory, 'OCRStep.pstats')).stats}
+    assert 'busy' in functions
+    with open(os.path.join(directory, 'OCRStep.collapsed'), encoding='utf-8') as f:
+        stacks = [line.rsplit(' ', 1) for line in f]
+    assert stacks and all(count.strip().isdigit() for _, count in stacks)
+    assert any(stack.startswith('MainThread;') and 'busy (test_profiling.py' in stack for stack, _ in stacks)
+    assert tracemalloc.Snapshot.load(os.path.join(directory, 'OCRStep.tracemalloc')).traces
+    assert not tracemalloc.is_tracing()
+
+@pytest.mark.unit
+def test_profile_step_does_nothing_without_profile(tmpdir):
+    with profile_step('OCRStep'):
+        assert worker_profile() is None
+    assert not tracemalloc.is_tracing()
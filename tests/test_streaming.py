@@ -0,0 +1,112 @@
+# tests/test_streaming.py
+
+import os
+import json
+import cProfile
+import threading
+import pytest
+
+pytest.importorskip("enchant", exc_type=ImportError)
+
+import profiling
+from page_io import page_writer
+from profiling import disable_profiling, enable_profiling
+from streaming import StageThread, StreamAborted
+
+def numbers(_):
+    yield from range(10)
+
+def doubled(pages):
+    for page in pages:
+        yield page * 2
+
+def failing(pages):
+    for page in pages:
+        if page == 6:
+            raise ValueError("bad page")
+        yield page
+
+@pytest.mark.unit
+def test_stages_keep_page_order():
+    stop_event = threading.Event()
+    source = StageThread('source', numbers, None, stop_event, maxsize=2)
+    double = StageThread('double', doubled, source, stop_event, maxsize=2)
+    source.start()
+    double.start()
+    assert list(double) == [2 * n for n in range(10)]
+
+@pytest.mark.unit
+def test_failing_stage_stops_the_stream():
+    stop_event = threading.Event()
+    source = StageThread('source', numbers, None, stop_event, maxsize=2)
+    fail = StageThread('fail', failing, source, stop_event, maxsize=2)
+    source.start()
+    fail.start()
+    with pytest.raises(StreamAborted):
+        list(fail)
+    fail.join()
+    assert isinstance(fail.error, ValueError)
+    assert stop_event.is_set()
+
+@pytest.mark.unit
+def test_writer_after_a_failed_stage_does_not_finish_its_file(tmpdir):
+    path = str(tmpdir.join("output.json"))
+
+    def writing(pages):
+        with page_writer(path) as writer:
+            for page in pages:
+                writer.write({"page_number": page})
+                yield page
+
+    stop_event = threading.Event()
+    source = StageThread('source', numbers, None, stop_event, maxsize=2)
+    fail = StageThread('fail', failing, source, stop_event, maxsize=2)
+    write = StageThread('write', writing, fail, stop_event, maxsize=2)
+    for stage in (source, fail, write):
+        stage.start()
+    with pytest.raises(StreamAborted):
+        list(write)
+    write.join()
+
+    assert isinstance(fail.error, ValueError)
+    assert write.error is None
+    with open(path, 'r', encoding='utf-8') as f:
+        with pytest.raises(ValueError):
+            json.load(f)
+
+class OneActiveProfile(cProfile.Profile):
+    """Like cProfile on Python 3.12+, where only one profiler can be active in a process."""
+    active = []
+
+    def enable(self):
+        if self.active:
+            raise ValueError("Another profiling tool is already active")
+        self.active.append(self)
+        super().enable()
+
+    def disable(self):
+        super().disable()
+        if self in self.active:
+            self.active.remove(self)
+
+@pytest.mark.unit
+def test_streaming_stages_are_profiled_concurrently(tmpdir, monkeypatch):
+    monkeypatch.setattr(profiling.cProfile, 'Profile', OneActiveProfile)
+    directory = str(tmpdir.join("profile"))
+    enable_profiling(directory)
+    try:
+        stop_event = threading.Event()
+        source = StageThread('source', numbers, None, stop_event, maxsize=2)
+        double = StageThread('double', doubled, source, stop_event, maxsize=2)
+        source.start()
+        double.start()
+        assert list(double) == [2 * n for n in range(10)]
+        double.join()
+    finally:
+        disable_profiling()
+
+    assert source.error is None and double.error is None
+    files = os.listdir(directory)
+    assert {'source.collapsed', 'double.collapsed'} <= set(files)
+    # A stage that found the cProfile of the other one active only has its stack samples
+    assert sum(name.endswith('.pstats') for name in files) >= 1
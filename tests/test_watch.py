@@ -0,0 +1,73 @@
+# tests/test_watch.py
+
+import os
+import json
+import time
+import threading
+import pytest
+from argparse import Namespace
+import watch
+from watch import DOCUMENT_RECORD, run_watch
+
+class RecordingStep:
+    """Counts how often it is created and lists the input pages of every run."""
+    instances = 0
+
+    def __init__(self, args):
+        RecordingStep.instances += 1
+
+    def run(self, input_data):
+        with open(os.path.join(input_data, 'result.txt'), 'w') as f:
+            f.write(','.join(sorted(f for f in os.listdir(input_data) if f.endswith('.png'))))
+
+def wait_for(path, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not os.path.exists(path):
+        assert time.monotonic() < deadline, f"{path} was not written"
+        time.sleep(0.02)
+
+def start_watch(directory, stop_event):
+    args = Namespace(no_cache=True, input_dir=directory)
+    thread = threading.Thread(target=run_watch, args=(args, directory, [('RecordingStep', RecordingStep)], stop_event, 0.05))
+    thread.start()
+    return thread
+
+@pytest.mark.unit
+def test_watch_processes_each_new_document_with_warm_steps(tmpdir, monkeypatch):
+    monkeypatch.setattr(watch, 'inotify_simple', None)
+    monkeypatch.setattr(RecordingStep, 'instances', 0)
+    directory = str(tmpdir)
+    stop_event = threading.Event()
+    thread = start_watch(directory, stop_event)
+    try:
+        for filename in ('a.png', 'b.png'):
+            tmpdir.join(filename).write_binary(b'not decoded by this step')
+            wait_for(os.path.join(directory, 'documents', filename, DOCUMENT_RECORD))
+    finally:
+        stop_event.set()
+        thread.join()
+
+    assert RecordingStep.instances == 1
+    for filename in ('a.png', 'b.png'):
+        document = os.path.join(directory, 'documents', filename)
+        assert tmpdir.join('documents', filename, 'result.txt').read() == filename
+        with open(os.path.join(document, DOCUMENT_RECORD), encoding='utf-8') as f:
+            record = json.load(f)
+        assert (record["status"], record["pages"]) == ("done", 1)
+        with open(os.path.join(document, 'metrics', 'metrics.json'), encoding='utf-8') as f:
+            assert "RecordingStep" in json.load(f)["steps"]
+
+    # After a restart only changed documents are processed again
+    for filename in ('a.png', 'b.png'):
+        os.remove(os.path.join(directory, 'documents', filename, 'result.txt'))
+    tmpdir.join('b.png').write_binary(b'changed')
+    stop_event = threading.Event()
+    thread = start_watch(directory, stop_event)
+    try:
+        wait_for(os.path.join(directory, 'documents', 'b.png', 'result.txt'))
+        time.sleep(0.2)
+    finally:
+        stop_event.set()
+        thread.join()
+    assert not tmpdir.join('documents', 'a.png', 'result.txt').exists()
+    assert tmpdir.join('documents', 'b.png', 'result.txt').read() == 'b.png'